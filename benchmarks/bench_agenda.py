@@ -0,0 +1,90 @@
+"""
+Расписание врача на день: выборка по индексу (doctor_id, start_ts), кэш /agenda и темп рассылки.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_agenda --doctors 200 --days 90 --rate 25
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import Bot
+
+from benchmarks.bench_schedule_storage import build_db
+from benchmarks.fake_bot import FakeSession
+from db import db_utils
+from handlers import agenda
+from services.sender import RateLimitedSender
+
+
+def book_all(user_id=1, pet_id=1, service_id=1):
+    """Записи на все занятые слоты build_db — как будто их сделали пользователи."""
+    with db_utils.connect() as conn:
+        conn.execute("""
+            INSERT INTO appointments (user_id, pet_id, doctor_id, service_id, schedule_id, start_ts)
+            SELECT ?, ?, doctor_id, ?, id, start_ts FROM schedule WHERE is_booked = 1
+        """, (user_id, pet_id, service_id))
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+
+
+def agenda_ms(doctor_ids, day):
+    start = time.perf_counter()
+    for doctor_id in doctor_ids:
+        db_utils.get_doctor_agenda(doctor_id, day)
+    return (time.perf_counter() - start) / len(doctor_ids) * 1000
+
+
+async def digest(doctors, rate, latency):
+    session = FakeSession(latency=latency)
+    sender = RateLimitedSender(rate=rate)
+    start = time.perf_counter()
+    delivered = await sender.send_many(Bot("42:BENCH", session=session), [(n, "agenda") for n in range(doctors)])
+    return delivered, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--fill", type=float, default=0.7)
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    doctor_ids, _ = build_db(tmp / "bench.db", args.doctors, args.days, args.fill)
+    appointments = book_all()
+    day = db_utils.clinic_today()
+    print(f"врачей: {len(doctor_ids)}, записей: {appointments}")
+
+    indexed = agenda_ms(doctor_ids, day)
+    with db_utils.connect() as conn:
+        conn.execute("DROP INDEX idx_appointments_doctor_start")
+    full_scan = agenda_ms(doctor_ids, day)
+    print(f"расписание врача на день: по индексу {indexed:.3f} мс, без индекса {full_scan:.3f} мс, "
+          f"x{full_scan / indexed:.0f}")
+
+    doctors = db_utils.get_doctors()
+    start = time.perf_counter()
+    for doctor in doctors:
+        agenda.agenda_text(db_utils.MAIN_CLINIC, doctor)
+    render = (time.perf_counter() - start) / len(doctors) * 1000
+    start = time.perf_counter()
+    for doctor in doctors:
+        agenda.agenda_text(db_utils.MAIN_CLINIC, doctor)
+    cached = (time.perf_counter() - start) / len(doctors) * 1000
+    print(f"/agenda: отрисовка {render:.3f} мс, из кэша {cached:.4f} мс; {agenda.agenda_screens.stats}")
+
+    delivered, elapsed = asyncio.run(digest(len(doctor_ids), args.rate, args.latency))
+    print(f"рассылка: {delivered} сообщений за {elapsed:.1f} с = {delivered / elapsed:.1f}/с при лимите {args.rate}/с "
+          f"(последовательно с задержкой API {args.latency * 1000:.0f} мс: {delivered * args.latency:.1f} с)")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Постраничный календарь: свободные даты только для видимой страницы против всего горизонта,
+и ответ на ▶ из кэша после фоновой подгрузки.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_calendar --doctors 50 --horizon 180
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from benchmarks.bench_schedule_storage import build_db
+from db import db_utils
+from handlers.calendar import PagedCalendar
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+async def browse(calendar, doctor_ids, pages, think):
+    """Пользователь открывает календарь и листает ▶, на каждой странице думает `think` секунд."""
+    today = db_utils.clinic_today()
+    waits = []
+    for doctor_id in doctor_ids:
+        start = calendar.page_start(today)
+        for _ in range(pages):
+            began = time.perf_counter()
+            await calendar.get(doctor_id, start)
+            waits.append(time.perf_counter() - began)
+            await asyncio.sleep(think)
+            start = calendar.next_page(start)
+    return sum(waits) / len(waits) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--horizon", type=int, default=180)
+    parser.add_argument("--fill", type=float, default=0.7)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--think", type=float, default=0.02)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    doctor_ids, booked = build_db(tmp / "bench.db", args.doctors, args.horizon, args.fill)
+    today = db_utils.clinic_today()
+    print(f"врачей: {len(doctor_ids)}, занятых слотов: {booked}, горизонт {args.horizon} дн.")
+
+    horizon = timed(lambda: db_utils.get_available_dates_for_doctor(
+        random.choice(doctor_ids), limit_days=args.horizon, limit_dates=args.horizon), args.runs)
+    for mode in ("week", "month"):
+        calendar = PagedCalendar(mode=mode, horizon_days=args.horizon)
+        start = calendar.page_start(today)
+        end = calendar.page_end(start)
+        page = timed(lambda: db_utils.get_available_dates_in_range(random.choice(doctor_ids), today, end), args.runs)
+        render = timed(lambda: calendar.render(start, today, {(today + timedelta(days=1)).isoformat()}), args.runs)
+        print(f"{mode:5}: весь горизонт {horizon:6.2f} мс, страница {page:6.2f} мс, x{horizon / page:.1f}; "
+              f"отрисовка {render:.3f} мс")
+
+        pages = max(1, args.horizon // (7 if mode == "week" else 31))
+        cold = asyncio.run(browse(PagedCalendar(mode=mode, horizon_days=args.horizon), doctor_ids[:10], pages, 0))
+        calendar = PagedCalendar(mode=mode, horizon_days=args.horizon)
+        warm = asyncio.run(browse(calendar, doctor_ids[:10], pages, args.think))
+        print(f"       листание ▶: без паузы {cold:.2f} мс, с паузой на чтение (подгрузка успевает) {warm:.2f} мс; "
+              f"{calendar.stats}")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
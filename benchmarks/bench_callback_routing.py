@@ -0,0 +1,72 @@
+"""
+Накладные расходы диспетчеризации callback_query: цепочка фильтров роутера
+против индекса по префиксу (handlers.callbacks.CallbackRoutes).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_callback_routing --updates 2000
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Update
+
+from handlers.callbacks import CallbackRoutes
+
+
+def callback_update(update_id, data):
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+            "chat_instance": "bench",
+            "data": data,
+        },
+    })
+
+
+async def handler(callback):
+    return True
+
+
+def build(handlers_count, indexed):
+    dp = Dispatcher()
+    router = Router()
+    routes = CallbackRoutes()
+    for i in range(handlers_count):
+        if indexed:
+            routes.register(router, f"h{i}")(handler)
+        else:
+            router.callback_query(F.data == f"h{i}")(handler)
+    dp.include_router(router)
+    if indexed:
+        dp.callback_query.outer_middleware(routes)
+    return dp
+
+
+async def measure(dp, bot, data, updates):
+    start = time.perf_counter()
+    for i in range(updates):
+        await dp.feed_update(bot, callback_update(i, data))
+    return (time.perf_counter() - start) / updates * 1_000_000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    args = parser.parse_args()
+
+    bot = Bot("42:BENCH")
+    print(f"{'обработчиков':>12} {'фильтры, мкс':>14} {'индекс, мкс':>12}")
+    for count in (10, 50, 200, 1000):
+        last = f"h{count - 1}"  # худший случай для цепочки фильтров
+        chain = await measure(build(count, indexed=False), bot, last, args.updates)
+        indexed = await measure(build(count, indexed=True), bot, last, args.updates)
+        print(f"{count:>12} {chain:>14.1f} {indexed:>12.1f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
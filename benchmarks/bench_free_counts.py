@@ -0,0 +1,72 @@
+"""
+Свободные даты врача: подробный расчёт по шаблону и занятости против счётчиков free_slot_counts,
+плюс цена их пересчёта и сверки.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_free_counts --doctors 200 --horizon 90
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from benchmarks.bench_schedule_storage import build_db
+from db import db_utils
+
+
+def detailed_dates(doctor_id, start_day, end_day):
+    """Прежний путь: шаблон, исключения и занятость всех дней окна."""
+    with db_utils.read_connect() as conn:
+        return list(db_utils._free_slots_in_range(conn.cursor(), doctor_id, start_day, end_day))
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--horizon", type=int, default=90)
+    parser.add_argument("--fill", type=float, default=0.9)
+    parser.add_argument("--runs", type=int, default=300)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    doctor_ids, booked = build_db(tmp / "bench.db", args.doctors, args.horizon, args.fill)
+    today = db_utils.clinic_today()
+    end = today + timedelta(days=args.horizon)
+
+    start = time.perf_counter()
+    rows = db_utils.refresh_free_slot_counts(days=args.horizon)
+    refresh = time.perf_counter() - start
+    print(f"врачей: {len(doctor_ids)}, занятых слотов: {booked}, счётчиков: {rows} (пересчёт {refresh:.2f} с)")
+
+    for label, start_day, end_day in (
+        ("весь горизонт", today, end),
+        ("страница месяца", today + timedelta(days=31), today + timedelta(days=61)),
+    ):
+        doctor_id = random.choice(doctor_ids)
+        assert detailed_dates(doctor_id, start_day, end_day) == \
+            db_utils.get_available_dates_in_range(doctor_id, start_day, end_day)
+        detailed = timed(lambda: detailed_dates(random.choice(doctor_ids), start_day, end_day), args.runs)
+        counted = timed(
+            lambda: db_utils.get_available_dates_in_range(random.choice(doctor_ids), start_day, end_day), args.runs
+        )
+        print(f"{label:16}: подробно {detailed:6.2f} мс, по счётчикам {counted:6.2f} мс, x{detailed / counted:.1f}")
+
+    start = time.perf_counter()
+    mismatches = db_utils.check_free_slot_counts(fix=False)
+    print(f"сверка счётчиков: {time.perf_counter() - start:.2f} с, расхождений {len(mismatches)}")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Горячие чтения из реплики БД в памяти против чтения из файла.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_read_replica --doctors 200 --days 90 --users 5000
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_schedule_storage import build_db
+from db import db_utils
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def read_cases(doctor_ids, service_id, telegram_ids):
+    return [
+        ("get_services", lambda: db_utils.get_services()),
+        ("get_doctors_by_service", lambda: db_utils.get_doctors_by_service(service_id)),
+        ("get_user_by_telegram_id", lambda: db_utils.get_user_by_telegram_id(random.choice(telegram_ids))),
+        ("свободные даты врача", lambda: db_utils.get_available_dates_for_doctor(random.choice(doctor_ids))),
+    ]
+
+
+def hold_and_release(doctor_ids, user_id):
+    """Типовая запись: удержать первый свободный слот и отпустить его."""
+    doctor_id = random.choice(doctor_ids)
+    dates = db_utils.get_available_dates_for_doctor(doctor_id, limit_dates=1)
+    if not dates:
+        return
+    time_str = db_utils.get_available_slots_for_doctor_on_date(doctor_id, dates[0])[0]
+    schedule_id, _ = db_utils.hold_slot(doctor_id, dates[0], time_str, user_id)
+    db_utils.release_hold(schedule_id, user_id)
+
+
+def dump(conn):
+    return list(conn.iterdump())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--fill", type=float, default=0.7)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    doctor_ids, booked = build_db(tmp / "bench.db", args.doctors, args.days, args.fill)
+    service_id = db_utils.add_service("Осмотр", 30, 1000)
+    telegram_ids = list(range(5 * 10 ** 8, 5 * 10 ** 8 + args.users))
+    with db_utils.connect() as conn:
+        conn.executemany(
+            "INSERT INTO doctor_services (doctor_id, service_id) VALUES (?, ?)",
+            [(doctor_id, service_id) for doctor_id in doctor_ids]
+        )
+        conn.executemany("INSERT INTO users (telegram_id) VALUES (?)", [(t,) for t in telegram_ids])
+        conn.commit()
+    user_id = db_utils.get_user_by_telegram_id(telegram_ids[0])[0]
+    print(f"врачей: {len(doctor_ids)}, занятых слотов: {booked}, пользователей: {args.users}")
+
+    file_ms = {name: timed(fn, args.runs) for name, fn in read_cases(doctor_ids, service_id, telegram_ids)}
+    file_write = timed(lambda: hold_and_release(doctor_ids, user_id), args.runs // 5)
+
+    start = time.perf_counter()
+    db_utils.load_read_replica()
+    print(f"загрузка реплики: {(time.perf_counter() - start) * 1000:.1f} мс\n")
+
+    for name, fn in read_cases(doctor_ids, service_id, telegram_ids):
+        replica = timed(fn, args.runs)
+        print(f"{name:24} файл {file_ms[name]:7.3f} мс, реплика {replica:7.3f} мс, x{file_ms[name] / replica:.1f}")
+    replica_write = timed(lambda: hold_and_release(doctor_ids, user_id), args.runs // 5)
+    print(f"{'удержание + снятие':24} файл {file_write:7.3f} мс, с репликой {replica_write:7.3f} мс")
+
+    # После записей через db_utils и снятия отложенного снимка реплика должна совпадать с файлом
+    db_utils._refresh_snapshot()
+    with sqlite3.connect(db_utils.DB_PATH) as disk, db_utils.read_connect() as replica:
+        same = dump(disk) == dump(replica)
+    print(f"\nреплика совпадает с файлом: {same}; {db_utils.replica_stats}")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
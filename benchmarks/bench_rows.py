@@ -0,0 +1,81 @@
+"""
+Память и скорость строк результатов: кортежи, NamedTuple из db.rows, sqlite3.Row и dict.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_rows --rows 100000
+"""
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+
+from db.rows import Appointment, row_factory
+
+
+def build(rows):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE a (id INTEGER, service_name TEXT, doctor_name TEXT, date TEXT, time TEXT, status TEXT, pet_name TEXT)
+    """)
+    services = ["Первичный осмотр", "Вакцинация", "Чипирование", "УЗИ"]
+    doctors = ["Доктор Иванова Анна", "Доктор Петров Илья", "Доктор Смирнова Ольга"]
+    conn.executemany(
+        "INSERT INTO a VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (i, services[i % 4], doctors[i % 3], f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+             f"{9 + i % 10:02d}:00", "scheduled", f"Питомец {i % 5000}")
+            for i in range(rows)
+        ]
+    )
+    return conn
+
+
+def dict_factory(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+FACTORIES = [
+    ("tuple", None),
+    ("Appointment (NamedTuple)", row_factory(Appointment)),
+    ("sqlite3.Row", sqlite3.Row),
+    ("dict", dict_factory),
+]
+
+
+def fetch(conn, factory):
+    cur = conn.cursor()
+    cur.row_factory = factory
+    cur.execute("SELECT * FROM a")
+    return cur.fetchall()
+
+
+def measure(conn, factory):
+    """Время выборки и сколько памяти занимает удержание всех строк (как в кэше)."""
+    start = time.perf_counter()
+    fetch(conn, factory)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    rows = fetch(conn, factory)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows
+    return elapsed * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = build(args.rows)
+    print(f"строк: {args.rows}")
+    for title, factory in FACTORIES:
+        elapsed, size = measure(conn, factory)
+        print(f"{title:25} выборка {elapsed:7.1f} мс, в памяти {size / 2 ** 20:6.1f} МБ ({size / args.rows:.0f} Б на строку)")
+
+
+if __name__ == "__main__":
+    main()
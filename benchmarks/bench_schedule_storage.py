@@ -0,0 +1,99 @@
+"""
+Сравнение хранения занятости: строки schedule против масок schedule_days.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_schedule_storage --doctors 200 --days 365
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from db import db_init, db_utils
+
+
+def build_db(path, doctors, days, fill):
+    db_init.DB_PATH = db_utils.DB_PATH = path
+    db_init.init_db()
+    with db_utils.connect() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "INSERT INTO doctors (full_name, specialty) VALUES (?, ?)",
+            [(f"Врач {i}", "Терапевт") for i in range(doctors)]
+        )
+        conn.commit()
+    db_utils.generate_schedule_for_all_doctors()
+
+    rows = []
+    with db_utils.connect() as conn:
+        cur = conn.cursor()
+        doctor_ids = [r[0] for r in cur.execute("SELECT id FROM doctors")]
+        today = db_utils.clinic_today()
+        for doctor_id in doctor_ids:
+            for offset in range(days):
+                day = today + timedelta(days=offset)
+                if day.weekday() >= 5:
+                    continue
+                for h in range(9, 19):
+                    if random.random() < fill:
+                        slot = (day.isoformat(), f"{h:02d}:00")
+                        rows.append((doctor_id, *slot, db_utils.slot_ts(*slot)))
+        cur.executemany(
+            "INSERT OR IGNORE INTO schedule (doctor_id, date, time, start_ts, is_booked) VALUES (?, ?, ?, ?, 1)", rows
+        )
+        conn.commit()
+    # брони вставлены мимо book_slot — счётчики свободных слотов пересчитываем целиком
+    db_utils.refresh_free_slot_counts(days=days)
+    return doctor_ids, len(rows)
+
+
+def query_time(doctor_ids, days):
+    start = time.perf_counter()
+    for doctor_id in doctor_ids:
+        db_utils.get_available_dates_for_doctor(doctor_id, limit_days=days, limit_dates=days)
+    return (time.perf_counter() - start) / len(doctor_ids) * 1000
+
+
+def storage_size(path, drop_table):
+    """Размер файла БД, если бы занятость хранилась только в одном из представлений."""
+    copy = path.with_name(f"{path.stem}_{drop_table}.db")
+    shutil.copy(path, copy)
+    with sqlite3.connect(copy) as conn:
+        conn.execute(f"DELETE FROM {drop_table}")
+        conn.commit()
+    conn = sqlite3.connect(copy)
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(copy)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--fill", type=float, default=0.5)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    path = tmp / "bench.db"
+    doctor_ids, booked = build_db(path, args.doctors, args.days, args.fill)
+    days_count = db_utils.migrate_schedule_to_bitmask()
+    print(f"врачей: {len(doctor_ids)}, занятых слотов: {booked}, врачей-дней: {days_count}")
+
+    for mode in ("rows", "bitmask"):
+        db_utils.SCHEDULE_STORAGE = mode
+        print(f"{mode:8} запрос дат на {args.days} дн.: {query_time(doctor_ids, args.days):.2f} мс/врач")
+
+    rows_size = storage_size(path, "schedule_days")
+    mask_size = storage_size(path, "schedule")
+    print(f"размер БД: rows {rows_size / 1024:.0f} КБ, bitmask {mask_size / 1024:.0f} КБ")
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
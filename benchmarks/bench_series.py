@@ -0,0 +1,82 @@
+"""
+Подбор слотов для курса визитов: один запрос на весь период против поиска по каждому визиту.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_series --doctors 200 --days 365 --count 4 --every 28
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from benchmarks.bench_schedule_storage import build_db
+from db import db_utils
+
+
+def naive_series(service_id, start_day, every, count, doctor_ids, window_days):
+    """Как без find_series_slots: запрос свободных слотов на каждый визит и каждый день сдвига."""
+    for doctor_id in doctor_ids:
+        plan = []
+        for k in range(count):
+            for shift in range(window_days + 1):
+                day = (start_day + timedelta(days=every * k + shift)).isoformat()
+                times = db_utils.get_available_slots_for_doctor_on_date(doctor_id, day)
+                if times:
+                    plan.append((doctor_id, day, times[0]))
+                    break
+            else:
+                break
+        if len(plan) == count:
+            return plan
+    return None
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--fill", type=float, default=0.9)
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--every", type=int, default=28)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    doctor_ids, booked = build_db(tmp / "bench.db", args.doctors, args.days, args.fill)
+    service_id = db_utils.add_service("Курс вакцинации", 30, 1000)
+    with db_utils.connect() as conn:
+        conn.executemany(
+            "INSERT INTO doctor_services (doctor_id, service_id) VALUES (?, ?)",
+            [(doctor_id, service_id) for doctor_id in doctor_ids]
+        )
+        conn.commit()
+    print(f"врачей: {len(doctor_ids)}, занятых слотов: {booked}, курс: {args.count} визита каждые {args.every} дн.")
+
+    start_day = db_utils.clinic_today() + timedelta(days=1)
+    one_doctor = random.choice(doctor_ids)
+    cases = [
+        ("один врач", one_doctor, [one_doctor]),
+        ("любой врач", None, doctor_ids),
+    ]
+    for title, doctor_id, naive_doctors in cases:
+        batched = timed(lambda: db_utils.find_series_slots(
+            service_id, start_day, args.every, args.count, doctor_id=doctor_id), args.runs)
+        naive = timed(lambda: naive_series(
+            service_id, start_day, args.every, args.count, naive_doctors, 2), args.runs)
+        print(f"{title:11} find_series_slots {batched:8.2f} мс, по визитам {naive:8.2f} мс")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Нагрузка на БД при «флуде» нажатиями одного пользователя: без ограничения и с ThrottlingMiddleware.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_throttling --presses 300 --interval 0.005
+"""
+import argparse
+import asyncio
+import tempfile
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from benchmarks.fake_bot import FakeSession, callback_update
+from db import db_init, db_utils
+from handlers import booking, common
+from handlers.callbacks import callback_routes
+from handlers.throttling import ThrottlingMiddleware
+
+USER_ID = 100000001  # тестовый пользователь из db_init
+
+
+def count_connections():
+    counter = {"n": 0}
+    original = db_utils.connect
+
+    def connect(*args, **kwargs):
+        counter["n"] += 1
+        return original(*args, **kwargs)
+
+    db_utils.connect = connect
+    return counter
+
+
+async def flood(dp, bot, presses, interval, data):
+    tasks = []
+    for _ in range(presses):
+        tasks.append(asyncio.create_task(dp.feed_update(bot, callback_update(USER_ID, data))))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--presses", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    db_init.DB_PATH = db_utils.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    db_init.init_db()
+    counter = count_connections()
+
+    throttling = ThrottlingMiddleware(rate=0.5, burst=2)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(booking.router)
+    dp.include_router(common.router)
+    dp.callback_query.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(callback_routes)
+    bot = Bot("42:BENCH", session=FakeSession())
+
+    seconds = args.presses * args.interval
+    print(f"{args.presses} нажатий «book_visit» за {seconds:.1f} с")
+    for label, rate, burst in (("без ограничения", 1e9, 10**9), ("token bucket 0.5/с, запас 2", 0.5, 2)):
+        throttling.rate, throttling.burst = rate, burst
+        throttling._buckets.clear()
+        counter["n"] = 0
+        await flood(dp, bot, args.presses, args.interval, "book_visit")
+        print(f"{label:>28}: подключений к БД {counter['n']:>5}")
+    print(f"статистика middleware: {throttling.stats}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Пропускная способность записи: COMMIT на каждую операцию против очереди с групповой фиксацией.
+
+Запуск из корня проекта (--dir — каталог на том же диске, что и боевая БД: в tmpfs fsync бесплатен):
+    python -m benchmarks.bench_write_queue --clients 50 --ops 20 --dir .
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from db import db_init, db_utils
+from services.write_queue import WriteQueue
+
+
+async def client(n, ops, add_user, add_pet):
+    """Один пользователь: регистрация и несколько питомцев."""
+    user_id = await add_user(10 ** 9 + n, f"+7900{n:07d}", f"Клиент {n}")
+    for k in range(ops - 1):
+        await add_pet(user_id, f"Питомец {k}", "Кошка", "2")
+
+
+async def per_call(clients, ops):
+    """Как раньше: обработчик вызывает функцию db_utils, у каждой — свой COMMIT."""
+    async def add_user(*args):
+        return db_utils.add_user(*args)
+
+    async def add_pet(*args):
+        return db_utils.add_pet(*args)
+
+    await asyncio.gather(*(client(n, ops, add_user, add_pet) for n in range(clients)))
+
+
+async def grouped(clients, ops, queue):
+    task = asyncio.create_task(queue.run())
+    await asyncio.sleep(0)
+    await asyncio.gather(*(client(n, ops, queue.add_user, queue.add_pet) for n in range(clients)))
+    task.cancel()
+
+
+def fresh_db(base):
+    path = Path(tempfile.mkdtemp(dir=base)) / "bench.db"
+    db_init.DB_PATH = db_utils.DB_PATH = path
+    db_init.init_db()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+    total = args.clients * args.ops
+
+    path = fresh_db(args.dir)
+    start = time.perf_counter()
+    asyncio.run(per_call(args.clients, args.ops))
+    per_call_rate = total / (time.perf_counter() - start)
+    shutil.rmtree(path.parent)
+
+    path = fresh_db(args.dir)
+    queue = WriteQueue(max_batch=args.batch, max_delay=args.delay_ms / 1000)
+    start = time.perf_counter()
+    asyncio.run(grouped(args.clients, args.ops, queue))
+    grouped_rate = total / (time.perf_counter() - start)
+    with db_utils.connect() as conn:
+        pets = conn.execute("SELECT COUNT(*) FROM pets WHERE name LIKE 'Питомец %'").fetchone()[0]
+    shutil.rmtree(path.parent)
+
+    print(f"операций: {total} ({args.clients} клиентов × {args.ops})")
+    print(f"COMMIT на операцию   {per_call_rate:8.0f} записей/с")
+    print(f"групповая фиксация   {grouped_rate:8.0f} записей/с, x{grouped_rate / per_call_rate:.1f}")
+    print(f"питомцев записано: {pets} из {args.clients * (args.ops - 1)}; {queue.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Фейковая сессия Bot API и конструкторы апдейтов для бенчмарков: без сети, с учётом вызовов."""
+import asyncio
+import datetime
+import itertools
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message, Update
+
+
+class FakeSession(BaseSession):
+    """Отвечает на любой метод без сети; для send/edit возвращает правдоподобное сообщение."""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = []
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls.append(method)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=getattr(method, "message_id", None) or next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+_update_ids = itertools.count(1)
+
+
+def callback_update(user_id, data, message_id=1):
+    update_id = next(_update_ids)
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 42, "is_bot": True, "first_name": "bot"},
+                "text": "…",
+            },
+        },
+    })
+
+
+def message_update(user_id, text):
+    update_id = next(_update_ids)
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        },
+    })
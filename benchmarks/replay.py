@@ -0,0 +1,167 @@
+"""
+Проигрывание журнала апдейтов (RECORD_UPDATES) через диспетчер бота с фейковой сессией
+Bot API и копией БД: распределение задержек против записанного в проде и расхождения
+в вызванных методах API — регрессионная проверка изменений booking.py и db_utils.py
+на реальной форме трафика.
+
+Копия БД переводится в те же псевдонимы, что и журнал, если передан ключ записи
+(--salt или RECORD_SALT) — иначе записанные пользователи в ней не найдутся. Снимок БД
+стоит брать на начало записи: экраны, зависящие от даты и занятости, на другой день
+расходятся. Состояния FSM не записываются — диалог, начатый до записи, тоже разойдётся.
+
+Запуск из корня проекта:
+    python -m benchmarks.replay updates.jsonl.gz --db db/vet_clinic.db --speed 5
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.types import Update
+
+from benchmarks.fake_bot import FakeSession
+from db import db_init, db_utils
+from handlers.recorder import Anonymizer, CallsMiddleware, read_log, track_calls
+
+
+def copy_databases(db_path, target_dir):
+    """Основная БД и БД филиалов (clinic_*.db) рядом с ней -> target_dir. Возвращает путь копии основной."""
+    for path in [db_path, *db_path.parent.glob("clinic_*.db")]:
+        shutil.copy(path, target_dir / path.name)
+    return target_dir / db_path.name
+
+
+def pseudonymize(paths, anonymizer):
+    """Telegram id и телефоны в копиях БД — в псевдонимы журнала."""
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            if "users" in tables:
+                conn.executemany(
+                    "UPDATE users SET telegram_id=?, phone=? WHERE id=?",
+                    [(anonymizer.user_id(tg_id), anonymizer.phone(phone), user_id)
+                     for user_id, tg_id, phone in conn.execute("SELECT id, telegram_id, phone FROM users").fetchall()]
+                )
+            conn.executemany(
+                "UPDATE doctors SET telegram_id=? WHERE id=?",
+                [(anonymizer.user_id(tg_id), doctor_id) for doctor_id, tg_id in
+                 conn.execute("SELECT id, telegram_id FROM doctors WHERE telegram_id IS NOT NULL").fetchall()]
+            )
+            conn.commit()
+
+
+def load_bot_module():
+    """Диспетчер и фоновые службы из bot.py — та же сборка, что в проде, без записи апдейтов."""
+    os.environ.setdefault("BOT_TOKEN", "42:REPLAY")
+    os.environ.pop("RECORD_UPDATES", None)
+    return importlib.import_module("bot")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def describe(update):
+    if update.callback_query:
+        return f"callback {update.callback_query.data}"
+    if update.message:
+        return f"message {update.message.text or ('contact' if update.message.contact else '…')}"
+    return update.event_type
+
+
+async def replay(app, records, speed, latency):
+    """Подаёт апдейты в темпе записи, ускоренном в `speed` раз (0 — без пауз). Возвращает [(запись, мс, вызовы)]."""
+    session = FakeSession(latency=latency)
+    session.middleware(CallsMiddleware())
+    bot = Bot("42:REPLAY", session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+    asyncio.create_task(app.bus.run())
+    asyncio.create_task(app.write_queue.run())
+    asyncio.create_task(app.waitlist_matcher.run(bot, app.waitlist.send_offer))
+    app.slot_holds.load()
+    asyncio.create_task(app.slot_holds.run(on_expired=app.waitlist_matcher.slot_freed))
+
+    async def feed(record, due):
+        with track_calls() as calls:
+            try:
+                await app.dp.feed_update(bot, Update.model_validate(record["update"]))
+            except Exception:
+                calls.append("!error")
+        return record, (time.perf_counter() - due) * 1000, calls
+
+    loop_start = time.perf_counter()
+    first = records[0]["t"]
+    tasks = []
+    for record in records:
+        due = loop_start + ((record["t"] - first) / speed if speed > 0 else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(record, max(due, loop_start))))
+    results = await asyncio.gather(*tasks)
+    # дать очереди записи и шине событий закончить начатое
+    await asyncio.sleep(0.2)
+    return results, time.perf_counter() - loop_start, len(session.calls)
+
+
+def report(results, elapsed, api_calls, show):
+    replayed = [ms for _, ms, _ in results]
+    recorded = [record["ms"] for record, _, _ in results]
+    print(f"апдейтов: {len(results)} за {elapsed:.1f} с ({len(results) / elapsed:.0f}/с), вызовов API: {api_calls}")
+    for label, values in (("записано", recorded), ("проигрыш", replayed)):
+        print(f"  {label}: p50 {percentile(values, 0.5):7.2f} мс, p90 {percentile(values, 0.9):7.2f} мс, "
+              f"p99 {percentile(values, 0.99):7.2f} мс, max {max(values):7.2f} мс")
+
+    diverged = [(i, record, calls) for i, (record, _, calls) in enumerate(results) if calls != record["calls"]]
+    errors = sum("!error" in calls for _, _, calls in results)
+    print(f"  расхождений в вызовах API: {len(diverged)} из {len(results)}, ошибок обработки: {errors}")
+    for i, record, calls in diverged[:show]:
+        update = Update.model_validate(record["update"])
+        print(f"    #{i} {describe(update)}: было {record['calls']}, стало {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--db", type=Path, default=db_init.DB_PATH)
+    parser.add_argument("--salt", default=os.getenv("RECORD_SALT", ""))
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--show", type=int, default=10)
+    args = parser.parse_args()
+
+    records = list(read_log(args.log))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("журнал пуст")
+        return
+
+    tmp = Path(tempfile.mkdtemp())
+    db_init.DB_PATH = db_utils.DB_PATH = copy_databases(args.db, tmp)
+    # схема и миграции — до перевода в псевдонимы, как при старте бота
+    db_init.init_db()
+    if args.salt:
+        pseudonymize([db_utils.shard_path(clinic_id) for clinic_id in db_utils.clinic_ids()], Anonymizer(args.salt))
+    else:
+        print("⚠️ ключ записи не задан: пользователи журнала не совпадут с пользователями БД")
+
+    app = load_bot_module()
+    results, elapsed, api_calls = asyncio.run(replay(app, records, args.speed, args.latency))
+    report(results, elapsed, api_calls, args.show)
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import asyncio
-import logging, os
+import logging
+from datetime import date
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -7,11 +8,55 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    THROTTLE_RATE,
+    THROTTLE_BURST,
+    THROTTLE_PREFIX_RATES,
+    THROTTLE_COALESCE,
+    THROTTLE_MAX_USERS,
+    REMINDER_INTERVAL_MINUTES,
+    SCHEDULE_TOPUP_HOURS,
+    MAINTENANCE_INTERVAL_MINUTES,
+    READ_REPLICA,
+    AGENDA_DIGEST_TIME,
+    CALENDAR_HORIZON_DAYS,
+    RECORD_UPDATES,
+    RECORD_SALT
+)
 from db.db_init import init_db
+from db.db_utils import (
+    clinic_ids,
+    use_clinic,
+    generate_schedule_for_all_doctors,
+    refresh_free_slot_counts,
+    load_read_replica,
+    close_read_replica,
+    replica_stats
+)
+from services.maintenance import maintenance_job
+from services import scheduler
+from services.http_session import build_session
+from services.waitlist import waitlist_matcher
+from services.holds import slot_holds
+from services.write_queue import write_queue
+from services.sender import broadcast_sender
+from services.events import bus, AppointmentBooked, AppointmentCancelled, PetAdded, PetDeleted
 
 # Роутеры
-from handlers import registration, pets, booking, common, notifications, appointments, calendar
+from handlers import registration, pets, booking, common, notifications, appointments, waitlist, series, agenda
+from handlers.callbacks import callback_routes
+from handlers import webhook_reply
+from handlers.webhook_reply import WebhookReplyMiddleware
+from handlers.throttling import ThrottlingMiddleware, parse_prefix_rates
+from handlers.chat_lock import ChatLockMiddleware
+from handlers.clinic import clinic_middleware
+from handlers.screen import screens, rendered_screens
+from handlers.calendar import calendar_pages
+from handlers.recorder import UpdateRecorder
 
 # ===Логирование===
 logging.basicConfig(
@@ -22,10 +67,14 @@ logging.basicConfig(
 # === Инициализация базы данных ===
 init_db()
 logging.info("✅ База данных успешно инициализирована.")
+if READ_REPLICA:
+    load_read_replica()
+    logging.info("✅ Реплика БД для чтения загружена в память.")
 
 # === Настройка бота и диспетчера ===
 bot = Bot(
     token=BOT_TOKEN,
+    session=build_session(),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 storage = MemoryStorage()
@@ -35,19 +84,117 @@ dp = Dispatcher(storage=storage)
 dp.include_router(registration.router)
 dp.include_router(pets.router)
 dp.include_router(booking.router)
+dp.include_router(waitlist.router)
+dp.include_router(series.router)
 dp.include_router(common.router)
 dp.include_router(notifications.router)
 dp.include_router(appointments.router)
+dp.include_router(agenda.router)
+
+# Запись апдейтов в псевдонимах для проигрывания (benchmarks.replay) — самым внешним слоем
+recorder = None
+if RECORD_UPDATES:
+    recorder = UpdateRecorder(RECORD_UPDATES, salt=RECORD_SALT)
+    dp.update.outer_middleware(recorder)
+    bot.session.middleware(recorder.calls_middleware)
+
+# Ограничение частоты нажатий — до любой работы с БД, в том числе на быстром пути
+dp.callback_query.outer_middleware(ThrottlingMiddleware(
+    rate=THROTTLE_RATE,
+    burst=THROTTLE_BURST,
+    prefix_rates=parse_prefix_rates(THROTTLE_PREFIX_RATES),
+    coalesce=THROTTLE_COALESCE.split(","),
+    max_keys=THROTTLE_MAX_USERS
+))
+# Апдейты одного чата — строго по очереди (после ограничения частоты, чтобы склейка не ждала в очереди)
+chat_lock = ChatLockMiddleware()
+dp.message.outer_middleware(chat_lock)
+dp.callback_query.outer_middleware(chat_lock)
+# Филиал пользователя — до быстрого пути: его обработчики тоже ходят в БД филиала
+dp.message.outer_middleware(clinic_middleware)
+dp.callback_query.outer_middleware(clinic_middleware)
+# Быстрый путь: callback_data разбирается один раз и ищется по префиксу
+dp.callback_query.outer_middleware(callback_routes)
+
+
+# === Периодические задания (хранилище расписания — в БД, одно выполнение на все процессы) ===
+async def topup_schedule_job():
+    for clinic_id in clinic_ids():
+        with use_clinic(clinic_id):
+            await asyncio.to_thread(generate_schedule_for_all_doctors)
+            await asyncio.to_thread(refresh_free_slot_counts, CALENDAR_HORIZON_DAYS, missing_only=True)
+
+
+scheduler.register_job("reminders", lambda: notifications.check_and_send_notifications(bot),
+                       minutes=REMINDER_INTERVAL_MINUTES)
+scheduler.register_job("schedule_topup", topup_schedule_job, hours=SCHEDULE_TOPUP_HOURS)
+scheduler.register_job("maintenance", maintenance_job, minutes=MAINTENANCE_INTERVAL_MINUTES)
+scheduler.register_job("agenda_digest", lambda: agenda.send_agenda_digest(bot), daily_at=AGENDA_DIGEST_TIME)
+
+
+# === Подписчики шины событий ===
+# Отменённое время — первым в лист ожидания (пропущенное событие подберёт периодический поиск)
+bus.subscribe(
+    "waitlist",
+    lambda e: waitlist_matcher.slot_freed(e.doctor_id, e.date, e.time, e.clinic_id),
+    AppointmentCancelled
+)
+
+# Какие кэшированные экраны пользователя устаревают от события
+SCREENS_BY_EVENT = {
+    AppointmentBooked: ("appointments",),
+    AppointmentCancelled: ("appointments",),
+    PetAdded: ("pets",),
+    PetDeleted: ("pets", "appointments"),
+}
+bus.subscribe(
+    "rendered_screens",
+    lambda e: rendered_screens.invalidate(e.user_id, *SCREENS_BY_EVENT[type(e)]),
+    *SCREENS_BY_EVENT,
+    on_overflow=rendered_screens.clear
+)
+# Расписание врача на день перестраивается после записи к нему или отмены
+bus.subscribe(
+    "agenda_screens",
+    lambda e: agenda.agenda_screens.invalidate((e.clinic_id, e.doctor_id), "agenda"),
+    AppointmentBooked, AppointmentCancelled,
+    on_overflow=agenda.agenda_screens.clear
+)
+# Страница календаря врача с этой датой — тоже
+bus.subscribe(
+    "calendar_pages",
+    lambda e: calendar_pages.invalidate(e.clinic_id, e.doctor_id, date.fromisoformat(e.date)),
+    AppointmentBooked, AppointmentCancelled,
+    on_overflow=calendar_pages.clear
+)
 
 
 async def on_startup(bot: Bot):
-    # Удаляем вебхук если был установлен ранее
-    await bot.delete_webhook()
-    # Устанавливаем новый вебхук (для Railway это не обязательно, но оставляем для совместимости)
-    # await bot.set_webhook(f"https://{os.getenv('RAILWAY_STATIC_URL')}.railway.app")
+    if WEBHOOK_URL:
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}")
+    else:
+        # Удаляем вебхук если был установлен ранее
+        await bot.delete_webhook()
 
 
 async def on_shutdown(bot: Bot):
+    bot.session.log_stats()
+    slot_holds.log_stats()
+    write_queue.log_stats()
+    screens.log_stats()
+    webhook_reply.log_stats()
+    rendered_screens.log_stats()
+    agenda.agenda_screens.log_stats()
+    calendar_pages.log_stats()
+    broadcast_sender.log_stats()
+    bus.log_stats()
+    scheduler.log_stats()
+    if READ_REPLICA:
+        close_read_replica()
+        logging.info(f"🧠 Реплика БД: {replica_stats}")
+    if recorder:
+        recorder.log_stats()
+        recorder.close()
     await bot.session.close()
 
 
@@ -55,16 +202,31 @@ async def main_webhook():
     """Запуск через вебхуки (рекомендуется для Railway)"""
     await on_startup(bot)
 
-    # Запускаем фоновую задачу уведомлений
-    asyncio.create_task(notifications.check_and_send_notifications(bot))
+    # События об изменениях данных — подписчикам
+    asyncio.create_task(bus.run())
+    # Записи обработчиков — пачками, одним COMMIT на пачку
+    asyncio.create_task(write_queue.run())
+    # Напоминания, пополнение расписания, архивация — через планировщик заданий
+    scheduler.setup_scheduler()
+    # Предложения освободившихся слотов листу ожидания
+    asyncio.create_task(waitlist_matcher.run(bot, waitlist.send_offer))
+    # Снятие истёкших удержаний слотов; освободившийся слот — листу ожидания
+    slot_holds.load()
+    asyncio.create_task(slot_holds.run(on_expired=waitlist_matcher.slot_freed))
+
+    # Первый вызов API за апдейт уходит телом ответа на вебхук
+    dp.update.outer_middleware(WebhookReplyMiddleware())
 
     app = web.Application()
     webhook_requests_handler = SimpleRequestHandler(
         dispatcher=dp,
         bot=bot,
+        handle_in_background=False,
     )
-    webhook_requests_handler.register(app, path="/webhook")
+    webhook_requests_handler.register(app, path=WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
+    # Статистика, закрытие журнала апдейтов и сессии — при остановке приложения
+    dp.shutdown.register(on_shutdown)
 
     return app
 
@@ -73,17 +235,29 @@ async def main_polling():
     """Запуск через поллинг (альтернативный вариант)"""
     logging.info("🚀 Бот запущен через поллинг")
 
-    # Запускаем фоновую задачу уведомлений
-    asyncio.create_task(notifications.check_and_send_notifications(bot))
+    # События об изменениях данных — подписчикам
+    asyncio.create_task(bus.run())
+    # Записи обработчиков — пачками, одним COMMIT на пачку
+    asyncio.create_task(write_queue.run())
+    # Напоминания, пополнение расписания, архивация — через планировщик заданий
+    scheduler.setup_scheduler()
+    # Предложения освободившихся слотов листу ожидания
+    asyncio.create_task(waitlist_matcher.run(bot, waitlist.send_offer))
+    # Снятие истёкших удержаний слотов; освободившийся слот — листу ожидания
+    slot_holds.load()
+    asyncio.create_task(slot_holds.run(on_expired=waitlist_matcher.slot_freed))
 
     try:
         await dp.start_polling(bot)
     finally:
-        await bot.session.close()
+        await on_shutdown(bot)
         logging.info("🛑 Бот остановлен")
 
 
 if __name__ == "__main__":
-    # Всегда используем поллинг (и в Railway и локально)
-    asyncio.run(main_polling())
+    # Вебхук, если задан WEBHOOK_URL, иначе поллинг
+    if WEBHOOK_URL:
+        web.run_app(main_webhook(), port=WEBHOOK_PORT)
+    else:
+        asyncio.run(main_polling())
 
@@ -6,4 +6,70 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 if not BOT_TOKEN:
-    raise ValueError("❌ BOT_TOKEN не найден! Добавьте его в переменные окружения Railway.")
\ No newline at end of file
+    raise ValueError("❌ BOT_TOKEN не найден! Добавьте его в переменные окружения Railway.")
+
+# === Вебхук (если WEBHOOK_URL не задан — поллинг) ===
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+
+# === HTTP-сессия Bot API ===
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")  # например, http://localhost:8081 для локального Bot API
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "0"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_DNS_CACHE_SECONDS = int(os.getenv("HTTP_DNS_CACHE_SECONDS", "3600"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_METHOD_TIMEOUTS = os.getenv("HTTP_METHOD_TIMEOUTS", "answerCallbackQuery=5,deleteMessage=10")
+
+# === Ограничение частоты нажатий (token bucket на пользователя) ===
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))  # токенов в секунду
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "5"))
+# префикс=токенов_в_секунду/запас — отдельная корзина для «тяжёлых» кнопок
+THROTTLE_PREFIX_RATES = os.getenv(
+    "THROTTLE_PREFIX_RATES",
+    "book_visit=0.5/2,back_to_service=1/2,back_to_calendar=1/2,simple_cal=1/3,cal_page=2/4"
+)
+# префиксы, для которых лишние нажатия склеиваются в последнее, а не отбрасываются
+THROTTLE_COALESCE = os.getenv("THROTTLE_COALESCE", "back_to_service,back_to_calendar,back_to_time")
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+
+# === Обслуживание БД ===
+MAINTENANCE_INTERVAL_MINUTES = int(os.getenv("MAINTENANCE_INTERVAL_MINUTES", "60"))
+ARCHIVE_KEEP_DAYS = int(os.getenv("ARCHIVE_KEEP_DAYS", "1"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# === Лист ожидания ===
+WAITLIST_OFFER_MINUTES = int(os.getenv("WAITLIST_OFFER_MINUTES", "15"))  # сколько действует предложение слота
+WAITLIST_SWEEP_SECONDS = int(os.getenv("WAITLIST_SWEEP_SECONDS", "60"))
+WAITLIST_BATCH_DELAY = float(os.getenv("WAITLIST_BATCH_DELAY", "1"))  # сбор освободившихся слотов в одну пачку
+
+# === Календарь записи ===
+CALENDAR_PAGE = os.getenv("CALENDAR_PAGE", "month")  # "week" или "month" — сколько дней на странице
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "90"))  # как далеко вперёд можно листать
+CALENDAR_CACHE_SECONDS = int(os.getenv("CALENDAR_CACHE_SECONDS", "60"))  # удержания слотов событий не шлют
+
+# === Удержание слота на время мастера записи ===
+SLOT_HOLD_SECONDS = int(os.getenv("SLOT_HOLD_SECONDS", "600"))
+
+# === Фоновые задания (APScheduler, хранилище — в БД) ===
+REMINDER_INTERVAL_MINUTES = int(os.getenv("REMINDER_INTERVAL_MINUTES", "5"))
+SCHEDULE_TOPUP_HOURS = int(os.getenv("SCHEDULE_TOPUP_HOURS", "24"))
+JOB_MISFIRE_GRACE_SECONDS = int(os.getenv("JOB_MISFIRE_GRACE_SECONDS", "300"))  # опоздавший запуск старше — пропускается
+JOB_LOCK_LEASE_SECONDS = int(os.getenv("JOB_LOCK_LEASE_SECONDS", "900"))  # сколько держится блокировка упавшего процесса
+
+# === Реплика БД для чтения ===
+# Услуги, врачи, свободные слоты и пользователи читаются из копии БД в памяти (только для одного процесса бота)
+READ_REPLICA = os.getenv("READ_REPLICA", "0") == "1"
+
+# === Групповая фиксация записей ===
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "50"))  # операций на один COMMIT
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "5"))  # сколько ждать попутные операции
+
+# === Расписание врача на день ===
+AGENDA_DIGEST_TIME = os.getenv("AGENDA_DIGEST_TIME", "08:00")  # утренняя сводка врачам, время клиники
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # сообщений в секунду на рассылки (лимит Bot API ~30)
+
+# === Запись апдейтов для проигрывания (benchmarks.replay) ===
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")  # путь к журналу (.jsonl или .jsonl.gz); пусто — не записывать
+RECORD_SALT = os.getenv("RECORD_SALT", "")  # ключ псевдонимов; пусто — случайный на каждый запуск
@@ -1,100 +1,335 @@
 # db/db_init.py
 import sqlite3
+import time
 from pathlib import Path
-from datetime import date, timedelta
 import random
 
+from db.db_utils import (
+    SCHEDULE_STORAGE,
+    MAIN_CLINIC,
+    clinic_ids,
+    shard_path,
+    use_clinic,
+    generate_schedule_for_all_doctors,
+    refresh_free_slot_counts,
+    migrate_schedule_to_bitmask,
+    slot_ts
+)
+
 DB_PATH = Path("db/vet_clinic.db")
 
+# Ядро — только в основной БД: общие для всех филиалов пользователи, питомцы и задания
+CORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER UNIQUE NOT NULL,
+    phone TEXT,
+    full_name TEXT,
+    reg_date TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS pets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    species TEXT,
+    age TEXT,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Фоновые задания: блокировка «одно выполнение на все процессы» и итог последнего запуска
+CREATE TABLE IF NOT EXISTS job_locks (
+    name TEXT PRIMARY KEY,
+    locked_by TEXT,
+    locked_until REAL,
+    last_started_at REAL,
+    last_finished_at REAL,
+    last_status TEXT,
+    last_duration REAL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Данные филиала — в его БД (для первого филиала это основная БД).
+# user_id/pet_id ссылаются на users/pets ядра: в БД филиала этих таблиц нет (ядро
+# подключается через ATTACH), а ключ в другую БД SQLite не проверяет — поэтому без FOREIGN KEY.
+CLINIC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doctors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    specialty TEXT
+);
+
+CREATE TABLE IF NOT EXISTS services (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    price REAL
+);
+
+CREATE TABLE IF NOT EXISTS doctor_services (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
+    FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE,
+    UNIQUE (doctor_id, service_id)
+);
+
+CREATE TABLE IF NOT EXISTS schedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    is_booked INTEGER DEFAULT 0,
+    held_by INTEGER,
+    held_until INTEGER,
+    start_ts INTEGER,
+    UNIQUE (doctor_id, date, time),
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    pet_id INTEGER NOT NULL,
+    doctor_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    schedule_id INTEGER NOT NULL,
+    status TEXT DEFAULT 'scheduled',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    notified_24h INTEGER DEFAULT 0,
+    notified_2h INTEGER DEFAULT 0,
+    start_ts INTEGER,
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id),
+    FOREIGN KEY (service_id) REFERENCES services(id),
+    FOREIGN KEY (schedule_id) REFERENCES schedule(id)
+);
+
+-- Недельный шаблон рабочих часов врача (0 = пн ... 6 = вс)
+CREATE TABLE IF NOT EXISTS doctor_working_hours (
+    doctor_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    slot_minutes INTEGER NOT NULL DEFAULT 60,
+    PRIMARY KEY (doctor_id, weekday, start_time),
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Исключения из шаблона: праздники (doctor_id IS NULL), отпуска, доп. часы
+CREATE TABLE IF NOT EXISTS schedule_exceptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor_id INTEGER,
+    date_from TEXT NOT NULL,
+    date_to TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'off',
+    start_time TEXT,
+    end_time TEXT,
+    slot_minutes INTEGER DEFAULT 60,
+    note TEXT,
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+);
+
+-- Режим SCHEDULE_STORAGE=bitmask: занятость врача-дня одной строкой
+CREATE TABLE IF NOT EXISTS schedule_days (
+    doctor_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    booked_mask INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (doctor_id, date)
+) WITHOUT ROWID;
+
+-- Число свободных слотов врача-дня (шаблон минус занятые, без учёта удержаний):
+-- строится из шаблонов refresh_free_slot_counts(), бронь и отмена меняют его в той же транзакции
+CREATE TABLE IF NOT EXISTS free_slot_counts (
+    doctor_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    free INTEGER NOT NULL,
+    PRIMARY KEY (doctor_id, date)
+) WITHOUT ROWID;
+
+-- Лист ожидания: doctor_id IS NULL — подойдёт любой врач услуги
+CREATE TABLE IF NOT EXISTS waitlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    pet_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    doctor_id INTEGER,
+    date_from TEXT NOT NULL,
+    date_to TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'waiting',
+    queued_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    offer_doctor_id INTEGER,
+    offer_date TEXT,
+    offer_time TEXT,
+    offer_expires_ts INTEGER,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (service_id) REFERENCES services(id),
+    FOREIGN KEY (doctor_id) REFERENCES doctors(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_waitlist_match ON waitlist(service_id, doctor_id, date_from) WHERE status = 'waiting';
+
+CREATE INDEX IF NOT EXISTS idx_schedule_exceptions_dates ON schedule_exceptions(date_to, date_from);
+CREATE INDEX IF NOT EXISTS idx_schedule_date ON schedule(date);
+CREATE INDEX IF NOT EXISTS idx_appointments_schedule ON appointments(schedule_id);
+
+-- Архив: прошедшие слоты, маски их дней и завершённые/отменённые записи
+CREATE TABLE IF NOT EXISTS schedule_archive (
+    id INTEGER PRIMARY KEY,
+    doctor_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    is_booked INTEGER,
+    start_ts INTEGER,
+    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS appointments_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    pet_id INTEGER NOT NULL,
+    doctor_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    schedule_id INTEGER NOT NULL,
+    status TEXT,
+    created_at TEXT,
+    notified_24h INTEGER,
+    notified_2h INTEGER,
+    start_ts INTEGER,
+    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS schedule_days_archive (
+    doctor_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    booked_mask INTEGER NOT NULL,
+    archived_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (doctor_id, date)
+) WITHOUT ROWID;
+"""
+
 
 def init_db():
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    for clinic_id in clinic_ids():
+        core = clinic_id == MAIN_CLINIC
+        _init_database(DB_PATH if core else shard_path(clinic_id), core)
+
+        with use_clinic(clinic_id):
+            # Шаблон рабочих часов для врачей, у которых его ещё нет
+            generate_schedule_for_all_doctors()
+
+            # Маски занятости строятся из schedule, чтобы переключение режима было безопасным
+            if SCHEDULE_STORAGE == "bitmask":
+                migrate_schedule_to_bitmask()
+
+            # Счётчики свободных слотов — только для дней, у которых их ещё нет
+            refresh_free_slot_counts(missing_only=True)
+    print("✅ База данных успешно инициализирована с тестовыми данными.")
+
+
+def _init_database(path, core):
+    """Схема, миграции и тестовые данные одной БД: основной (core=True) или филиала."""
+    conn = sqlite3.connect(path)
     cur = conn.cursor()
 
+    # Инкрементальный vacuum: место после архивации возвращается без полного VACUUM
+    if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cur.execute("VACUUM")
+
     # === Создание таблиц ===
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        telegram_id INTEGER UNIQUE NOT NULL,
-        phone TEXT,
-        full_name TEXT,
-        reg_date TEXT DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS pets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        name TEXT NOT NULL,
-        species TEXT,
-        age TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS doctors (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        full_name TEXT NOT NULL,
-        specialty TEXT
-    );
-
-    CREATE TABLE IF NOT EXISTS services (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        duration INTEGER NOT NULL,
-        price REAL
-    );
-
-    CREATE TABLE IF NOT EXISTS doctor_services (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER NOT NULL,
-        service_id INTEGER NOT NULL,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
-        FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE,
-        UNIQUE (doctor_id, service_id)
-    );
-
-    CREATE TABLE IF NOT EXISTS schedule (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        time TEXT NOT NULL,
-        is_booked INTEGER DEFAULT 0,
-        UNIQUE (doctor_id, date, time),
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS appointments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        pet_id INTEGER NOT NULL,
-        doctor_id INTEGER NOT NULL,
-        service_id INTEGER NOT NULL,
-        schedule_id INTEGER NOT NULL,
-        status TEXT DEFAULT 'scheduled',
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        notified_24h INTEGER DEFAULT 0,
-        notified_2h INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (pet_id) REFERENCES pets(id),
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id),
-        FOREIGN KEY (service_id) REFERENCES services(id),
-        FOREIGN KEY (schedule_id) REFERENCES schedule(id)
-    );
-    """)
+    if core:
+        cur.executescript(CORE_SCHEMA)
+        # Филиал пользователя (NULL — ещё не выбран)
+        _add_column(cur, "users", "clinic_id", "TEXT")
+    cur.executescript(CLINIC_SCHEMA)
+
+    # Временное удержание слота на время мастера записи (held_until — unix-время)
+    _add_column(cur, "schedule", "held_by", "INTEGER")
+    _add_column(cur, "schedule", "held_until", "INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_schedule_holds ON schedule(held_until) WHERE held_until IS NOT NULL")
+
+    # Начало слота/записи в unix-времени: диапазонные запросы — по целым числам, а не по строкам
+    for table in ("schedule", "appointments", "schedule_archive", "appointments_archive"):
+        _add_column(cur, table, "start_ts", "INTEGER")
+    _backfill_start_ts(cur)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_schedule_start ON schedule(doctor_id, start_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_start ON appointments(start_ts) WHERE status = 'scheduled'")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_user_start ON appointments(user_id, start_ts)")
+
+    # Срок ответа на предложение из листа ожидания — тоже unix-время (прежде — местная ISO-строка сервера)
+    _add_column(cur, "waitlist", "offer_expires_ts", "INTEGER")
+    _backfill_offer_expires_ts(cur)
+    cur.execute("DROP INDEX IF EXISTS idx_waitlist_offers")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_offer_expiry ON waitlist(offer_expires_ts) WHERE status = 'offered'")
+
+    # Расписание врача на день: аккаунт Telegram врача и выборка его записей по времени
+    _add_column(cur, "doctors", "telegram_id", "INTEGER")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_doctors_telegram ON doctors(telegram_id) WHERE telegram_id IS NOT NULL")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_doctor_start ON appointments(doctor_id, start_ts) WHERE status = 'scheduled'"
+    )
 
     # === Добавление тестовых данных ===
-    _add_test_data(cur)
+    # (только в пустую БД: у врачей, услуг и питомцев нет уникальных ключей)
+    if not cur.execute("SELECT 1 FROM doctors LIMIT 1").fetchone():
+        _add_test_data(cur)
+    if core and not cur.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+        _add_test_users(cur)
+
+    # Слоты вычисляются из шаблонов — свободные материализованные строки больше не нужны
+    # (действующие удержания остаются: после перезапуска их подхватывает SlotHolds.load())
+    cur.execute("""
+        DELETE FROM schedule
+        WHERE is_booked = 0 AND (held_until IS NULL OR held_until < ?)
+          AND NOT EXISTS (SELECT 1 FROM appointments a WHERE a.schedule_id = schedule.id)
+    """, (int(time.time()),))
 
     conn.commit()
     conn.close()
 
-    # Генерируем расписание на 14 дней вперед
-    generate_schedule_for_all_doctors()
-    print("✅ База данных успешно инициализирована с тестовыми данными.")
+
+def _add_column(cur, table, column, declaration):
+    """Добавляет колонку в существующую таблицу, если её ещё нет."""
+    columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _backfill_start_ts(cur):
+    """Заполняет start_ts у строк, созданных до появления колонки."""
+    cur.execute("SELECT id, date, time FROM schedule WHERE start_ts IS NULL")
+    cur.executemany(
+        "UPDATE schedule SET start_ts = ? WHERE id = ?",
+        [(slot_ts(date_iso, time_str), schedule_id) for schedule_id, date_iso, time_str in cur.fetchall()]
+    )
+    cur.execute("""
+        UPDATE appointments
+        SET start_ts = (SELECT sch.start_ts FROM schedule sch WHERE sch.id = appointments.schedule_id)
+        WHERE start_ts IS NULL
+    """)
+
+
+def _backfill_offer_expires_ts(cur):
+    """Переводит сроки действующих предложений из offer_expires_at (время клиники) в offer_expires_ts."""
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(waitlist)")}
+    if "offer_expires_at" not in columns:
+        return
+    cur.execute("""
+        SELECT id, offer_expires_at FROM waitlist
+        WHERE status = 'offered' AND offer_expires_ts IS NULL AND offer_expires_at IS NOT NULL
+    """)
+    cur.executemany(
+        "UPDATE waitlist SET offer_expires_ts = ?, offer_expires_at = NULL WHERE id = ?",
+        [(slot_ts(*expires_at.split("T")), waitlist_id) for waitlist_id, expires_at in cur.fetchall()]
+    )
 
 
 def _add_test_data(cur):
-    """Добавление тестовых данных во все таблицы"""
+    """Добавление тестовых врачей и услуг филиала"""
 
     # === Врачи ===
     doctors = [
@@ -138,6 +373,12 @@ def _add_test_data(cur):
     for service_id in [1, 2, 5, 6, 8, 9]:
         cur.execute("INSERT OR IGNORE INTO doctor_services (doctor_id, service_id) VALUES (?, ?)", (3, service_id))
 
+    print("✅ Тестовые данные филиала добавлены")
+
+
+def _add_test_users(cur):
+    """Добавление тестовых пользователей и питомцев в ядро"""
+
     # === Пользователи ===
     users = [
         (100000001, "+79161111111", "Александр Ковалев"),
@@ -173,44 +414,3 @@ def _add_test_data(cur):
             )
 
     print("✅ Тестовые данные добавлены (без записей на прием)")
-
-
-def generate_schedule_for_all_doctors(days_ahead=14, work_start=9, work_end=19):
-    """
-    Генерирует слоты для всех врачей на ближайшие `days_ahead` дней.
-    Врачи работают пн-пт, слоты каждый час: от work_start до work_end-1.
-    """
-    today = date.today()
-    end_date = today + timedelta(days=days_ahead)
-
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM doctors")
-        doctors = [r[0] for r in cur.fetchall()]
-
-        for doctor_id in doctors:
-            current = today
-            while current <= end_date:
-                if current.weekday() < 5:  # пн-пт
-                    iso = current.isoformat()
-                    for h in range(work_start, work_end):
-                        time_str = f"{h:02d}:00"
-                        try:
-                            cur.execute(
-                                "INSERT OR IGNORE INTO schedule (doctor_id, date, time, is_booked) VALUES (?, ?, ?, 0)",
-                                (doctor_id, iso, time_str)
-                            )
-                        except sqlite3.IntegrityError:
-                            pass
-                current += timedelta(days=1)
-        conn.commit()
-
-
-def cleanup_old_schedule(keep_days=14):
-    """Удаляет старые слоты и оставляет только ближайшие `keep_days` дней."""
-    today = date.today()
-    cutoff = today - timedelta(days=1)
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM schedule WHERE date < ?", (cutoff.isoformat(),))
-        conn.commit()
@@ -1,22 +1,307 @@
 # db/db_utils.py:
+import os
+import re
 import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from db.rows import User, Pet, Doctor, Service, Slot, Appointment, AgendaItem, row_factory
+from services.events import bus, AppointmentBooked, AppointmentCancelled, PetAdded, PetDeleted
 
 DB_PATH = Path("db/vet_clinic.db")
 
+# Хранение занятости: "rows" — строки schedule, "bitmask" — ещё и одна строка schedule_days на врача-день.
+# Маска — дополнительный индекс для чтения занятости: запись, удержания и отмена по-прежнему идут
+# через строки schedule (на них ссылаются appointments), а бит ставится в той же транзакции.
+SCHEDULE_STORAGE = os.getenv("SCHEDULE_STORAGE", "rows")
+SLOT_GRANULARITY = 30  # минут на один бит маски; времена и длительности слотов должны быть кратны этому шагу
+
+
+# Часовой пояс клиники: date/time слотов — местные, start_ts — unix-время (UTC)
+CLINIC_TZ = ZoneInfo(os.getenv("CLINIC_TIMEZONE", "Europe/Moscow"))
+
+
+# === Филиалы ===
+# CLINICS="main:Центральный,north:Северный". Первый филиал живёт в основной БД вместе
+# с ядром (пользователи, питомцы, блокировки заданий), остальные — каждый в своём файле
+# clinic_<id>.db, к которому ядро подключается через ATTACH. Врачи, услуги, расписание,
+# записи и лист ожидания лежат в БД филиала: записи одного филиала не блокируют другие.
+# Филиал запроса задаёт use_clinic(); без CLINICS — один филиал, как раньше.
+def _parse_clinics(spec):
+    clinics = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        clinic_id, _, name = item.partition(":")
+        clinics[clinic_id.strip()] = name.strip() or clinic_id.strip()
+    return clinics or {"main": "Клиника"}
+
+
+CLINICS = _parse_clinics(os.getenv("CLINICS", ""))
+MAIN_CLINIC = next(iter(CLINICS))
+_clinic = ContextVar("clinic", default=MAIN_CLINIC)
+
+
+def clinic_ids():
+    return list(CLINICS)
+
+
+def is_sharded():
+    return len(CLINICS) > 1
+
+
+def current_clinic():
+    return _clinic.get()
+
+
+@contextmanager
+def use_clinic(clinic_id):
+    """Направляет запросы db_utils в БД филиала до выхода из блока (asyncio.to_thread наследует филиал)."""
+    if clinic_id not in CLINICS:
+        raise ValueError(f"Неизвестный филиал: {clinic_id}")
+    token = _clinic.set(clinic_id)
+    try:
+        yield
+    finally:
+        _clinic.reset(token)
+
+
+def shard_path(clinic_id):
+    """Файл БД филиала."""
+    return DB_PATH if clinic_id == MAIN_CLINIC else DB_PATH.with_name(f"clinic_{clinic_id}.db")
+
+
+class _Connection(sqlite3.Connection):
+    """Соединение, копящее события изменения данных: они публикуются только после COMMIT."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = []
+
+    def commit(self):
+        super().commit()
+        self._committed()
+        events, self.events = self.events, []
+        for event in events:
+            bus.publish(event)
+
+    def _committed(self):
+        """Вызывается после COMMIT, до публикации событий."""
+
+    def rollback(self):
+        super().rollback()
+        self.events = []
+
+
+def _emit(cur, event):
+    """Событие текущей транзакции; при откате (или без conn.commit()) оно не будет опубликовано."""
+    cur.connection.events.append(event)
+
+
+def connect(core=False):
+    """Подключение к БД текущего филиала; core=True — к основной БД (ядро: пользователи, питомцы)."""
+    clinic_id = MAIN_CLINIC if core else _clinic.get()
+    if clinic_id == MAIN_CLINIC:
+        return sqlite3.connect(DB_PATH, factory=_ReplicatingConnection if _replica is not None else _Connection)
+    # Таблиц ядра в БД филиала нет, поэтому users/pets без префикса находятся в core
+    conn = sqlite3.connect(shard_path(clinic_id), factory=_Connection)
+    conn.execute("ATTACH DATABASE ? AS core", (str(DB_PATH),))
+    return conn
+
+
+# === Реплика для чтения в памяти ===
+# Горячие чтения (услуги, врачи, свободные слоты, пользователи) идут в снимок БД в памяти,
+# записи — в файл. Снимок снимается backup API с закоммиченного файла, поэтому совпадает
+# с ним байт в байт. COMMIT с изменениями через connect() помечает устаревшими только те
+# таблицы, в которые писал, и ставит снятие нового снимка в фоновый поток: через
+# REPLICA_REFRESH_DELAY после первого такого коммита, одна копия на все коммиты за это время.
+# Пока снимок не обновлён, чтения устаревших таблиц идут в файл (чтение после своей записи
+# видит её и не ждёт копирования), а остальные остаются на снимке. Чтение, не назвавшее
+# своих таблиц, считает устаревшими все. Снимок — БД memdb, к которой каждый поток читает
+# через своё соединение: чтения не ждут друг друга, а уже начатое чтение дочитывает свой
+# снимок. Записи мимо db_utils (другие процессы) реплика не видит — режим рассчитан на один
+# процесс бота. Реплицируется только основная БД: чтения остальных филиалов идут в их файлы.
+REPLICA_REFRESH_DELAY = float(os.getenv("READ_REPLICA_REFRESH_MS", "200")) / 1000
+_replica = None  # соединение, держащее текущий снимок в памяти (None — реплика не поднята)
+_replica_uri = None
+_replica_version = 0  # значение _data_version, с которого снят текущий снимок
+_data_version = 0  # растёт на каждом COMMIT с изменениями основной БД через db_utils
+_table_versions = {}  # таблица -> _data_version её последнего изменения ("*" — неизвестно какой)
+_refresh_timer = None
+_version_lock = threading.Lock()
+_snapshot_lock = threading.Lock()
+_snapshots = 0
+_readers = threading.local()  # соединение потока со снимком и глубина вложенных чтений
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+_WRITE_TARGET = re.compile(
+    r'\s*(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(?:main\.)?"?(\w+)',
+    re.IGNORECASE
+)
+replica_stats = {"reads": 0, "file_reads": 0, "snapshots": 0}
+
+# Таблицы, из которых читаются свободные слоты
+_SCHEDULE_TABLES = ("doctor_working_hours", "schedule_exceptions", "schedule", "schedule_days", "free_slot_counts")
+
+
+def _replica_changed(tables):
+    """COMMIT изменил таблицы `tables` основной БД: их чтения идут в файл до нового снимка."""
+    global _data_version, _refresh_timer
+    with _version_lock:
+        _data_version += 1
+        for table in tables:
+            _table_versions[table] = _data_version
+        if _replica is not None and _refresh_timer is None:
+            _refresh_timer = threading.Timer(REPLICA_REFRESH_DELAY, _refresh_in_background)
+            _refresh_timer.daemon = True
+            _refresh_timer.start()
+
+
+def _stale(tables):
+    """Менялись ли таблицы `tables` (None — любые) после снятия текущего снимка."""
+    if tables is None:
+        return _data_version != _replica_version
+    return any(_table_versions.get(table, 0) > _replica_version for table in ("*", *tables))
+
+
+class _ReplicatingConnection(_Connection):
+    """
+    Соединение с файлом БД, которое после COMMIT с изменениями помечает изменённые таблицы
+    устаревшими — уже после записи в файл и до публикации событий, чтобы подписчики читали
+    свежие данные.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._written = set()
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, sql):
+        head = sql.lstrip()[:11].upper()
+        if head.startswith(_WRITE_PREFIXES):
+            # DDL и нераспознанная запись делают устаревшими все таблицы
+            target = _WRITE_TARGET.match(sql)
+            self._written.add(target.group(1).lower() if target else "*")
+        elif head.startswith("ROLLBACK") and not head.startswith("ROLLBACK TO"):
+            self._written.clear()
+
+    def _committed(self):
+        if self._written:
+            tables, self._written = self._written, set()
+            _replica_changed(tables)
+
+
+def _take_snapshot():
+    """Копия файла БД в новой БД memdb. Возвращает (держащее её соединение, её URI)."""
+    global _snapshots
+    _snapshots += 1
+    uri = f"file:/vet_clinic_replica_{os.getpid()}_{_snapshots}?vfs=memdb"
+    holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    with closing(sqlite3.connect(DB_PATH)) as disk:
+        disk.backup(holder)
+    replica_stats["snapshots"] += 1
+    return holder, uri
+
+
+def _refresh_snapshot(force=False):
+    """Снимает новый снимок, если файл менялся после текущего (force=True — в любом случае)."""
+    global _replica, _replica_uri, _replica_version
+    with _snapshot_lock:
+        if not force and (_replica is None or _replica_version == _data_version):
+            return
+        # коммит во время копирования поднимет версию ещё раз и поставит новое снятие
+        version = _data_version
+        holder, uri = _take_snapshot()
+        old, _replica, _replica_uri, _replica_version = _replica, holder, uri, version
+    # прежний снимок живёт, пока к нему открыто хоть одно соединение читателя
+    if old is not None:
+        old.close()
+
+
+def _refresh_in_background():
+    global _refresh_timer
+    with _version_lock:
+        _refresh_timer = None
+    _refresh_snapshot()
+
 
-def connect():
-    """Подключение к базе данных."""
-    return sqlite3.connect(DB_PATH)
+def load_read_replica():
+    """Поднимает снимок БД в памяти; после этого чтения горячих данных идут в него."""
+    _refresh_snapshot(force=True)
+
+
+def close_read_replica():
+    """Отменяет отложенное снятие снимка и возвращает все чтения в файл."""
+    global _replica, _refresh_timer
+    with _version_lock:
+        if _refresh_timer is not None:
+            _refresh_timer.cancel()
+            _refresh_timer = None
+    with _snapshot_lock:
+        old, _replica = _replica, None
+    if old is not None:
+        old.close()
+
+
+@contextmanager
+def read_connect(core=False, tables=None):
+    """
+    Соединение для чтения: реплика в памяти, если она поднята, покрывает филиал и таблицы
+    `tables`, которые читает вызывающий, не менялись после снимка; иначе файл.
+    """
+    covered = _replica is not None and (core or _clinic.get() == MAIN_CLINIC)
+    if not covered or _stale(tables):
+        if covered:
+            replica_stats["file_reads"] += 1
+        with connect(core) as conn:
+            yield conn
+        return
+    reader = _readers
+    depth = getattr(reader, "depth", 0)
+    # вложенное чтение остаётся на снимке внешнего
+    if not depth and getattr(reader, "uri", None) != _replica_uri:
+        if getattr(reader, "conn", None) is not None:
+            reader.conn.close()
+        # под блокировкой держатель снимка ещё открыт: иначе URI дал бы новую пустую БД
+        with _snapshot_lock:
+            reader.conn, reader.uri = sqlite3.connect(_replica_uri, uri=True), _replica_uri
+    reader.depth = depth + 1
+    replica_stats["reads"] += 1
+    try:
+        yield reader.conn
+    finally:
+        reader.depth = depth
+
+
+def clinic_today():
+    """Текущая дата в часовом поясе клиники."""
+    return datetime.now(CLINIC_TZ).date()
+
+
+def slot_ts(date_iso, time_str):
+    """Начало слота (местные дата и время клиники) -> unix-время."""
+    return int(datetime.fromisoformat(f"{date_iso}T{time_str}").replace(tzinfo=CLINIC_TZ).timestamp())
+
+
+def day_start_ts(day):
+    """Начало дня `day` в часовом поясе клиники -> unix-время."""
+    return int(datetime.combine(day, datetime.min.time(), CLINIC_TZ).timestamp())
+
+
+def _ts_range(start_iso, end_iso):
+    """Полуинтервал [начало start_iso, начало дня после end_iso) в unix-времени."""
+    return day_start_ts(date.fromisoformat(start_iso)), day_start_ts(date.fromisoformat(end_iso) + timedelta(days=1))
 
 
 # =========================
 # Doctors / Services
 # =========================
 def get_doctors():
-    with connect() as conn:
+    with read_connect(tables=("doctors",)) as conn:
         cur = conn.cursor()
+        cur.row_factory = row_factory(Doctor)
         cur.execute("SELECT id, full_name, specialty FROM doctors ORDER BY full_name")
         return cur.fetchall()
 
@@ -30,8 +315,9 @@ def add_doctor(full_name, specialty):
 
 
 def get_services():
-    with connect() as conn:
+    with read_connect(tables=("services",)) as conn:
         cur = conn.cursor()
+        cur.row_factory = row_factory(Service)
         cur.execute("SELECT id, name, duration, price FROM services ORDER BY name")
         return cur.fetchall()
 
@@ -48,44 +334,97 @@ def add_service(name, duration, price):
 # Users / Pets
 # =========================
 def get_user_by_telegram_id(tg_id):
-    with connect() as conn:
+    with read_connect(core=True, tables=("users",)) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id, telegram_id, phone, full_name FROM users WHERE telegram_id=?", (tg_id,))
+        cur.row_factory = row_factory(User)
+        cur.execute("SELECT id, telegram_id, phone, full_name, clinic_id FROM users WHERE telegram_id=?", (tg_id,))
         return cur.fetchone()
 
 
 def get_user_by_phone(phone):
     """Возвращает пользователя по номеру телефона."""
-    with connect() as conn:
+    with read_connect(core=True, tables=("users",)) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id, telegram_id, phone, full_name FROM users WHERE phone=?", (phone,))
+        cur.row_factory = row_factory(User)
+        cur.execute("SELECT id, telegram_id, phone, full_name, clinic_id FROM users WHERE phone=?", (phone,))
         return cur.fetchone()
 
 
+def _add_user(cur, telegram_id, phone=None, full_name=None):
+    cur.execute(
+        "INSERT OR IGNORE INTO users (telegram_id, phone, full_name) VALUES (?, ?, ?)",
+        (telegram_id, phone, full_name)
+    )
+    cur.execute("SELECT id FROM users WHERE telegram_id=?", (telegram_id,))
+    return cur.fetchone()[0]
+
+
 def add_user(telegram_id, phone=None, full_name=None):
-    with connect() as conn:
+    with connect(core=True) as conn:
         cur = conn.cursor()
-        cur.execute(
-            "INSERT OR IGNORE INTO users (telegram_id, phone, full_name) VALUES (?, ?, ?)",
-            (telegram_id, phone, full_name)
-        )
+        user_id = _add_user(cur, telegram_id, phone, full_name)
         conn.commit()
-        cur.execute("SELECT id FROM users WHERE telegram_id=?", (telegram_id,))
-        return cur.fetchone()[0]
+        return user_id
+
+
+def _add_pet(cur, user_id, name, species=None, age=None):
+    cur.execute("INSERT INTO pets (user_id, name, species, age) VALUES (?, ?, ?, ?)",
+                (user_id, name, species, age))
+    _emit(cur, PetAdded(cur.lastrowid, user_id))
+    return cur.lastrowid
 
 
 def add_pet(user_id, name, species=None, age=None):
+    with connect(core=True) as conn:
+        cur = conn.cursor()
+        pet_id = _add_pet(cur, user_id, name, species, age)
+        conn.commit()
+        return pet_id
+
+
+def remove_pet(pet_id, user_id):
+    """
+    Удаляет питомца пользователя. Его будущие записи отменяются, как обычная отмена:
+    в филиале пользователя — той же транзакцией, что и удаление, в остальных филиалах —
+    перед ним, транзакцией своего филиала. Возвращает True, если питомец был удалён.
+    """
+    current = _clinic.get()
+    for clinic_id in clinic_ids():
+        if clinic_id == current:
+            continue
+        with use_clinic(clinic_id), connect() as conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            _cancel_pet_appointments(cur, pet_id, user_id)
+            conn.commit()
+
     with connect() as conn:
         cur = conn.cursor()
-        cur.execute("INSERT INTO pets (user_id, name, species, age) VALUES (?, ?, ?, ?)",
-                    (user_id, name, species, age))
+        cur.execute("BEGIN IMMEDIATE")
+        _cancel_pet_appointments(cur, pet_id, user_id)
+        cur.execute("DELETE FROM pets WHERE id=? AND user_id=?", (pet_id, user_id))
+        if not cur.rowcount:
+            conn.rollback()
+            return False
+        _emit(cur, PetDeleted(pet_id, user_id))
+        conn.commit()
+    if current != MAIN_CLINIC:
+        # питомцы — в ядре, а соединение филиала реплику ядра не отслеживает
+        _replica_changed({"pets"})
+    return True
+
+
+def set_user_clinic(user_id, clinic_id):
+    """Закрепляет пользователя за филиалом."""
+    with connect(core=True) as conn:
+        conn.execute("UPDATE users SET clinic_id=? WHERE id=?", (clinic_id, user_id))
         conn.commit()
-        return cur.lastrowid
 
 
 def get_user_pets(user_id):
-    with connect() as conn:
+    with read_connect(core=True, tables=("pets",)) as conn:
         cur = conn.cursor()
+        cur.row_factory = row_factory(Pet)
         cur.execute("SELECT id, name, species, age FROM pets WHERE user_id=? ORDER BY id", (user_id,))
         return cur.fetchall()
 
@@ -93,100 +432,741 @@ def get_user_pets(user_id):
 # =========================
 # Schedule & Booking
 # =========================
-def generate_schedule_for_all_doctors(days_ahead=14, work_start=9, work_end=19):
+def generate_schedule_for_all_doctors(work_start=9, work_end=19, weekdays=range(5)):
     """
-    Генерирует слоты для всех врачей на ближайшие `days_ahead` дней.
-    Врачи работают пн-пт, слоты каждый час: от work_start до work_end-1.
+    Заводит недельный шаблон рабочих часов врачам, у которых его ещё нет.
+    По умолчанию пн-пт, слоты каждый час: от work_start до work_end-1.
+    Сами слоты не материализуются — они вычисляются из шаблона по запросу.
     """
-    today = date.today()
-    end_date = today + timedelta(days=days_ahead)
     with connect() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id FROM doctors")
+        cur.execute("""
+            SELECT id FROM doctors d
+            WHERE NOT EXISTS (SELECT 1 FROM doctor_working_hours wh WHERE wh.doctor_id = d.id)
+        """)
         doctors = [r[0] for r in cur.fetchall()]
         for doctor_id in doctors:
-            current = today
-            while current <= end_date:
-                if current.weekday() < 5:  # пн-пт
-                    iso = current.isoformat()
-                    for h in range(work_start, work_end):
-                        time_str = f"{h:02d}:00"
-                        try:
-                            cur.execute(
-                                "INSERT OR IGNORE INTO schedule (doctor_id, date, time, is_booked) VALUES (?, ?, ?, 0)",
-                                (doctor_id, iso, time_str)
-                            )
-                        except sqlite3.IntegrityError:
-                            pass
-                current += timedelta(days=1)
+            for weekday in weekdays:
+                cur.execute(
+                    "INSERT OR IGNORE INTO doctor_working_hours (doctor_id, weekday, start_time, end_time) "
+                    "VALUES (?, ?, ?, ?)",
+                    (doctor_id, weekday, f"{work_start:02d}:00", f"{work_end:02d}:00")
+                )
+            _refresh_counted_range(cur, doctor_id)
         conn.commit()
 
 
-def cleanup_old_schedule(keep_days=14):
-    """Удаляет старые слоты и оставляет только ближайшие `keep_days` дней."""
-    today = date.today()
-    cutoff = today - timedelta(days=1)
+def set_working_hours(doctor_id, weekday, start_time, end_time, slot_minutes=60):
+    """Добавляет (или заменяет) рабочий интервал врача в недельном шаблоне. weekday: 0 = пн."""
+    _check_slot_grid(start_time, end_time, slot_minutes)
     with connect() as conn:
         cur = conn.cursor()
-        cur.execute("DELETE FROM schedule WHERE date < ?", (cutoff.isoformat(),))
+        cur.execute("""
+            INSERT OR REPLACE INTO doctor_working_hours (doctor_id, weekday, start_time, end_time, slot_minutes)
+            VALUES (?, ?, ?, ?, ?)
+        """, (doctor_id, weekday, start_time, end_time, slot_minutes))
+        _refresh_counted_range(cur, doctor_id)
         conn.commit()
 
 
-def get_available_dates_for_doctor(doctor_id, limit_days=14, limit_dates=14):
-    today = date.today()
-    end_date = today + timedelta(days=limit_days)
+def add_schedule_exception(date_from, date_to, doctor_id=None, kind="off",
+                           start_time=None, end_time=None, slot_minutes=60, note=None):
+    """
+    Исключение из шаблона на период [date_from, date_to]:
+    kind='off' — выходной/отпуск (без времени — весь день), kind='extra' — дополнительные часы.
+    doctor_id=None — для всей клиники (праздник).
+    """
+    if kind == "extra" and start_time and end_time:
+        _check_slot_grid(start_time, end_time, slot_minutes or 60)
     with connect() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT DISTINCT date
-            FROM schedule
-            WHERE doctor_id=? AND is_booked=0 AND date BETWEEN ? AND ?
-            ORDER BY date
-            LIMIT ?
-        """, (doctor_id, today.isoformat(), end_date.isoformat(), limit_dates))
-        return [r[0] for r in cur.fetchall()]
+            INSERT INTO schedule_exceptions (doctor_id, date_from, date_to, kind, start_time, end_time, slot_minutes, note)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (doctor_id, date_from, date_to, kind, start_time, end_time, slot_minutes, note))
+        exception_id = cur.lastrowid
+        _refresh_counted_range(cur, doctor_id, date.fromisoformat(date_from), date.fromisoformat(date_to))
+        conn.commit()
+        return exception_id
 
 
-def get_available_slots_for_doctor_on_date(doctor_id, date_iso):
+def _check_slot_grid(start_time, end_time, slot_minutes):
+    """
+    Интервал и длительность слота должны ложиться на сетку SLOT_GRANULARITY:
+    иначе слоты 10:00 и 10:15 получили бы один бит маски. Бросает ValueError.
+    """
+    for time_str in (start_time, end_time):
+        h, m = map(int, time_str.split(":"))
+        if (h * 60 + m) % SLOT_GRANULARITY:
+            raise ValueError(f"Время {time_str} не кратно {SLOT_GRANULARITY} минутам")
+    if slot_minutes % SLOT_GRANULARITY:
+        raise ValueError(f"Длительность слота {slot_minutes} мин не кратна {SLOT_GRANULARITY} минутам")
+
+
+def _interval_slots(start_time, end_time, slot_minutes):
+    """Времена начала слотов "HH:MM" внутри интервала [start_time, end_time)."""
+    h, m = map(int, start_time.split(":"))
+    start = h * 60 + m
+    h, m = map(int, end_time.split(":"))
+    end = h * 60 + m
+    return [f"{t // 60:02d}:{t % 60:02d}" for t in range(start, end - slot_minutes + 1, slot_minutes)]
+
+
+def _load_templates(cur, doctor_id):
+    """Шаблон врача: {weekday: [(start_time, end_time, slot_minutes), ...]}"""
+    cur.execute("""
+        SELECT weekday, start_time, end_time, slot_minutes
+        FROM doctor_working_hours WHERE doctor_id=?
+    """, (doctor_id,))
+    templates = {}
+    for weekday, start_time, end_time, slot_minutes in cur.fetchall():
+        templates.setdefault(weekday, []).append((start_time, end_time, slot_minutes))
+    return templates
+
+
+def _load_exceptions(cur, doctor_id, start_iso, end_iso):
+    cur.execute("""
+        SELECT date_from, date_to, kind, start_time, end_time, slot_minutes
+        FROM schedule_exceptions
+        WHERE (doctor_id=? OR doctor_id IS NULL) AND date_to >= ? AND date_from <= ?
+    """, (doctor_id, start_iso, end_iso))
+    return cur.fetchall()
+
+
+def _day_slots(day, templates, exceptions):
+    """Все рабочие слоты врача на день `day` с учётом исключений."""
+    day_iso = day.isoformat()
+    slots = set()
+    for start_time, end_time, slot_minutes in templates.get(day.weekday(), []):
+        slots.update(_interval_slots(start_time, end_time, slot_minutes))
+
+    day_exceptions = [e for e in exceptions if e[0] <= day_iso <= e[1]]
+    for _, _, kind, start_time, end_time, slot_minutes in day_exceptions:
+        if kind == "extra" and start_time and end_time:
+            slots.update(_interval_slots(start_time, end_time, slot_minutes or 60))
+    for _, _, kind, start_time, end_time, _ in day_exceptions:
+        if kind == "off":
+            if not (start_time and end_time):
+                return []
+            slots = {t for t in slots if not (start_time <= t < end_time)}
+    return sorted(slots)
+
+
+def _slot_bit(time_str):
+    """Бит слота "HH:MM" в маске дня. Время не на сетке SLOT_GRANULARITY — ValueError."""
+    h, m = map(int, time_str.split(":"))
+    slot, offset = divmod(h * 60 + m, SLOT_GRANULARITY)
+    if offset:
+        raise ValueError(f"Время {time_str} не кратно {SLOT_GRANULARITY} минутам")
+    return 1 << slot
+
+
+def _mask_times(mask):
+    """Времена "HH:MM", отмеченные в маске дня."""
+    times = []
+    while mask:
+        low = mask & -mask
+        minutes = (low.bit_length() - 1) * SLOT_GRANULARITY
+        times.append(f"{minutes // 60:02d}:{minutes % 60:02d}")
+        mask ^= low
+    return times
+
+
+def _booked_times(cur, doctor_id, start_iso, end_iso):
+    """Занятые слоты врача за период: {(date, time), ...}"""
+    if SCHEDULE_STORAGE == "bitmask":
+        cur.execute("""
+            SELECT date, booked_mask FROM schedule_days
+            WHERE doctor_id=? AND date BETWEEN ? AND ? AND booked_mask != 0
+        """, (doctor_id, start_iso, end_iso))
+        return {(d, t) for d, mask in cur.fetchall() for t in _mask_times(mask)}
+
+    cur.execute("""
+        SELECT date, time FROM schedule
+        WHERE doctor_id=? AND is_booked=1 AND start_ts >= ? AND start_ts < ?
+    """, (doctor_id, *_ts_range(start_iso, end_iso)))
+    return set(cur.fetchall())
+
+
+def _held_times(cur, doctor_id, start_iso, end_iso):
+    """Слоты врача за период, удерживаемые мастером записи: {(date, time), ...}"""
+    cur.execute("""
+        SELECT date, time FROM schedule
+        WHERE doctor_id=? AND start_ts >= ? AND start_ts < ? AND held_until > ?
+    """, (doctor_id, *_ts_range(start_iso, end_iso), int(time.time())))
+    return set(cur.fetchall())
+
+
+def _mark_day_mask(cur, doctor_id, date_iso, time_str, booked):
+    """
+    Атомарно ставит/снимает бит слота. False — если бит уже был в нужном состоянии.
+    Вызывается рядом с обновлением строки schedule: маска дублирует is_booked для быстрых чтений.
+    """
+    bit = _slot_bit(time_str)
+    if booked:
+        cur.execute("INSERT OR IGNORE INTO schedule_days (doctor_id, date) VALUES (?, ?)", (doctor_id, date_iso))
+        cur.execute("""
+            UPDATE schedule_days SET booked_mask = booked_mask | ?
+            WHERE doctor_id=? AND date=? AND (booked_mask & ?) = 0
+        """, (bit, doctor_id, date_iso, bit))
+    else:
+        cur.execute("""
+            UPDATE schedule_days SET booked_mask = booked_mask & ~?
+            WHERE doctor_id=? AND date=? AND (booked_mask & ?) != 0
+        """, (bit, doctor_id, date_iso, bit))
+    return cur.rowcount > 0
+
+
+def migrate_schedule_to_bitmask():
+    """Пересобирает schedule_days из занятых строк schedule. Возвращает число врачей-дней."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT doctor_id, date, time FROM schedule WHERE is_booked=1")
+        masks = {}
+        for doctor_id, date_iso, time_str in cur.fetchall():
+            key = (doctor_id, date_iso)
+            masks[key] = masks.get(key, 0) | _slot_bit(time_str)
+        cur.execute("DELETE FROM schedule_days")
+        cur.executemany(
+            "INSERT INTO schedule_days (doctor_id, date, booked_mask) VALUES (?, ?, ?)",
+            [(doctor_id, date_iso, mask) for (doctor_id, date_iso), mask in masks.items()]
+        )
+        conn.commit()
+        return len(masks)
+
+
+def _free_slots_on_days(cur, doctor_id, days, limit_dates=None):
+    """
+    {date_iso: [time, ...]} свободных слотов врача в днях `days` (по возрастанию).
+    Шаблон, исключения и занятость читаются одним запросом на весь период.
+    Прошедшие дни и уже начавшиеся сегодня слоты не возвращаются.
+    """
+    today = clinic_today()
+    days = [day for day in days if day >= today]
+    if not days:
+        return {}
+    start_iso, end_iso = days[0].isoformat(), days[-1].isoformat()
+    templates = _load_templates(cur, doctor_id)
+    exceptions = _load_exceptions(cur, doctor_id, start_iso, end_iso)
+    booked = _booked_times(cur, doctor_id, start_iso, end_iso) | _held_times(cur, doctor_id, start_iso, end_iso)
+
+    result = {}
+    for day in days:
+        iso = day.isoformat()
+        free = [t for t in _day_slots(day, templates, exceptions) if (iso, t) not in booked]
+        if day == today:
+            now = time.time()
+            free = [t for t in free if slot_ts(iso, t) > now]
+        if free:
+            result[iso] = free
+            if limit_dates and len(result) >= limit_dates:
+                break
+    return result
+
+
+def _free_slots_in_range(cur, doctor_id, start_day, end_day, limit_dates=None):
+    """{date_iso: [time, ...]} свободных слотов врача в окне [start_day, end_day]."""
+    days = (start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1))
+    return _free_slots_on_days(cur, doctor_id, days, limit_dates)
+
+
+# === Счётчики свободных слотов по дням ===
+# free_slot_counts: число слотов шаблона минус занятые для каждого врача-дня в горизонте.
+# Бронь, отмена и сверка меняют счётчик в своей транзакции (не триггером: trace callback
+# реплики видит срабатывание триггера как повтор исходного запроса); после смены шаблона
+# или исключений затронутые дни пересчитываются. Удержания и прошедшее время сегодня не
+# учитываются — сегодняшний день и дни без счётчика считаются по подробному расписанию.
+def _adjust_free_count(cur, doctor_id, date_iso, delta):
+    cur.execute(
+        "UPDATE free_slot_counts SET free = free + ? WHERE doctor_id=? AND date=?",
+        (delta, doctor_id, date_iso)
+    )
+
+
+def _count_free_slots(cur, doctor_id, start_day, end_day):
+    """{date_iso: свободно} по шаблону и занятости — эталон для счётчиков."""
+    start_iso, end_iso = start_day.isoformat(), end_day.isoformat()
+    templates = _load_templates(cur, doctor_id)
+    exceptions = _load_exceptions(cur, doctor_id, start_iso, end_iso)
+    booked = _booked_times(cur, doctor_id, start_iso, end_iso)
+    counts = {}
+    for i in range((end_day - start_day).days + 1):
+        day = start_day + timedelta(days=i)
+        iso = day.isoformat()
+        counts[iso] = sum((iso, t) not in booked for t in _day_slots(day, templates, exceptions))
+    return counts
+
+
+def _refresh_free_counts(cur, doctor_ids, start_day, end_day):
+    rows = []
+    for doctor_id in doctor_ids:
+        counts = _count_free_slots(cur, doctor_id, start_day, end_day)
+        rows += [(doctor_id, iso, free) for iso, free in counts.items()]
+    cur.executemany("INSERT OR REPLACE INTO free_slot_counts (doctor_id, date, free) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def _fill_missing_free_counts(cur, doctor_ids, start_day, end_day):
+    """Заводит счётчики только для дней окна, у которых их ещё нет; заведённые не пересчитываются."""
+    start_iso, end_iso = start_day.isoformat(), end_day.isoformat()
+    rows = []
+    for doctor_id in doctor_ids:
+        cur.execute(
+            "SELECT date FROM free_slot_counts WHERE doctor_id=? AND date BETWEEN ? AND ?",
+            (doctor_id, start_iso, end_iso)
+        )
+        counted = {r[0] for r in cur.fetchall()}
+        missing = [
+            day for day in (start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1))
+            if day.isoformat() not in counted
+        ]
+        if missing:
+            counts = _count_free_slots(cur, doctor_id, missing[0], missing[-1])
+            rows += [(doctor_id, iso, free) for iso, free in counts.items() if iso not in counted]
+    cur.executemany("INSERT INTO free_slot_counts (doctor_id, date, free) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def _counted_doctors(cur, doctor_id=None):
+    if doctor_id is not None:
+        return [doctor_id]
+    cur.execute("SELECT id FROM doctors")
+    return [r[0] for r in cur.fetchall()]
+
+
+def refresh_free_slot_counts(days=90, doctor_id=None, missing_only=False):
+    """
+    Пересчитывает счётчики свободных слотов на `days` дней вперёд (все врачи или один)
+    и удаляет счётчики прошедших дней. missing_only=True — только заводит недостающие
+    (новые дни горизонта, новые врачи): заведённые и так меняются вместе с бронью,
+    отменой и шаблоном, а расхождения исправляет сверка. Возвращает число врачей-дней.
+    """
+    today = clinic_today()
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM free_slot_counts WHERE date < ?", (today.isoformat(),))
+        refresh = _fill_missing_free_counts if missing_only else _refresh_free_counts
+        refreshed = refresh(cur, _counted_doctors(cur, doctor_id), today, today + timedelta(days=days))
+        conn.commit()
+        return refreshed
+
+
+def _refresh_counted_range(cur, doctor_id=None, start_day=None, end_day=None):
+    """Пересчитывает уже заведённые счётчики в окне — после смены шаблона или исключений."""
+    start_day = max(start_day or clinic_today(), clinic_today())
+    if end_day is None:
+        cur.execute("SELECT MAX(date) FROM free_slot_counts")
+        last = cur.fetchone()[0]
+        if last is None:
+            return 0
+        end_day = date.fromisoformat(last)
+    if start_day > end_day:
+        return 0
+    return _refresh_free_counts(cur, _counted_doctors(cur, doctor_id), start_day, end_day)
+
+
+def _free_dates(cur, doctor_id, start_day, end_day, limit_dates=None):
+    """
+    Даты со свободными слотами в окне [start_day, end_day]: диапазон по ключу free_slot_counts,
+    не больше одной строки на день. Сегодня и дни без счётчика — по подробному расписанию.
+    """
+    today = clinic_today()
+    start_day = max(start_day, today)
+    if start_day > end_day:
+        return []
+    cur.execute("""
+        SELECT date, free FROM free_slot_counts
+        WHERE doctor_id=? AND date BETWEEN ? AND ?
+    """, (doctor_id, start_day.isoformat(), end_day.isoformat()))
+    counted = {d: free for d, free in cur.fetchall() if d != today.isoformat()}
+
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    detailed = _free_slots_on_days(cur, doctor_id, [day for day in days if day.isoformat() not in counted])
+    dates = [
+        day.isoformat() for day in days
+        if counted.get(day.isoformat(), 0) > 0 or day.isoformat() in detailed
+    ]
+    return dates[:limit_dates] if limit_dates else dates
+
+
+def check_free_slot_counts(fix=True):
+    """
+    Сверяет счётчики свободных слотов с подробным расписанием филиала.
+    Возвращает расхождения [(doctor_id, date, в счётчике, по расписанию)]; fix=True — исправляет их.
+    """
+    today = clinic_today()
+    mismatches = []
     with connect() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT id, time
-            FROM schedule
-            WHERE doctor_id=? AND date=? AND is_booked=0
-            ORDER BY time
-        """, (doctor_id, date_iso))
-        return cur.fetchall()
+            SELECT doctor_id, MAX(date) FROM free_slot_counts
+            WHERE date >= ? GROUP BY doctor_id
+        """, (today.isoformat(),))
+        for doctor_id, last in cur.fetchall():
+            cur.execute("SELECT date, free FROM free_slot_counts WHERE doctor_id=? AND date >= ?",
+                        (doctor_id, today.isoformat()))
+            stored = dict(cur.fetchall())
+            actual = _count_free_slots(cur, doctor_id, today, date.fromisoformat(last))
+            mismatches += [
+                (doctor_id, iso, free, actual[iso]) for iso, free in stored.items() if actual[iso] != free
+            ]
+        if fix and mismatches:
+            cur.executemany(
+                "UPDATE free_slot_counts SET free=? WHERE doctor_id=? AND date=?",
+                [(actual_free, doctor_id, iso) for doctor_id, iso, _, actual_free in mismatches]
+            )
+            conn.commit()
+    return mismatches
+
+
+def cleanup_old_schedule(keep_days=1, batch_size=500):
+    """Убирает прошедшие слоты и записи из рабочих таблиц в архив."""
+    return archive_past_data(keep_days=keep_days, batch_size=batch_size)
+
+
+# =========================
+# Archive / Maintenance
+# =========================
+_SCHEDULE_COLUMNS = "id, doctor_id, date, time, is_booked, start_ts"
+_APPOINTMENT_COLUMNS = (
+    "id, user_id, pet_id, doctor_id, service_id, schedule_id, status, created_at, notified_24h, notified_2h, start_ts"
+)
+
+# Записи на прошедшие даты, а также завершённые и отменённые
+_ARCHIVABLE_APPOINTMENTS = """
+    SELECT a.id
+    FROM appointments a
+    LEFT JOIN schedule sch ON a.schedule_id = sch.id
+    WHERE sch.id IS NULL OR sch.start_ts < ? OR a.status IN ('completed', 'cancelled')
+    LIMIT ?
+"""
+
+# Прошедшие слоты, на которые больше не ссылается ни одна запись
+_ARCHIVABLE_SLOTS = """
+    SELECT sch.id
+    FROM schedule sch
+    WHERE sch.start_ts < ?
+      AND NOT EXISTS (SELECT 1 FROM appointments a WHERE a.schedule_id = sch.id)
+    LIMIT ?
+"""
+
+
+def _archive_batch(conn, select_sql, table, columns, cutoff, batch_size):
+    """Переносит одну пачку строк в `<table>_archive` в отдельной короткой транзакции."""
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(select_sql, (cutoff, batch_size))
+        ids = [r[0] for r in cur.fetchall()]
+        if ids:
+            placeholders = ",".join("?" * len(ids))
+            cur.execute(
+                f"INSERT OR REPLACE INTO {table}_archive ({columns}) "
+                f"SELECT {columns} FROM {table} WHERE id IN ({placeholders})",
+                ids
+            )
+            cur.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(ids)
+
+
+def archive_past_data(keep_days=1, batch_size=500, pause=0.05):
+    """
+    Переносит прошедшие слоты, их маски и завершённые/отменённые записи в архивные таблицы.
+    Работает пачками по `batch_size` строк, между пачками отпускает блокировку записи
+    на `pause` секунд. Возвращает (перенесено_записей, перенесено_слотов).
+    """
+    cutoff_day = clinic_today() - timedelta(days=keep_days)
+    cutoff = day_start_ts(cutoff_day)
+    moved_appointments = moved_slots = 0
+    with connect() as conn:
+        # сначала записи, иначе слоты остаются «занятыми» ссылками на них
+        for select_sql, table, columns in (
+            (_ARCHIVABLE_APPOINTMENTS, "appointments", _APPOINTMENT_COLUMNS),
+            (_ARCHIVABLE_SLOTS, "schedule", _SCHEDULE_COLUMNS),
+        ):
+            while True:
+                moved = _archive_batch(conn, select_sql, table, columns, cutoff, batch_size)
+                if table == "appointments":
+                    moved_appointments += moved
+                else:
+                    moved_slots += moved
+                if moved < batch_size:
+                    break
+                time.sleep(pause)
+        # маски прошедших дней больше не участвуют в поиске свободных слотов — тоже в архив
+        conn.execute(
+            "INSERT OR REPLACE INTO schedule_days_archive (doctor_id, date, booked_mask) "
+            "SELECT doctor_id, date, booked_mask FROM schedule_days WHERE date < ?",
+            (cutoff_day.isoformat(),)
+        )
+        conn.execute("DELETE FROM schedule_days WHERE date < ?", (cutoff_day.isoformat(),))
+        conn.commit()
+    return moved_appointments, moved_slots
+
+
+def compact_database(vacuum_pages=1000):
+    """Возвращает освободившиеся страницы и обновляет статистику планировщика запросов."""
+    with connect() as conn:
+        conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+        conn.execute("ANALYZE schedule")
+        conn.execute("ANALYZE appointments")
+        conn.commit()
+
+
+def get_available_dates_for_doctor(doctor_id, limit_days=14, limit_dates=14):
+    today = clinic_today()
+    end_date = today + timedelta(days=limit_days)
+    with read_connect(tables=_SCHEDULE_TABLES) as conn:
+        cur = conn.cursor()
+        return _free_dates(cur, doctor_id, today, end_date, limit_dates)
+
+
+def get_available_dates_in_range(doctor_id, start_day, end_day):
+    """Даты со свободными слотами врача в окне [start_day, end_day] — для страницы календаря."""
+    with read_connect(tables=_SCHEDULE_TABLES) as conn:
+        cur = conn.cursor()
+        return _free_dates(cur, doctor_id, start_day, end_day)
+
+
+def get_available_slots_for_doctor_on_date(doctor_id, date_iso):
+    """Список свободных времён "HH:MM" врача на дату."""
+    day = date.fromisoformat(date_iso)
+    with read_connect(tables=_SCHEDULE_TABLES) as conn:
+        cur = conn.cursor()
+        return _free_slots_in_range(cur, doctor_id, day, day).get(date_iso, [])
+
+
+def _ensure_slot(cur, doctor_id, date_iso, time_str):
+    day = date.fromisoformat(date_iso)
+    templates = _load_templates(cur, doctor_id)
+    exceptions = _load_exceptions(cur, doctor_id, date_iso, date_iso)
+    if time_str not in _day_slots(day, templates, exceptions):
+        raise ValueError("Слот не найден")
+    cur.execute(
+        "INSERT OR IGNORE INTO schedule (doctor_id, date, time, is_booked, start_ts) VALUES (?, ?, ?, 0, ?)",
+        (doctor_id, date_iso, time_str, slot_ts(date_iso, time_str))
+    )
+    cur.execute("SELECT id FROM schedule WHERE doctor_id=? AND date=? AND time=?", (doctor_id, date_iso, time_str))
+    return cur.fetchone()[0]
+
+
+def ensure_slot(doctor_id, date_iso, time_str):
+    """
+    Материализует слот из шаблона в таблицу schedule (если его там ещё нет) и возвращает его id.
+    В schedule хранятся только выбранные/забронированные слоты.
+    """
+    with connect() as conn:
+        cur = conn.cursor()
+        schedule_id = _ensure_slot(cur, doctor_id, date_iso, time_str)
+        conn.commit()
+        return schedule_id
+
+
+def _book_slot(cur, schedule_id, user_id, pet_id, service_id):
+    cur.execute("SELECT doctor_id, date, time, is_booked, held_by, held_until FROM schedule WHERE id=?", (schedule_id,))
+    row = cur.fetchone()
+    if not row:
+        raise ValueError("Слот не найден")
+    doctor_id, date_iso, time_str, is_booked, held_by, held_until = row
+    if is_booked or (held_by not in (None, user_id) and held_until > time.time()):
+        raise ValueError("Слот уже занят")
+
+    # помечаем слот как забронированный, удержание больше не нужно
+    cur.execute("UPDATE schedule SET is_booked=1, held_by=NULL, held_until=NULL WHERE id=?", (schedule_id,))
+    if SCHEDULE_STORAGE == "bitmask" and not _mark_day_mask(cur, doctor_id, date_iso, time_str, True):
+        raise ValueError("Слот уже занят")
+    _adjust_free_count(cur, doctor_id, date_iso, -1)
+
+    # создаём appointment
+    cur.execute("""
+        INSERT INTO appointments (user_id, pet_id, doctor_id, service_id, schedule_id, status, start_ts)
+        VALUES (?, ?, ?, ?, ?, 'scheduled', ?)
+    """, (user_id, pet_id, doctor_id, service_id, schedule_id, slot_ts(date_iso, time_str)))
+    _emit(cur, AppointmentBooked(cur.lastrowid, user_id, pet_id, doctor_id, date_iso, time_str, _clinic.get()))
+    return cur.lastrowid
 
 
 def book_slot(schedule_id, user_id, pet_id, service_id):
     """Бронирует слот и создаёт запись в appointments."""
     with connect() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT doctor_id, date, time, is_booked FROM schedule WHERE id=?", (schedule_id,))
-        row = cur.fetchone()
-        if not row:
-            raise ValueError("Слот не найден")
-        doctor_id, date_iso, time_str, is_booked = row
-        if is_booked:
-            raise ValueError("Слот уже занят")
+        appointment_id = _book_slot(cur, schedule_id, user_id, pet_id, service_id)
+        conn.commit()
+        return appointment_id
 
-        # помечаем слот как забронированный
-        cur.execute("UPDATE schedule SET is_booked=1 WHERE id=?", (schedule_id,))
 
-        # создаём appointment
-        cur.execute("""
-            INSERT INTO appointments (user_id, pet_id, doctor_id, service_id, schedule_id, status)
-            VALUES (?, ?, ?, ?, ?, 'scheduled')
-        """, (user_id, pet_id, doctor_id, service_id, schedule_id))
-        appointment_id = cur.lastrowid
+def find_series_slots(service_id, start_date, interval_days, count, doctor_id=None,
+                      preferred_time=None, window_days=2):
+    """
+    Подбирает слоты для курса из `count` визитов каждые `interval_days` дней, начиная со `start_date`.
+    Визит можно сдвинуть вперёд не более чем на `window_days` дней. Свободные слоты врача
+    читаются одним запросом на все визиты курса. Сначала ищется серия у одного врача
+    (doctor_id или любой врач услуги), затем — визиты у разных врачей услуги.
+    Возвращает [Slot, ...] или None, если курс целиком не подобрать.
+    """
+    start_day = date.fromisoformat(start_date) if isinstance(start_date, str) else start_date
+    visit_days = [start_day + timedelta(days=interval_days * k) for k in range(count)]
+    window = sorted({day + timedelta(days=shift) for day in visit_days for shift in range(window_days + 1)})
+
+    with read_connect(tables=("doctor_services", *_SCHEDULE_TABLES)) as conn:
+        cur = conn.cursor()
+        if doctor_id is None:
+            cur.execute("SELECT doctor_id FROM doctor_services WHERE service_id = ? ORDER BY doctor_id", (service_id,))
+            doctor_ids = [r[0] for r in cur.fetchall()]
+        else:
+            doctor_ids = [doctor_id]
+
+        free_by_doctor = {}
+
+        def pick(d_id, visit_day):
+            if d_id not in free_by_doctor:
+                free_by_doctor[d_id] = _free_slots_on_days(cur, d_id, window)
+            for shift in range(window_days + 1):
+                day_iso = (visit_day + timedelta(days=shift)).isoformat()
+                times = free_by_doctor[d_id].get(day_iso)
+                if times:
+                    return Slot(d_id, day_iso, preferred_time if preferred_time in times else times[0])
+            return None
+
+        for d_id in doctor_ids:
+            plan = []
+            for day in visit_days:
+                slot = pick(d_id, day)
+                if slot is None:
+                    break
+                plan.append(slot)
+            else:
+                return plan
+
+        plan = []
+        for day in visit_days:
+            slot = next(filter(None, (pick(d_id, day) for d_id in doctor_ids)), None)
+            if slot is None:
+                return None
+            plan.append(slot)
+        return plan
+
+
+def book_series(user_id, pet_id, service_id, slots):
+    """
+    Бронирует все визиты курса [(doctor_id, date, time), ...] одной транзакцией:
+    либо создаются все записи, либо ни одной (ValueError). Возвращает id записей.
+    """
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            appointment_ids = []
+            for doctor_id, date_iso, time_str in slots:
+                schedule_id = _ensure_slot(cur, doctor_id, date_iso, time_str)
+                appointment_ids.append(_book_slot(cur, schedule_id, user_id, pet_id, service_id))
+        except ValueError:
+            conn.rollback()
+            raise
         conn.commit()
-        return appointment_id
+        return appointment_ids
+
 
+def _hold_slot(cur, schedule_id, user_id, held_until):
+    cur.execute("SELECT is_booked, held_by, held_until FROM schedule WHERE id=?", (schedule_id,))
+    is_booked, held_by, current_until = cur.fetchone()
+    if is_booked:
+        raise ValueError("Слот уже занят")
+    if held_by not in (None, user_id) and current_until > time.time():
+        raise ValueError("Это время уже выбрал другой клиент")
+    cur.execute("UPDATE schedule SET held_by=?, held_until=? WHERE id=?", (user_id, held_until, schedule_id))
 
-def get_user_appointments(user_id):
+
+def hold_slot(doctor_id, date_iso, time_str, user_id, ttl_seconds=600):
+    """
+    Удерживает слот за пользователем на `ttl_seconds`, пока он заполняет запись.
+    Прежнее удержание этого пользователя снимается. Возвращает (schedule_id, held_until).
+    """
+    held_until = int(time.time()) + ttl_seconds
     with connect() as conn:
         cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            schedule_id = _ensure_slot(cur, doctor_id, date_iso, time_str)
+            _hold_slot(cur, schedule_id, user_id, held_until)
+        except ValueError:
+            conn.rollback()
+            raise
+
+        cur.execute(
+            "UPDATE schedule SET held_by=NULL, held_until=NULL WHERE held_by=? AND id != ?",
+            (user_id, schedule_id)
+        )
+        conn.commit()
+        return schedule_id, held_until
+
+
+def release_hold(schedule_id, user_id):
+    """Снимает удержание слота пользователем. True — если удержание было."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE schedule SET held_by=NULL, held_until=NULL WHERE id=? AND held_by=? AND is_booked=0",
+            (schedule_id, user_id)
+        )
+        conn.commit()
+        return cur.rowcount > 0
+
+
+def get_active_holds():
+    """Действующие удержания [(held_until, schedule_id)] — для очереди истечения после перезапуска."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT held_until, id FROM schedule WHERE held_until IS NOT NULL")
+        return cur.fetchall()
+
+
+def expire_holds(holds):
+    """
+    Снимает истёкшие удержания [(held_until, schedule_id)], если они не продлены и не стали записью.
+    Возвращает освободившиеся слоты [Slot].
+    """
+    freed = []
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        for held_until, schedule_id in holds:
+            cur.execute(
+                "SELECT doctor_id, date, time FROM schedule WHERE id=? AND held_until=? AND is_booked=0",
+                (schedule_id, held_until)
+            )
+            slot = cur.fetchone()
+            if not slot:
+                continue
+            cur.execute("UPDATE schedule SET held_by=NULL, held_until=NULL WHERE id=?", (schedule_id,))
+            freed.append(Slot(*slot))
+        conn.commit()
+    return freed
+
+
+def _mark_notified(cur, appointment_id, kind):
+    if kind == "24h":
+        cur.execute("UPDATE appointments SET notified_24h = 1 WHERE id = ?", (appointment_id,))
+    elif kind == "2h":
+        cur.execute("UPDATE appointments SET notified_2h = 1 WHERE id = ?", (appointment_id,))
+
+
+def mark_notified(appointment_id: int, kind: str):
+    """Отмечает отправленное напоминание ("24h" или "2h")."""
+    with connect() as conn:
+        _mark_notified(conn.cursor(), appointment_id, kind)
+        conn.commit()
+
+
+def get_user_appointments(user_id, from_ts=0):
+    """Действующие записи пользователя, начинающиеся не раньше from_ts (unix-время)."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.row_factory = row_factory(Appointment)
         cur.execute("""
             SELECT a.id, s.name, d.full_name, sch.date, sch.time, a.status, p.name
             FROM appointments a
@@ -194,43 +1174,98 @@ def get_user_appointments(user_id):
             JOIN doctors d ON a.doctor_id = d.id
             JOIN schedule sch ON a.schedule_id = sch.id
             JOIN pets p ON a.pet_id = p.id
-            WHERE a.user_id = ?
-            ORDER BY sch.date, sch.time
-        """, (user_id,))
+            WHERE a.user_id = ? AND a.status != 'cancelled' AND a.start_ts >= ?
+            ORDER BY a.start_ts
+        """, (user_id, from_ts))
         return cur.fetchall()
 
 
-def cancel_appointment(appointment_id: int, free_slot: bool = False) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    try:
-        # Сначала получаем schedule_id этой записи
-        cur.execute("SELECT schedule_id FROM appointments WHERE id = ?", (appointment_id,))
-        result = cur.fetchone()
-        if not result:
-            return False
-        schedule_id = result[0]
+def _cancel_appointment(cur, appointment_id, user_id=None):
+    cur.execute("""
+        SELECT a.schedule_id, sch.doctor_id, sch.date, sch.time, a.user_id
+        FROM appointments a JOIN schedule sch ON a.schedule_id = sch.id
+        WHERE a.id = ? AND a.status = 'scheduled'
+    """, (appointment_id,))
+    row = cur.fetchone()
+    if not row or (user_id is not None and row[4] != user_id):
+        return None
+    schedule_id, doctor_id, date_iso, time_str, owner_id = row
 
-        # Удаляем запись
-        cur.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+    cur.execute("UPDATE appointments SET status = 'cancelled' WHERE id = ?", (appointment_id,))
+    cur.execute("UPDATE schedule SET is_booked = 0 WHERE id = ?", (schedule_id,))
+    if SCHEDULE_STORAGE == "bitmask":
+        _mark_day_mask(cur, doctor_id, date_iso, time_str, False)
+    _adjust_free_count(cur, doctor_id, date_iso, 1)
+    _emit(cur, AppointmentCancelled(appointment_id, owner_id, doctor_id, date_iso, time_str, _clinic.get()))
+    return schedule_id, doctor_id, date_iso, time_str
 
-        # Освобождаем слот, если нужно
-        if free_slot:
-            cur.execute("UPDATE schedule SET is_booked = 0 WHERE id = ?", (schedule_id,))
 
+def cancel_appointment(appointment_id: int, user_id: int = None):
+    """
+    Отменяет запись одной транзакцией: статус 'cancelled', слот освобождается
+    (вместе с маской дня в режиме bitmask). user_id — проверка, что запись принадлежит пользователю.
+    Возвращает освобождённый слот (schedule_id, doctor_id, date, time) или None, если отменять нечего.
+    """
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        freed = _cancel_appointment(cur, appointment_id, user_id)
+        if freed is None:
+            conn.rollback()
+            return None
         conn.commit()
-        return True
-    except Exception as e:
-        print("Ошибка при отмене записи:", e)
-        return False
-    finally:
-        conn.close()
+        return freed
+
+
+def _cancel_pet_appointments(cur, pet_id, user_id):
+    """Отменяет будущие записи питомца пользователя в филиале курсора. Возвращает их число."""
+    cur.execute("""
+        SELECT id FROM appointments
+        WHERE pet_id = ? AND user_id = ? AND status = 'scheduled' AND start_ts >= ?
+    """, (pet_id, user_id, int(time.time())))
+    appointment_ids = [r[0] for r in cur.fetchall()]
+    for appointment_id in appointment_ids:
+        _cancel_appointment(cur, appointment_id)
+    return len(appointment_ids)
+
+
+def reconcile_booked_slots(batch_size=500):
+    """
+    Освобождает слоты, помеченные занятыми, на которые не ссылается ни одна действующая запись
+    (последствия старых отмен без освобождения слота). Возвращает число освобождённых слотов.
+    """
+    freed = 0
+    with connect() as conn:
+        cur = conn.cursor()
+        while True:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("""
+                SELECT sch.id, sch.doctor_id, sch.date, sch.time
+                FROM schedule sch
+                WHERE sch.is_booked = 1
+                  AND NOT EXISTS (
+                      SELECT 1 FROM appointments a WHERE a.schedule_id = sch.id AND a.status = 'scheduled'
+                  )
+                LIMIT ?
+            """, (batch_size,))
+            rows = cur.fetchall()
+            cur.executemany("UPDATE schedule SET is_booked = 0 WHERE id = ?", [(r[0],) for r in rows])
+            if SCHEDULE_STORAGE == "bitmask":
+                for _, doctor_id, date_iso, time_str in rows:
+                    _mark_day_mask(cur, doctor_id, date_iso, time_str, False)
+            for _, doctor_id, date_iso, _ in rows:
+                _adjust_free_count(cur, doctor_id, date_iso, 1)
+            conn.commit()
+            freed += len(rows)
+            if len(rows) < batch_size:
+                return freed
 
 
 def get_doctors_by_service(service_id):
     """Возвращает список врачей, которые делают выбранную услугу"""
-    with connect() as conn:
+    with read_connect(tables=("doctors", "doctor_services")) as conn:
         cur = conn.cursor()
+        cur.row_factory = row_factory(Doctor)
         cur.execute("""
             SELECT DISTINCT d.id, d.full_name, d.specialty
             FROM doctors d
@@ -238,4 +1273,318 @@ def get_doctors_by_service(service_id):
             WHERE ds.service_id = ?
             ORDER BY d.full_name
         """, (service_id,))
-        return cur.fetchall()
\ No newline at end of file
+        return cur.fetchall()
+
+
+# =========================
+# Write batches
+# =========================
+def run_write_batch(ops):
+    """
+    Выполняет операции записи [(fn, args), ...] одной транзакцией с одним COMMIT.
+    fn(cur, *args) — функции уровня курсора (_book_slot, _add_user, ...). Каждая операция —
+    в своей точке сохранения: ошибка откатывает только её. Возвращает [(результат, ошибка), ...].
+    """
+    results = []
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        for fn, args in ops:
+            cur.execute("SAVEPOINT op")
+            emitted = len(conn.events)
+            try:
+                results.append((fn(cur, *args), None))
+                cur.execute("RELEASE op")
+            except Exception as e:
+                cur.execute("ROLLBACK TO op")
+                cur.execute("RELEASE op")
+                del conn.events[emitted:]
+                results.append((None, e))
+        conn.commit()
+    return results
+
+
+# =========================
+# Scheduled jobs
+# =========================
+def acquire_job_lock(name, worker_id, lease_seconds):
+    """
+    Захватывает задание `name` за процессом worker_id на `lease_seconds` секунд.
+    False — если задание уже выполняет другой процесс и его аренда не истекла.
+    """
+    now = time.time()
+    with connect(core=True) as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT OR IGNORE INTO job_locks (name) VALUES (?)", (name,))
+        cur.execute("""
+            UPDATE job_locks SET locked_by = ?, locked_until = ?, last_started_at = ?
+            WHERE name = ? AND (locked_until IS NULL OR locked_until < ?)
+        """, (worker_id, now + lease_seconds, now, name, now))
+        conn.commit()
+        return cur.rowcount > 0
+
+
+def release_job_lock(name, worker_id, status, duration):
+    """Снимает блокировку задания и сохраняет итог запуска."""
+    with connect(core=True) as conn:
+        conn.execute("""
+            UPDATE job_locks
+            SET locked_by = NULL, locked_until = NULL, last_finished_at = ?, last_status = ?, last_duration = ?,
+                runs = runs + 1, failures = failures + ?
+            WHERE name = ? AND locked_by = ?
+        """, (time.time(), status, duration, 1 if status != "ok" else 0, name, worker_id))
+        conn.commit()
+
+
+# =========================
+# Waitlist
+# =========================
+def add_to_waitlist(user_id, pet_id, service_id, doctor_id=None, days_ahead=14):
+    """
+    Ставит питомца в лист ожидания на услугу на ближайшие `days_ahead` дней.
+    doctor_id=None — подойдёт любой врач, оказывающий услугу. Возвращает id заявки.
+    """
+    today = clinic_today()
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO waitlist (user_id, pet_id, service_id, doctor_id, date_from, date_to)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, pet_id, service_id, doctor_id, today.isoformat(), (today + timedelta(days=days_ahead)).isoformat()))
+        conn.commit()
+        return cur.lastrowid
+
+
+def _best_waitlist_entry(cur, service_ids, doctor_id, date_iso):
+    """Самая ранняя ожидающая заявка, которой подходит слот врача на дату."""
+    best = None
+    for service_id in service_ids:
+        for wanted_doctor in (doctor_id, None):
+            cur.execute("""
+                SELECT queued_at, id, service_id, user_id FROM waitlist
+                WHERE status = 'waiting' AND service_id = ? AND doctor_id IS ? AND date_from <= ? AND date_to >= ?
+                ORDER BY queued_at, id
+                LIMIT 1
+            """, (service_id, wanted_doctor, date_iso, date_iso))
+            row = cur.fetchone()
+            if row and (best is None or row < best):
+                best = row
+    return best
+
+
+def match_waitlist(slots, offer_minutes=15):
+    """
+    Раздаёт свободные слоты [(doctor_id, date, time), ...] ожидающим заявкам одной транзакцией.
+    Слот, который уже занят или уже кому-то предложен, пропускается. Предложенный слот
+    удерживается за пользователем заявки до конца срока ответа, чтобы его не заняли другие.
+    Возвращает предложения: [(waitlist_id, telegram_id, pet_name, doctor_name, service_name, date, time, expires_ts)],
+    expires_ts — срок ответа в unix-времени.
+    """
+    expires_ts = int(time.time()) + offer_minutes * 60
+    offered_ids = []
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT offer_doctor_id, offer_date, offer_time FROM waitlist WHERE status = 'offered'")
+        offered = set(cur.fetchall())
+        services_by_doctor = {}
+        free_by_day = {}
+
+        for slot in sorted(set(slots), key=lambda s: (s[1], s[2])):
+            doctor_id, date_iso, time_str = slot
+            if slot in offered:
+                continue
+            if (doctor_id, date_iso) not in free_by_day:
+                day = date.fromisoformat(date_iso)
+                free_by_day[(doctor_id, date_iso)] = set(_free_slots_in_range(cur, doctor_id, day, day).get(date_iso, []))
+            if time_str not in free_by_day[(doctor_id, date_iso)]:
+                continue
+            if doctor_id not in services_by_doctor:
+                cur.execute("SELECT service_id FROM doctor_services WHERE doctor_id = ?", (doctor_id,))
+                services_by_doctor[doctor_id] = [r[0] for r in cur.fetchall()]
+
+            entry = _best_waitlist_entry(cur, services_by_doctor[doctor_id], doctor_id, date_iso)
+            if entry is None:
+                continue
+            _hold_slot(cur, _ensure_slot(cur, doctor_id, date_iso, time_str), entry[3], expires_ts)
+            cur.execute("""
+                UPDATE waitlist
+                SET status = 'offered', offer_doctor_id = ?, offer_date = ?, offer_time = ?, offer_expires_ts = ?
+                WHERE id = ?
+            """, (doctor_id, date_iso, time_str, expires_ts, entry[1]))
+            offered.add(slot)
+            offered_ids.append(entry[1])
+        conn.commit()
+
+        if not offered_ids:
+            return []
+        placeholders = ",".join("?" * len(offered_ids))
+        cur.execute(f"""
+            SELECT w.id, u.telegram_id, p.name, d.full_name, s.name, w.offer_date, w.offer_time, w.offer_expires_ts
+            FROM waitlist w
+            JOIN users u ON w.user_id = u.id
+            JOIN pets p ON w.pet_id = p.id
+            JOIN doctors d ON w.offer_doctor_id = d.id
+            JOIN services s ON w.service_id = s.id
+            WHERE w.id IN ({placeholders})
+        """, offered_ids)
+        return cur.fetchall()
+
+
+def find_waitlist_slots(limit=200):
+    """
+    Ближайший свободный слот для каждой ожидающей заявки — чтобы предложить и слоты,
+    появившиеся не из отмен (новые рабочие часы, доп. часы). Возвращает [Slot].
+    """
+    today = clinic_today()
+    slots = set()
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT service_id, doctor_id, date_from, date_to FROM waitlist
+            WHERE status = 'waiting' AND date_to >= ?
+            LIMIT ?
+        """, (today.isoformat(), limit))
+        searched = set()
+        for service_id, doctor_id, date_from, date_to in cur.fetchall():
+            if doctor_id is None:
+                cur.execute("SELECT doctor_id FROM doctor_services WHERE service_id = ?", (service_id,))
+                doctor_ids = [r[0] for r in cur.fetchall()]
+            else:
+                doctor_ids = [doctor_id]
+            start_day = max(today, date.fromisoformat(date_from))
+            end_day = date.fromisoformat(date_to)
+            for d_id in doctor_ids:
+                if (d_id, start_day, end_day) in searched:
+                    continue
+                searched.add((d_id, start_day, end_day))
+                for date_iso, times in _free_slots_in_range(cur, d_id, start_day, end_day, limit_dates=1).items():
+                    slots.add(Slot(d_id, date_iso, times[0]))
+    return list(slots)
+
+
+def take_waitlist_offer(waitlist_id, user_id):
+    """Бронирует предложенный слот одной транзакцией. Возвращает id записи или бросает ValueError."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            SELECT pet_id, service_id, offer_doctor_id, offer_date, offer_time, offer_expires_ts
+            FROM waitlist WHERE id = ? AND user_id = ? AND status = 'offered'
+        """, (waitlist_id, user_id))
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            raise ValueError("Предложение больше не действует")
+        pet_id, service_id, doctor_id, date_iso, time_str, expires_ts = row
+        if expires_ts < time.time():
+            conn.rollback()
+            raise ValueError("Время на ответ истекло")
+        try:
+            schedule_id = _ensure_slot(cur, doctor_id, date_iso, time_str)
+            appointment_id = _book_slot(cur, schedule_id, user_id, pet_id, service_id)
+        except ValueError:
+            conn.rollback()
+            raise
+        cur.execute("UPDATE waitlist SET status = 'booked' WHERE id = ?", (waitlist_id,))
+        conn.commit()
+        return appointment_id
+
+
+def _release_offer_hold(cur, user_id, slot, expires_ts):
+    """Снимает удержание предложенного слота, если оно всё ещё то самое и не стало записью."""
+    cur.execute("""
+        UPDATE schedule SET held_by=NULL, held_until=NULL
+        WHERE doctor_id=? AND date=? AND time=? AND held_by=? AND held_until=? AND is_booked=0
+    """, (*slot, user_id, expires_ts))
+
+
+def decline_waitlist_offer(waitlist_id, user_id):
+    """Отказ от предложения: заявка закрывается. Возвращает освободившийся Slot или None."""
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT offer_doctor_id, offer_date, offer_time, offer_expires_ts FROM waitlist
+            WHERE id = ? AND user_id = ? AND status = 'offered'
+        """, (waitlist_id, user_id))
+        row = cur.fetchone()
+        if not row:
+            return None
+        slot = Slot(*row[:3])
+        cur.execute("UPDATE waitlist SET status = 'declined' WHERE id = ?", (waitlist_id,))
+        _release_offer_hold(cur, user_id, slot, row[3])
+        conn.commit()
+        return slot
+
+
+def expire_waitlist_offers():
+    """
+    Просроченные предложения возвращает в очередь (в конец) и снимает удержание их слотов,
+    заявки с прошедшим периодом закрывает. Возвращает слоты просроченных предложений для повторной раздачи.
+    """
+    with connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            SELECT id, offer_doctor_id, offer_date, offer_time, user_id, offer_expires_ts FROM waitlist
+            WHERE status = 'offered' AND offer_expires_ts < ?
+        """, (int(time.time()),))
+        rows = cur.fetchall()
+        for _, doctor_id, date_iso, time_str, user_id, expires_ts in rows:
+            _release_offer_hold(cur, user_id, (doctor_id, date_iso, time_str), expires_ts)
+        cur.executemany("""
+            UPDATE waitlist
+            SET status = 'waiting', queued_at = CURRENT_TIMESTAMP,
+                offer_doctor_id = NULL, offer_date = NULL, offer_time = NULL, offer_expires_ts = NULL
+            WHERE id = ?
+        """, [(r[0],) for r in rows])
+        cur.execute(
+            "UPDATE waitlist SET status = 'expired' WHERE status = 'waiting' AND date_to < ?",
+            (clinic_today().isoformat(),)
+        )
+        conn.commit()
+        return [Slot(*r[1:4]) for r in rows]
+
+
+# =========================
+# Doctor agenda
+# =========================
+def set_doctor_telegram_id(doctor_id, telegram_id):
+    """Привязывает врача к аккаунту Telegram: ему приходит утренняя сводка и доступна /agenda."""
+    with connect() as conn:
+        conn.execute("UPDATE doctors SET telegram_id=? WHERE id=?", (telegram_id, doctor_id))
+        conn.commit()
+
+
+def get_doctor_by_telegram_id(telegram_id):
+    with read_connect(tables=("doctors",)) as conn:
+        cur = conn.cursor()
+        cur.row_factory = row_factory(Doctor)
+        cur.execute("SELECT id, full_name, specialty FROM doctors WHERE telegram_id=?", (telegram_id,))
+        return cur.fetchone()
+
+
+def get_agenda_recipients():
+    """Врачи филиала с привязанным Telegram: [(telegram_id, Doctor)]."""
+    with read_connect(tables=("doctors",)) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT telegram_id, id, full_name, specialty FROM doctors WHERE telegram_id IS NOT NULL")
+        return [(row[0], Doctor(*row[1:])) for row in cur.fetchall()]
+
+
+def get_doctor_agenda(doctor_id, day):
+    """Записи врача на день по порядку — один запрос по индексу (doctor_id, start_ts)."""
+    with read_connect(tables=("appointments", "schedule", "services", "pets", "users")) as conn:
+        cur = conn.cursor()
+        cur.row_factory = row_factory(AgendaItem)
+        cur.execute("""
+            SELECT a.id, sch.time, s.name, s.duration, p.name, p.species, u.full_name, u.phone
+            FROM appointments a
+            JOIN schedule sch ON a.schedule_id = sch.id
+            JOIN services s ON a.service_id = s.id
+            LEFT JOIN pets p ON a.pet_id = p.id
+            LEFT JOIN users u ON a.user_id = u.id
+            WHERE a.doctor_id = ? AND a.status = 'scheduled' AND a.start_ts >= ? AND a.start_ts < ?
+            ORDER BY a.start_ts
+        """, (doctor_id, day_start_ts(day), day_start_ts(day + timedelta(days=1))))
+        return cur.fetchall()
@@ -0,0 +1,70 @@
+# db/rows.py
+"""
+Типизированные строки результатов запросов. Это NamedTuple (у экземпляров __slots__ = (),
+без __dict__): неизменяемы, поэтому их можно кэшировать и передавать между подсистемами,
+а распаковка и доступ по индексу работают как у обычных кортежей.
+"""
+from functools import cache
+from typing import NamedTuple, Optional
+
+
+class User(NamedTuple):
+    id: int
+    telegram_id: int
+    phone: Optional[str]
+    full_name: Optional[str]
+    clinic_id: Optional[str]  # None — филиал ещё не выбран
+
+
+class Pet(NamedTuple):
+    id: int
+    name: str
+    species: Optional[str]
+    age: Optional[str]
+
+
+class Doctor(NamedTuple):
+    id: int
+    full_name: str
+    specialty: Optional[str]
+
+
+class Service(NamedTuple):
+    id: int
+    name: str
+    duration: int
+    price: Optional[float]
+
+
+class Slot(NamedTuple):
+    doctor_id: int
+    date: str
+    time: str
+
+
+class Appointment(NamedTuple):
+    id: int
+    service_name: str
+    doctor_name: str
+    date: str
+    time: str
+    status: str
+    pet_name: str
+
+
+class AgendaItem(NamedTuple):
+    appointment_id: int
+    time: str
+    service_name: str
+    duration: int
+    pet_name: Optional[str]  # None — питомца уже удалили
+    species: Optional[str]
+    owner_name: Optional[str]
+    phone: Optional[str]
+
+
+@cache
+def row_factory(cls):
+    """row_factory для курсора: строка sqlite3 сразу становится cls, без разбора аргументов конструктора."""
+    new = tuple.__new__
+    return lambda cursor, row: new(cls, row)
@@ -0,0 +1,75 @@
+import logging
+
+from aiogram import Router, F
+from aiogram.types import Message
+
+from db.db_utils import (
+    clinic_ids,
+    use_clinic,
+    clinic_today,
+    get_doctor_by_telegram_id,
+    get_agenda_recipients,
+    get_doctor_agenda
+)
+from handlers.screen import RenderCache
+from services.sender import broadcast_sender
+
+router = Router()
+
+# Расписание врача на сегодня: ключ — (филиал, врач), тег — дата; сбрасывается событиями записи и отмены
+agenda_screens = RenderCache(max_entries=2000, name="Кэш расписаний врачей")
+
+
+def _render_agenda(doctor, day):
+    items = get_doctor_agenda(doctor.id, day)
+    header = f"🩺 <b>Расписание на {day.strftime('%d.%m.%Y')}</b>\n👩‍⚕️ {doctor.full_name}\n\n"
+    if not items:
+        return header + "Записей на сегодня нет."
+
+    text_parts = []
+    for item in items:
+        pet = f"{item.pet_name} ({item.species or 'вид не указан'})" if item.pet_name else "питомец удалён"
+        owner = " ".join(filter(None, (item.owner_name, item.phone))) or "—"
+        text_parts.append(
+            f"🕓 <b>{item.time}</b> — {item.service_name} ({item.duration} мин)\n"
+            f"🐾 {pet}\n"
+            f"👤 {owner}"
+        )
+    return header + "\n\n".join(text_parts) + f"\n\n<i>Всего записей: {len(items)}</i>"
+
+
+def agenda_text(clinic_id, doctor):
+    """Расписание врача на сегодня — из кэша или одним запросом к БД филиала."""
+    today = clinic_today()
+    with use_clinic(clinic_id):
+        return agenda_screens.get_or_render((clinic_id, doctor.id), "agenda", lambda: _render_agenda(doctor, today), tag=today)
+
+
+def _find_doctor(telegram_id):
+    for clinic_id in clinic_ids():
+        with use_clinic(clinic_id):
+            doctor = get_doctor_by_telegram_id(telegram_id)
+        if doctor:
+            return clinic_id, doctor
+    return None, None
+
+
+# === Расписание по запросу ===
+@router.message(F.text == "/agenda")
+async def show_agenda(message: Message):
+    clinic_id, doctor = _find_doctor(message.from_user.id)
+    if not doctor:
+        await message.answer("⛔ Команда доступна только врачам клиники.")
+        return
+    await message.answer(agenda_text(clinic_id, doctor), parse_mode="HTML")
+
+
+# === Утренняя сводка всем врачам (задание планировщика) ===
+async def send_agenda_digest(bot):
+    messages = []
+    for clinic_id in clinic_ids():
+        with use_clinic(clinic_id):
+            recipients = get_agenda_recipients()
+        messages += [(telegram_id, agenda_text(clinic_id, doctor)) for telegram_id, doctor in recipients]
+    delivered = await broadcast_sender.send_many(bot, messages, parse_mode="HTML")
+    logging.info(f"🩺 Расписание на день отправлено врачам: {delivered} из {len(messages)}")
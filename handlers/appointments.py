@@ -1,8 +1,16 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from datetime import date
-from db.db_utils import get_user_by_telegram_id, get_user_appointments, cancel_appointment
+from db.db_utils import (
+    get_user_by_telegram_id,
+    get_user_appointments,
+    cancel_appointment,
+    clinic_today,
+    day_start_ts
+)
 from handlers.common import main_menu_inline
+from handlers.screen import show_screen, rendered_screens
+from handlers.webhook_reply import answer_callback
+from handlers.callbacks import callback_routes, CancelAppointmentCallback
 
 router = Router()
 
@@ -11,92 +19,84 @@ router = Router()
 def appointments_kb(appointments):
     buttons = []
     for a in appointments:
-        appointment_id = a[0]
-        buttons.append([InlineKeyboardButton(text=f"❌ Отменить: {a[6]} ({a[3]} {a[4]})", callback_data=f"cancel_appointment_{appointment_id}")])
+        buttons.append([InlineKeyboardButton(text=f"❌ Отменить: {a.pet_name} ({a.date} {a.time})", callback_data=CancelAppointmentCallback(appointment_id=a.id).pack())])
     buttons.append([InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-# --- Показать актуальные записи ---
-@router.callback_query(F.data == "my_appointments")
-async def show_my_appointments(callback: CallbackQuery):
-    user = get_user_by_telegram_id(callback.from_user.id)
-    if not user:
-        await callback.message.answer("❗ Вы не зарегистрированы. Введите /start.")
-        await callback.answer()
-        return
-
-    appointments = get_user_appointments(user[0])
-    today_iso = date.today().isoformat()
-
-    # Фильтруем актуальные (сегодня и будущие)
-    upcoming = [a for a in appointments if a[3] >= today_iso]
-
+def _render_appointments(user_id, today):
+    # Актуальные (сегодня и будущие) — диапазоном по start_ts
+    upcoming = get_user_appointments(user_id, from_ts=day_start_ts(today))
     if not upcoming:
-        await callback.message.edit_text(
-            "📅 У вас нет актуальных записей.",
-            reply_markup=main_menu_inline()
-        )
-        await callback.answer()
-        return
+        return None
 
     # Собираем все записи в одно сообщение
     text_parts = []
     for a in upcoming:
-        appointment_id, service_name, doctor_name, appt_date, appt_time, status, pet_name = a
         text_parts.append(
-            f"🐾 <b>{pet_name}</b>\n"
-            f"👩‍⚕️ <b>{doctor_name}</b>\n"
-            f"🧾 {service_name}\n"
-            f"📅 {appt_date} — {appt_time}\n"
-            f"📌 Статус: <i>{status}</i>\n"
+            f"🐾 <b>{a.pet_name}</b>\n"
+            f"👩‍⚕️ <b>{a.doctor_name}</b>\n"
+            f"🧾 {a.service_name}\n"
+            f"📅 {a.date} — {a.time}\n"
+            f"📌 Статус: <i>{a.status}</i>\n"
             "────────────────────"
         )
-
     text = "📋 <b>Ваши актуальные записи:</b>\n\n" + "\n\n".join(text_parts)
+    return text, appointments_kb(upcoming)
 
-    await callback.message.edit_text(
-        text,
-        reply_markup=appointments_kb(upcoming),
-        parse_mode="HTML"
+
+def appointments_screen(user_id):
+    """(текст, клавиатура) «Моих записей» или None, если актуальных записей нет. Кэшируется до конца дня."""
+    today = clinic_today()
+    return rendered_screens.get_or_render(
+        user_id, "appointments", lambda: _render_appointments(user_id, today), tag=today
     )
 
-    await callback.answer()
+
+# --- Показать актуальные записи ---
+@callback_routes.register(router, "my_appointments")
+async def show_my_appointments(callback: CallbackQuery):
+    await answer_callback(callback)
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.message.answer("❗ Вы не зарегистрированы. Введите /start.")
+        return
+
+    screen = appointments_screen(user.id)
+    if not screen:
+        await show_screen(
+            callback,
+            "📅 У вас нет актуальных записей.",
+            reply_markup=main_menu_inline()
+        )
+        return
+
+    text, kb = screen
+    await show_screen(callback, text, reply_markup=kb, parse_mode="HTML")
 
 
 # --- Обработка отмены записи ---
-@router.callback_query(F.data.startswith("cancel_appointment_"))
-async def cancel_appointment_handler(callback: CallbackQuery):
-    appointment_id = int(callback.data.split("_")[-1])
-
-    # Попытка удалить запись и освободить слот
-    success = cancel_appointment(appointment_id, free_slot=True)
-
-    if success:
-        await callback.answer("✅ Запись отменена!", show_alert=False)
-
-        # После удаления — обновляем список записей
-        user = get_user_by_telegram_id(callback.from_user.id)
-        appointments = get_user_appointments(user[0])
-        today_iso = date.today().isoformat()
-        upcoming = [a for a in appointments if a[3] >= today_iso]
-
-        if upcoming:
-            text_parts = []
-            for a in upcoming:
-                appointment_id, service_name, doctor_name, appt_date, appt_time, status, pet_name = a
-                text_parts.append(
-                    f"🐾 <b>{pet_name}</b>\n"
-                    f"👩‍⚕️ <b>{doctor_name}</b>\n"
-                    f"🧾 {service_name}\n"
-                    f"📅 {appt_date} — {appt_time}\n"
-                    f"📌 Статус: <i>{status}</i>\n"
-                    "────────────────────"
-                )
-            text = "📋 <b>Ваши актуальные записи:</b>\n\n" + "\n\n".join(text_parts)
-            await callback.message.edit_text(text, reply_markup=appointments_kb(upcoming), parse_mode="HTML")
+@callback_routes.register(router, CancelAppointmentCallback)
+async def cancel_appointment_handler(callback: CallbackQuery, callback_data: CancelAppointmentCallback):
+    appointment_id = callback_data.appointment_id
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден.")
+        return
+
+    # Отмена записи и освобождение слота — одной транзакцией
+    freed_slot = cancel_appointment(appointment_id, user_id=user.id)
+
+    if freed_slot:
+        await answer_callback(callback, "✅ Запись отменена!", show_alert=False)
+        # После отмены — обновляем список записей (не дожидаясь события от шины)
+        rendered_screens.invalidate(user.id, "appointments")
+        screen = appointments_screen(user.id)
+        if screen:
+            text, kb = screen
+            await show_screen(callback, text, reply_markup=kb, parse_mode="HTML")
         else:
-            await callback.message.edit_text("📅 У вас больше нет актуальных записей.", reply_markup=main_menu_inline())
+            await show_screen(callback, "📅 У вас больше нет актуальных записей.", reply_markup=main_menu_inline())
 
     else:
-        await callback.answer("⚠️ Не удалось удалить запись.", show_alert=True)
+        await answer_callback(callback, "⚠️ Не удалось отменить запись.", show_alert=True)
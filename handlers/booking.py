@@ -1,23 +1,45 @@
 # handlers/booking.py
-from aiogram import Router, F
+from datetime import date, timedelta
+
+from aiogram import Router
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from db.db_utils import (
+    CLINICS,
+    is_sharded,
+    use_clinic,
+    set_user_clinic,
+    clinic_today,
     get_user_by_telegram_id,
     get_services,
     get_doctors_by_service,
     get_available_dates_for_doctor,
     get_available_slots_for_doctor_on_date,
-    get_user_pets,
-    book_slot
+    get_user_pets
 )
 from handlers.common import main_menu_inline
-from handlers.calendar import SimpleCalendar, SimpleCalendarCallback
+from handlers.screen import show_screen, rendered_screens
+from handlers.clinic import clinic_middleware
+from handlers.webhook_reply import answer_callback
+from handlers.calendar import SimpleCalendar, SimpleCalendarCallback, CalendarPageCallback, calendar_pages
+from services.holds import slot_holds
+from services.write_queue import write_queue
+from handlers.callbacks import (
+    callback_routes,
+    ClinicCallback,
+    ServiceCallback,
+    DoctorCallback,
+    TimeCallback,
+    PetChoiceCallback,
+    WaitlistJoinCallback
+)
 
 router = Router()
 
+WAITLIST_AFTER_DAYS = 14  # нет свободных дат в этот срок — предлагаем лист ожидания
+
 
 # === FSM состояния ===
 class BookingStates(StatesGroup):
@@ -26,6 +48,8 @@ class BookingStates(StatesGroup):
     date = State()
     time = State()
     pet = State()
+    waitlist = State()
+    series = State()
 
 
 # === Вспомогательные строители клавиатур ===
@@ -54,121 +78,141 @@ def nav_footer(back_cb: str = None):
 
 
 # === Старт записи: выбираем услугу ===
-@router.callback_query(F.data == "book_visit")
+@callback_routes.register(router, "book_visit")
 async def start_booking(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
+    await answer_callback(callback)
     user = get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.message.answer("❗ Вы не зарегистрированы. Введите /start, чтобы начать.")
         return
 
+    # Несколько филиалов: пользователь выбирает свой один раз, дальше запросы идут в его БД
+    if is_sharded() and user.clinic_id not in CLINICS:
+        items = [(f"🏥 {name}", ClinicCallback(clinic_id=clinic_id).pack()) for clinic_id, name in CLINICS.items()]
+        await show_screen(callback, "🏥 Выберите филиал клиники:", reply_markup=build_list_kb(items, footer_rows=nav_footer()))
+        return
+
+    await _show_services(callback, state)
+
+
+# === Выбор филиала (один раз) -> услуги филиала ===
+@callback_routes.register(router, ClinicCallback)
+async def choose_clinic(callback: CallbackQuery, callback_data: ClinicCallback, state: FSMContext):
+    await answer_callback(callback)
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user or callback_data.clinic_id not in CLINICS:
+        return
+    set_user_clinic(user.id, callback_data.clinic_id)
+    clinic_middleware.remember(callback.from_user.id, callback_data.clinic_id)
+    rendered_screens.invalidate(user.id, "appointments")
+    with use_clinic(callback_data.clinic_id):
+        await _show_services(callback, state)
+
+
+async def _show_services(callback: CallbackQuery, state: FSMContext):
     services = get_services()
     if not services:
         await callback.message.answer("⚠️ Пока нет доступных услуг.")
         return
 
-    items = [(f"{s[1]} — {s[3]}₽", f"choose_service_{s[0]}") for s in services]
+    items = [(f"{s.name} — {s.price}₽", ServiceCallback(service_id=s.id).pack()) for s in services]
     kb = build_list_kb(items, footer_rows=nav_footer())
 
-    try:
-        await callback.message.edit_text("🧾 Выберите услугу:", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("🧾 Выберите услугу:", reply_markup=kb)
+    await show_screen(callback, "🧾 Выберите услугу:", reply_markup=kb)
 
     await state.set_state(BookingStates.service)
 
 
 # === Выбор услуги -> список врачей (фильтр по услуге) ===
-@router.callback_query(BookingStates.service, F.data.startswith("choose_service_"))
-async def choose_service(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    try:
-        service_id = int(callback.data.split("_")[-1])
-    except Exception:
-        await callback.message.answer("❌ Неправильный формат выбора услуги.")
-        return
+@callback_routes.register(router, ServiceCallback, BookingStates.service)
+async def choose_service(callback: CallbackQuery, callback_data: ServiceCallback, state: FSMContext):
+    await answer_callback(callback)
+    service_id = callback_data.service_id
 
     await state.update_data(service_id=service_id)
 
     doctors = get_doctors_by_service(service_id)
     if not doctors:
-        try:
-            await callback.message.edit_text("⚠️ К сожалению, нет врачей, выполняющих эту услугу.")
-        except Exception:
-            await callback.message.answer("⚠️ К сожалению, нет врачей, выполняющих эту услугу.")
+        await show_screen(callback, "⚠️ К сожалению, нет врачей, выполняющих эту услугу.")
         return
 
-    items = [(f"{d[1]} ({d[2] or 'специальность'})", f"choose_doctor_{d[0]}") for d in doctors]
+    items = [(f"{d.full_name} ({d.specialty or 'специальность'})", DoctorCallback(doctor_id=d.id).pack()) for d in doctors]
     kb = build_list_kb(items, footer_rows=nav_footer("back_to_service"))
 
-    try:
-        await callback.message.edit_text("👩‍⚕️ Выберите врача (отфильтровано по услуге):", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("👩‍⚕️ Выберите врача (отфильтровано по услуге):", reply_markup=kb)
+    await show_screen(callback, "👩‍⚕️ Выберите врача (отфильтровано по услуге):", reply_markup=kb)
 
     await state.set_state(BookingStates.doctor)
 
 
 # === Назад к выбору услуги ===
-@router.callback_query(BookingStates.doctor, F.data == "back_to_service")
+@callback_routes.register(router, "back_to_service", BookingStates.doctor)
 async def back_to_service(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
+    await answer_callback(callback)
     services = get_services()
-    items = [(f"{s[1]} — {s[3]}₽", f"choose_service_{s[0]}") for s in services]
+    items = [(f"{s.name} — {s.price}₽", ServiceCallback(service_id=s.id).pack()) for s in services]
     kb = build_list_kb(items, footer_rows=nav_footer())
-    try:
-        await callback.message.edit_text("🧾 Выберите услугу:", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("🧾 Выберите услугу:", reply_markup=kb)
+    await show_screen(callback, "🧾 Выберите услугу:", reply_markup=kb)
     await state.set_state(BookingStates.service)
 
 
 # === Выбор врача -> даты ===
-@router.callback_query(BookingStates.doctor, F.data.startswith("choose_doctor_"))
-async def choose_doctor(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    try:
-        doctor_id = int(callback.data.split("_")[-1])
-    except Exception:
-        await callback.message.answer("❌ Неправильный формат выбора врача.")
-        return
+@callback_routes.register(router, DoctorCallback, BookingStates.doctor)
+async def choose_doctor(callback: CallbackQuery, callback_data: DoctorCallback, state: FSMContext):
+    await answer_callback(callback)
+    doctor_id = callback_data.doctor_id
 
     await state.update_data(doctor_id=doctor_id)
 
-    dates = get_available_dates_for_doctor(doctor_id)
-    if not dates:
-        try:
-            await callback.message.edit_text("⚠️ У этого врача нет доступных дат на ближайшие 2 недели.")
-        except Exception:
-            await callback.message.answer("⚠️ У этого врача нет доступных дат на ближайшие 2 недели.")
+    # Календарь открывается на странице с ближайшей свободной датой
+    dates = get_available_dates_for_doctor(doctor_id, limit_days=calendar_pages.horizon_days, limit_dates=1)
+    first = date.fromisoformat(dates[0]) if dates else None
+    if first is None or first > clinic_today() + timedelta(days=WAITLIST_AFTER_DAYS):
+        items = [
+            ("🔔 Ждать времени у этого врача", WaitlistJoinCallback(any_doctor=0).pack()),
+            ("🔔 Ждать времени у любого врача", WaitlistJoinCallback(any_doctor=1).pack()),
+        ]
+        if first:
+            items.append((
+                f"📅 Ближайшая свободная дата — {first.strftime('%d.%m')}",
+                CalendarPageCallback(start=calendar_pages.page_start(first).isoformat()).pack()
+            ))
+        await show_screen(
+            callback,
+            "⚠️ У этого врача нет доступных дат на ближайшие 2 недели.\n\n"
+            "Встаньте в лист ожидания — мы предложим время, как только оно освободится.",
+            reply_markup=build_list_kb(items, footer_rows=nav_footer("back_to_service"))
+        )
         return
 
-    # Используем новый календарь
-    calendar_markup = await SimpleCalendar().start_calendar(
-        available_dates=dates,
-        days_ahead=14
+    await _show_calendar(callback, doctor_id, calendar_pages.page_start(first))
+    await state.set_state(BookingStates.date)
+
+
+async def _show_calendar(callback: CallbackQuery, doctor_id, start):
+    calendar_markup = await calendar_pages.get(doctor_id, start)
+    await show_screen(
+        callback,
+        "📅 Выберите дату приёма:\n\n"
+        "📍 - сегодня | 🌴 - выходной\n"
+        "Только доступные даты активны",
+        reply_markup=calendar_markup
     )
 
-    try:
-        await callback.message.edit_text(
-            "📅 Выберите дату приёма:\n\n"
-            "📍 - сегодня | 🌴 - выходной\n"
-            "Только доступные даты активны",
-            reply_markup=calendar_markup
-        )
-    except Exception:
-        await callback.message.answer(
-            "📅 Выберите дату приёма:\n\n"
-            "📍 - сегодня | 🌴 - выходной\n"
-            "Только доступные даты активны",
-            reply_markup=calendar_markup
-        )
 
+# === Листание календаря ◀/▶ (и переход к ближайшей дате из экрана листа ожидания) ===
+@callback_routes.register(router, CalendarPageCallback, BookingStates.doctor, BookingStates.date)
+async def calendar_page(callback: CallbackQuery, callback_data: CalendarPageCallback, state: FSMContext):
+    await answer_callback(callback)
+    data = await state.get_data()
+    start = date.fromisoformat(callback_data.start)
+    if not data.get("doctor_id") or not calendar_pages.in_range(start, clinic_today()):
+        return
+    await _show_calendar(callback, data["doctor_id"], calendar_pages.page_start(start))
     await state.set_state(BookingStates.date)
 
 
 # === Обработчик выбора даты из календаря ===
-@router.callback_query(BookingStates.date, SimpleCalendarCallback.filter())
+@callback_routes.register(router, SimpleCalendarCallback, BookingStates.date)
 async def process_calendar_selection(callback: CallbackQuery, callback_data: SimpleCalendarCallback, state: FSMContext):
     success, selected_date = await SimpleCalendar.process_selection(callback, callback_data)
 
@@ -184,28 +228,20 @@ async def process_calendar_selection(callback: CallbackQuery, callback_data: Sim
             await callback.message.answer("❌ Сначала выберите врача.")
             return
 
-        available_dates = get_available_dates_for_doctor(doctor_id)
-        if date_iso not in available_dates:
-            await callback.answer("❌ Эта дата недоступна для записи", show_alert=True)
+        # Страница календаря могла устареть (кэш, удержания) — проверяем саму дату
+        slots = get_available_slots_for_doctor_on_date(doctor_id, date_iso)
+        if not slots:
+            await answer_callback(callback, "❌ Эта дата недоступна для записи", show_alert=True)
             return
 
         # Продолжаем процесс как в choose_date
         await state.update_data(date=date_iso)
-        slots = get_available_slots_for_doctor_on_date(doctor_id, date_iso)
-
-        if not slots:
-            try:
-                await callback.message.edit_text("⏳ На эту дату нет свободных слотов. Выберите другую дату.")
-            except Exception:
-                await callback.message.answer("⏳ На эту дату нет свободных слотов. Выберите другую дату.")
-            return
 
         # Создаем сетку кнопок времени
         kb_rows = []
         row = []
-        for s in slots:
-            sched_id, time_str = s
-            row.append(InlineKeyboardButton(text=time_str, callback_data=f"choose_time_{sched_id}"))
+        for time_str in slots:
+            row.append(InlineKeyboardButton(text=time_str, callback_data=TimeCallback.from_time(time_str).pack()))
             if len(row) == 3:
                 kb_rows.append(row)
                 row = []
@@ -217,99 +253,81 @@ async def process_calendar_selection(callback: CallbackQuery, callback_data: Sim
         kb_rows.append([InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")])
         kb = InlineKeyboardMarkup(inline_keyboard=kb_rows)
 
-        try:
-            await callback.message.edit_text(f"🕓 Свободные слоты на {date_iso}:", reply_markup=kb)
-        except Exception:
-            await callback.message.answer(f"🕓 Свободные слоты на {date_iso}:", reply_markup=kb)
+        await show_screen(callback, f"🕓 Свободные слоты на {date_iso}:", reply_markup=kb)
 
         await state.set_state(BookingStates.time)
 
     elif success and selected_date is None:
         # Пользователь отменил выбор даты
-        await callback.message.edit_text("❌ Выбор даты отменен.", reply_markup=main_menu_inline())
+        await show_screen(callback, "❌ Выбор даты отменен.", reply_markup=main_menu_inline())
         await state.clear()
 
 
 # === Назад к календарю ===
-@router.callback_query(BookingStates.time, F.data == "back_to_calendar")
+@callback_routes.register(router, "back_to_calendar", BookingStates.time)
 async def back_to_calendar(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
+    await answer_callback(callback)
     data = await state.get_data()
     doctor_id = data.get("doctor_id")
     if not doctor_id:
         await callback.message.answer("❌ Сначала выберите врача.")
         return
 
-    dates = get_available_dates_for_doctor(doctor_id)
-    calendar_markup = await SimpleCalendar().start_calendar(
-        available_dates=dates,
-        days_ahead=14
-    )
-
-    try:
-        await callback.message.edit_text(
-            "📅 Выберите дату приёма:\n\n"
-            "📍 - сегодня | 🌴 - выходной\n"
-            "Только доступные даты активны",
-            reply_markup=calendar_markup
-        )
-    except Exception:
-        await callback.message.answer(
-            "📅 Выберите дату приёма:\n\n"
-            "📍 - сегодня | 🌴 - выходной\n"
-            "Только доступные даты активны",
-            reply_markup=calendar_markup
-        )
-
+    # Возвращаемся на страницу с выбранной датой
+    start = date.fromisoformat(data["date"]) if data.get("date") else clinic_today()
+    await _show_calendar(callback, doctor_id, calendar_pages.page_start(start))
     await state.set_state(BookingStates.date)
 
 
 # === Назад к выбору врача ===
-@router.callback_query(BookingStates.date, F.data == "back_to_doctor")
+@callback_routes.register(router, "back_to_doctor", BookingStates.date)
 async def back_to_doctor(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
+    await answer_callback(callback)
     data = await state.get_data()
     service_id = data.get("service_id")
     if not service_id:
         # если нет сервиса в памяти — просто вернёмся в меню услуг
         services = get_services()
-        items = [(f"{s[1]} — {s[3]}₽", f"choose_service_{s[0]}") for s in services]
+        items = [(f"{s.name} — {s.price}₽", ServiceCallback(service_id=s.id).pack()) for s in services]
         kb = build_list_kb(items, footer_rows=nav_footer())
-        try:
-            await callback.message.edit_text("🧾 Выберите услугу:", reply_markup=kb)
-        except Exception:
-            await callback.message.answer("🧾 Выберите услугу:", reply_markup=kb)
+        await show_screen(callback, "🧾 Выберите услугу:", reply_markup=kb)
         await state.set_state(BookingStates.service)
         return
 
     doctors = get_doctors_by_service(service_id)
-    items = [(f"{d[1]} ({d[2] or 'специальность'})", f"choose_doctor_{d[0]}") for d in doctors]
+    items = [(f"{d.full_name} ({d.specialty or 'специальность'})", DoctorCallback(doctor_id=d.id).pack()) for d in doctors]
     kb = build_list_kb(items, footer_rows=nav_footer("back_to_service"))
-    try:
-        await callback.message.edit_text("👩‍⚕️ Выберите врача:", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("👩‍⚕️ Выберите врача:", reply_markup=kb)
+    await show_screen(callback, "👩‍⚕️ Выберите врача:", reply_markup=kb)
     await state.set_state(BookingStates.doctor)
 
 
 # === Выбор времени -> выбор питомца ===
-@router.callback_query(BookingStates.time, F.data.startswith("choose_time_"))
-async def choose_time(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    try:
-        schedule_id = int(callback.data.split("_")[-1])
-    except Exception:
-        await callback.message.answer("❌ Неправильный формат времени.")
+@callback_routes.register(router, TimeCallback, BookingStates.time)
+async def choose_time(callback: CallbackQuery, callback_data: TimeCallback, state: FSMContext):
+    await answer_callback(callback)
+    time_str = callback_data.time_str
+    data = await state.get_data()
+    doctor_id = data.get("doctor_id")
+    date_iso = data.get("date")
+    if not (doctor_id and date_iso):
+        await callback.message.answer("❌ Сначала выберите врача и дату.")
         return
 
-    await state.update_data(schedule_id=schedule_id)
-
     user = get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.message.answer("❗ Пользователь не найден. Введите /start.")
         return
 
-    pets = get_user_pets(user[0])
+    # слот удерживается за пользователем, пока он выбирает питомца
+    try:
+        schedule_id = slot_holds.hold(doctor_id, date_iso, time_str, user.id)
+    except ValueError as e:
+        await callback.message.answer(f"❌ Это время недоступно для записи: {e}.")
+        return
+
+    await state.update_data(schedule_id=schedule_id, time=time_str)
+
+    pets = get_user_pets(user.id)
 
     if not pets:
         # предложим перейти в раздел "Мои питомцы" (чтобы добавить)
@@ -317,34 +335,27 @@ async def choose_time(callback: CallbackQuery, state: FSMContext):
             [InlineKeyboardButton(text="➕ Добавить питомца", callback_data="add_pet")],
             [InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")]
         ])
-        try:
-            await callback.message.edit_text(
-                "🐾 У вас пока нет питомцев. Чтобы записаться — сначала добавьте питомца.",
-                reply_markup=kb
-            )
-        except Exception:
-            await callback.message.answer(
-                "🐾 У вас пока нет питомцев. Чтобы записаться — сначала добавьте питомца.",
-                reply_markup=kb
-            )
+        await show_screen(
+            callback,
+            "🐾 У вас пока нет питомцев. Чтобы записаться — сначала добавьте питомца.",
+            reply_markup=kb
+        )
         await state.set_state(BookingStates.pet)
         return
 
-    items = [(p[1], f"choose_pet_{p[0]}") for p in pets]
-    kb = build_list_kb(items, footer_rows=nav_footer("back_to_time"))
+    items = [(p.name, PetChoiceCallback(pet_id=p.id).pack()) for p in pets]
+    footer = [[("🔁 Записать курс визитов", "series_start")]] + nav_footer("back_to_time")
+    kb = build_list_kb(items, footer_rows=footer)
 
-    try:
-        await callback.message.edit_text("🐶 Выберите питомца для записи:", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("🐶 Выберите питомца для записи:", reply_markup=kb)
+    await show_screen(callback, "🐶 Выберите питомца для записи:", reply_markup=kb)
 
     await state.set_state(BookingStates.pet)
 
 
 # === Назад ко времени ===
-@router.callback_query(BookingStates.pet, F.data == "back_to_time")
+@callback_routes.register(router, "back_to_time", BookingStates.pet, BookingStates.series)
 async def back_to_time(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
+    await answer_callback(callback)
     data = await state.get_data()
     doctor_id = data.get("doctor_id")
     date_iso = data.get("date")
@@ -352,17 +363,21 @@ async def back_to_time(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer("❌ Сначала выберите врача и дату.")
         return
 
+    # пользователь выбирает время заново — удержанный слот снова доступен всем
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if user and data.get("schedule_id"):
+        slot_holds.release(data["schedule_id"], user.id)
+
     slots = get_available_slots_for_doctor_on_date(doctor_id, date_iso)
     # строим сетку как в choose_date
     if not slots:
-        await callback.message.edit_text("⏳ Нет доступных слотов на выбранную дату.")
+        await show_screen(callback, "⏳ Нет доступных слотов на выбранную дату.")
         return
 
     kb_rows = []
     row = []
-    for s in slots:
-        sched_id, time_str = s
-        row.append(InlineKeyboardButton(text=time_str, callback_data=f"choose_time_{sched_id}"))
+    for time_str in slots:
+        row.append(InlineKeyboardButton(text=time_str, callback_data=TimeCallback.from_time(time_str).pack()))
         if len(row) == 3:
             kb_rows.append(row)
             row = []
@@ -372,23 +387,16 @@ async def back_to_time(callback: CallbackQuery, state: FSMContext):
     kb_rows.append([InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")])
     kb = InlineKeyboardMarkup(inline_keyboard=kb_rows)
 
-    try:
-        await callback.message.edit_text("🕓 Выберите время:", reply_markup=kb)
-    except Exception:
-        await callback.message.answer("🕓 Выберите время:", reply_markup=kb)
+    await show_screen(callback, "🕓 Выберите время:", reply_markup=kb)
 
     await state.set_state(BookingStates.time)
 
 
 # === Выбор питомца -> финализация записи ===
-@router.callback_query(BookingStates.pet, F.data.startswith("choose_pet_"))
-async def choose_pet(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    try:
-        pet_id = int(callback.data.split("_")[-1])
-    except Exception:
-        await callback.message.answer("❌ Неправильный формат выбора питомца.")
-        return
+@callback_routes.register(router, PetChoiceCallback, BookingStates.pet)
+async def choose_pet(callback: CallbackQuery, callback_data: PetChoiceCallback, state: FSMContext):
+    await answer_callback(callback)
+    pet_id = callback_data.pet_id
 
     await state.update_data(pet_id=pet_id)
     data = await state.get_data()
@@ -404,11 +412,12 @@ async def choose_pet(callback: CallbackQuery, state: FSMContext):
         return
 
     try:
-        appointment_id = book_slot(schedule_id, user[0], pet_id, service_id)
+        appointment_id = await write_queue.book_slot(schedule_id, user.id, pet_id, service_id)
     except ValueError as e:
         await callback.message.answer(f"⚠️ Невозможно забронировать слот: {e}")
         await state.clear()
         return
+    slot_holds.converted()
 
     # Получаем информацию для красивого подтверждения
     from db.db_utils import connect
@@ -444,9 +453,6 @@ async def choose_pet(callback: CallbackQuery, state: FSMContext):
         [InlineKeyboardButton(text="📋 Мои записи", callback_data="my_appointments")],
         [InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")]
     ])
-    try:
-        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
-    except Exception:
-        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+    await show_screen(callback, text, reply_markup=kb, parse_mode="HTML")
 
     await state.clear()
\ No newline at end of file
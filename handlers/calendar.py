@@ -1,8 +1,18 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters.callback_data import CallbackData
 from datetime import datetime, timedelta, date
 from typing import Optional, Tuple
 
+from config import CALENDAR_PAGE, CALENDAR_HORIZON_DAYS, CALENDAR_CACHE_SECONDS
+from db.db_utils import clinic_today, current_clinic, use_clinic, get_available_dates_in_range
+from handlers.screen import show_screen
+from handlers.webhook_reply import answer_callback
+
 
 class SimpleCalendarCallback(CallbackData, prefix="simple_cal"):
     action: str  # "select", "ignore"
@@ -11,113 +21,6 @@ class SimpleCalendarCallback(CallbackData, prefix="simple_cal"):
 
 class SimpleCalendar:
 
-    @staticmethod
-    async def start_calendar(available_dates: list, days_ahead: int = 7) -> InlineKeyboardMarkup:
-        """
-        Создает календарь на ближайшие days_ahead дней с учетом доступных дат
-        """
-        today = date.today()
-        markup = []
-
-        # Заголовок
-        markup.append([
-            InlineKeyboardButton(
-                text="📅 Выберите дату",
-                callback_data=SimpleCalendarCallback(
-                    action="ignore",
-                    date_iso="header"
-                ).pack()
-            )
-        ])
-
-        # Создаем правильный порядок дней недели для отображаемого периода
-        week_days_header = []
-        current_header_date = today
-
-        for i in range(days_ahead):
-            day_index = current_header_date.weekday()
-            day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-            week_days_header.append(day_names[day_index])
-            current_header_date += timedelta(days=1)
-
-        # Заголовок дней недели
-        markup.append([
-            InlineKeyboardButton(
-                text=day,
-                callback_data=SimpleCalendarCallback(action="ignore", date_iso=f"wd_{i}").pack()
-            ) for i, day in enumerate(week_days_header)
-        ])
-
-        # Генерируем кнопки с датами
-        current_date = today
-        date_buttons = []
-
-        for i in range(days_ahead):
-            day_number = current_date.day
-            date_iso = current_date.isoformat()
-
-            # Форматируем текст кнопки
-            if current_date == today:
-                button_text = f"📍{day_number}"
-            elif current_date.weekday() >= 5:  # Суббота и воскресенье
-                button_text = f"🌴{day_number}"
-            else:
-                button_text = f"{day_number}"
-
-            # Проверяем доступность даты
-            if date_iso in available_dates:
-                date_buttons.append(
-                    InlineKeyboardButton(
-                        text=button_text,
-                        callback_data=SimpleCalendarCallback(
-                            action="select",
-                            date_iso=date_iso
-                        ).pack()
-                    )
-                )
-            else:
-                date_buttons.append(
-                    InlineKeyboardButton(
-                        text="·",
-                        callback_data=SimpleCalendarCallback(action="ignore", date_iso="unavailable").pack()
-                    )
-                )
-
-            current_date += timedelta(days=1)
-
-        # Разбиваем на строки (можно настроить количество кнопок в строке)
-        buttons_per_row = 7  # Все дни в одной строке
-        for i in range(0, len(date_buttons), buttons_per_row):
-            markup.append(date_buttons[i:i + buttons_per_row])
-
-        # Подпись с диапазоном дат
-        end_date = today + timedelta(days=days_ahead - 1)
-        date_range = f"{today.strftime('%d.%m')}-{end_date.strftime('%d.%m')}"
-        markup.append([
-            InlineKeyboardButton(
-                text=f"📆 {date_range}",
-                callback_data=SimpleCalendarCallback(action="ignore", date_iso="range").pack()
-            )
-        ])
-
-        # Легенда
-        markup.append([
-            InlineKeyboardButton(text="📍 - сегодня",
-                                 callback_data=SimpleCalendarCallback(action="ignore", date_iso="legend_today").pack()),
-            InlineKeyboardButton(text="🌴 - выходной", callback_data=SimpleCalendarCallback(action="ignore",
-                                                                                           date_iso="legend_weekend").pack())
-        ])
-
-        # Кнопки навигации
-        markup.append([
-            InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data=SimpleCalendarCallback(action="ignore", date_iso="cancel").pack()
-            )
-        ])
-
-        return InlineKeyboardMarkup(inline_keyboard=markup)
-
     @staticmethod
     async def process_selection(query: CallbackQuery, data: SimpleCalendarCallback) -> Tuple[bool, Optional[date]]:
         """
@@ -126,108 +29,186 @@ class SimpleCalendar:
         """
         if data.action == "ignore":
             if data.date_iso == "cancel":
-                await query.message.edit_text("❌ Выбор даты отменен")
+                await answer_callback(query)
+                await show_screen(query, "❌ Выбор даты отменен")
                 return True, None
-            await query.answer()
+            await answer_callback(query)
             return False, None
 
         if data.action == "select":
             try:
                 selected_date = datetime.strptime(data.date_iso, "%Y-%m-%d").date()
-                await query.answer(f"✅ Выбрана дата: {selected_date.strftime('%d.%m.%Y')}")
+                await answer_callback(query, f"✅ Выбрана дата: {selected_date.strftime('%d.%m.%Y')}")
                 return True, selected_date
             except ValueError:
-                await query.answer("❌ Ошибка выбора даты")
+                await answer_callback(query, "❌ Ошибка выбора даты")
                 return False, None
 
         return False, None
 
 
-# Альтернативная версия календаря, которая всегда показывает полные недели
-class WeekCalendar:
-
-    @staticmethod
-    async def start_calendar(available_dates: list, weeks_ahead: int = 1) -> InlineKeyboardMarkup:
-        """
-        Создает календарь на полные недели
-        """
-        today = date.today()
-        markup = []
-
-        # Заголовок
-        markup.append([
-            InlineKeyboardButton(
-                text="📅 Выберите дату",
-                callback_data=SimpleCalendarCallback(action="ignore", date_iso="header").pack()
-            )
-        ])
-
-        # Стандартные дни недели
-        week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        markup.append([
-            InlineKeyboardButton(text=day,
-                                 callback_data=SimpleCalendarCallback(action="ignore", date_iso=f"wd_{i}").pack())
-            for i, day in enumerate(week_days)
-        ])
-
-        # Находим понедельник текущей недели
-        days_since_monday = today.weekday()
-        start_date = today - timedelta(days=days_since_monday)
-
-        # Генерируем недели
-        current_date = start_date
-        total_days = weeks_ahead * 7
-
-        for week in range(weeks_ahead):
+# === Постраничный календарь (неделя или месяц) ===
+class CalendarPageCallback(CallbackData, prefix="cal_page"):
+    start: str  # YYYY-MM-DD — первый день страницы
+
+
+MONTH_NAMES = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+               "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+
+
+def _ignore(text, tag):
+    return InlineKeyboardButton(text=text, callback_data=SimpleCalendarCallback(action="ignore", date_iso=tag).pack())
+
+
+class PagedCalendar:
+    """
+    Календарь записи по страницам (неделя или месяц) с навигацией ◀/▶. Свободные даты
+    читаются только для видимой страницы; готовая клавиатура страницы кэшируется
+    (LRU) на `ttl` секунд — удержания слотов событий не шлют — и сбрасывается при
+    записи или отмене на её дату. После показа следующая страница загружается в фоне,
+    поэтому ▶ обычно отвечает из кэша. Одну страницу одновременно грузит один запрос.
+    """
+
+    def __init__(self, mode="month", horizon_days=90, ttl=60, max_pages=5000):
+        self.mode = mode
+        self.horizon_days = horizon_days
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self._pages = OrderedDict()  # (clinic_id, doctor_id, start) -> (today, expires_at, markup)
+        self._loading = {}  # (clinic_id, doctor_id, start) -> asyncio.Task
+        self.stats = {"hits": 0, "misses": 0, "joined": 0, "prefetched": 0, "invalidations": 0}
+
+    # --- границы страниц ---
+    def page_start(self, day):
+        return day - timedelta(days=day.weekday()) if self.mode == "week" else day.replace(day=1)
+
+    def page_end(self, start):
+        return start + timedelta(days=6) if self.mode == "week" else self.next_page(start) - timedelta(days=1)
+
+    def next_page(self, start):
+        return start + timedelta(days=7) if self.mode == "week" else (start + timedelta(days=32)).replace(day=1)
+
+    def prev_page(self, start):
+        return start - timedelta(days=7) if self.mode == "week" else (start - timedelta(days=1)).replace(day=1)
+
+    def in_range(self, start, today):
+        return self.page_start(today) <= start <= today + timedelta(days=self.horizon_days)
+
+    # --- страницы ---
+    async def get(self, doctor_id, start):
+        """Клавиатура страницы, начинающейся со `start`, для врача текущего филиала."""
+        today = clinic_today()
+        key = (current_clinic(), doctor_id, start)
+        entry = self._pages.get(key)
+        if entry and entry[0] == today and entry[1] > time.monotonic():
+            self.stats["hits"] += 1
+            self._pages.move_to_end(key)
+            markup = entry[2]
+        elif key in self._loading:
+            self.stats["joined"] += 1
+            markup = await asyncio.shield(self._loading[key])
+        else:
+            self.stats["misses"] += 1
+            markup = await asyncio.shield(self._start_loading(key, today))
+
+        following = self.next_page(start)
+        if self.in_range(following, today):
+            self._prefetch((key[0], doctor_id, following), today)
+        return markup
+
+    def _prefetch(self, key, today):
+        entry = self._pages.get(key)
+        if key in self._loading or entry and entry[0] == today and entry[1] > time.monotonic():
+            return
+        self.stats["prefetched"] += 1
+        self._start_loading(key, today)
+
+    def _start_loading(self, key, today):
+        task = asyncio.create_task(self._load(key, today))
+        self._loading[key] = task
+        task.add_done_callback(lambda t: self._loaded(key, today, t))
+        return task
+
+    async def _load(self, key, today):
+        clinic_id, doctor_id, start = key
+        first = max(start, today)
+        last = min(self.page_end(start), today + timedelta(days=self.horizon_days))
+        with use_clinic(clinic_id):
+            dates = await asyncio.to_thread(get_available_dates_in_range, doctor_id, first, last)
+        return self.render(start, today, set(dates))
+
+    def _loaded(self, key, today, task):
+        if self._loading.get(key) is not task:
+            return  # страницу сбросили, пока она грузилась
+        del self._loading[key]
+        if task.cancelled() or task.exception():
+            if not task.cancelled():
+                logging.warning(f"Не удалось загрузить страницу календаря {key}: {task.exception()}")
+            return
+        self._pages[key] = (today, time.monotonic() + self.ttl, task.result())
+        self._pages.move_to_end(key)
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, clinic_id, doctor_id, day):
+        """Запись или отмена на `day` — страница с этим днём устарела."""
+        key = (clinic_id, doctor_id, self.page_start(day))
+        self._loading.pop(key, None)
+        if self._pages.pop(key, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self.stats["invalidations"] += len(self._pages)
+        self._pages.clear()
+        self._loading.clear()
+
+    # --- отрисовка ---
+    def render(self, start, today, available_dates) -> InlineKeyboardMarkup:
+        end = self.page_end(start)
+        if self.mode == "week":
+            title = f"{start.strftime('%d.%m')}–{end.strftime('%d.%m')}"
+        else:
+            title = f"{MONTH_NAMES[start.month - 1]} {start.year}"
+
+        prev_start, next_start = self.prev_page(start), self.next_page(start)
+        markup = [[
+            InlineKeyboardButton(text="◀", callback_data=CalendarPageCallback(start=prev_start.isoformat()).pack())
+            if self.in_range(prev_start, today) else _ignore(" ", "no_prev"),
+            _ignore(f"📅 {title}", "header"),
+            InlineKeyboardButton(text="▶", callback_data=CalendarPageCallback(start=next_start.isoformat()).pack())
+            if self.in_range(next_start, today) else _ignore(" ", "no_next"),
+        ]]
+        markup.append([_ignore(day, f"wd_{i}") for i, day in enumerate(["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"])])
+
+        # Сетка с понедельника: дни соседнего месяца — пустые клетки
+        current = start - timedelta(days=start.weekday())
+        while current <= end:
             week_row = []
-            for day in range(7):
-                date_iso = current_date.isoformat()
-                day_number = current_date.day
-
-                # Форматируем текст кнопки
-                if current_date == today:
-                    button_text = f"📍{day_number}"
-                elif current_date.weekday() >= 5:
-                    button_text = f"🌴{day_number}"
-                else:
-                    button_text = f"{day_number}"
-
-                # Проверяем доступность (только будущие даты)
-                is_available = date_iso in available_dates and current_date >= today
-
-                if is_available:
-                    week_row.append(
-                        InlineKeyboardButton(
-                            text=button_text,
-                            callback_data=SimpleCalendarCallback(action="select", date_iso=date_iso).pack()
-                        )
-                    )
+            for _ in range(7):
+                date_iso = current.isoformat()
+                if not start <= current <= end:
+                    week_row.append(_ignore(" ", "pad"))
+                elif date_iso in available_dates:
+                    if current == today:
+                        button_text = f"📍{current.day}"
+                    elif current.weekday() >= 5:
+                        button_text = f"🌴{current.day}"
+                    else:
+                        button_text = f"{current.day}"
+                    week_row.append(InlineKeyboardButton(
+                        text=button_text,
+                        callback_data=SimpleCalendarCallback(action="select", date_iso=date_iso).pack()
+                    ))
                 else:
-                    week_row.append(
-                        InlineKeyboardButton(
-                            text="·",
-                            callback_data=SimpleCalendarCallback(action="ignore", date_iso="unavailable").pack()
-                        )
-                    )
+                    week_row.append(_ignore("·", "unavailable"))
+                current += timedelta(days=1)
+            markup.append(week_row)
+
+        markup.append([_ignore("❌ Отмена", "cancel")])
+        return InlineKeyboardMarkup(inline_keyboard=markup)
 
-                current_date += timedelta(days=1)
+    def log_stats(self):
+        logging.info(f"📅 Страницы календаря: {self.stats}, в кэше {len(self._pages)}")
 
-            markup.append(week_row)
 
-        # Подпись с диапазоном дат
-        end_date = start_date + timedelta(days=total_days - 1)
-        date_range = f"{start_date.strftime('%d.%m')}-{end_date.strftime('%d.%m')}"
-        markup.append([
-            InlineKeyboardButton(
-                text=f"📆 {date_range}",
-                callback_data=SimpleCalendarCallback(action="ignore", date_iso="range").pack()
-            )
-        ])
-
-        # Кнопки навигации
-        markup.append([
-            InlineKeyboardButton(text="❌ Отмена",
-                                 callback_data=SimpleCalendarCallback(action="ignore", date_iso="cancel").pack())
-        ])
-
-        return InlineKeyboardMarkup(inline_keyboard=markup)
\ No newline at end of file
+calendar_pages = PagedCalendar(mode=CALENDAR_PAGE, horizon_days=CALENDAR_HORIZON_DAYS, ttl=CALENDAR_CACHE_SECONDS)
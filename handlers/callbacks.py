@@ -0,0 +1,147 @@
+# handlers/callbacks.py
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, F, Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+
+# === Типизированные callback_data ===
+class ClinicCallback(CallbackData, prefix="clinic"):
+    clinic_id: str
+
+
+class ServiceCallback(CallbackData, prefix="svc"):
+    service_id: int
+
+
+class DoctorCallback(CallbackData, prefix="doc"):
+    doctor_id: int
+
+
+class TimeCallback(CallbackData, prefix="time"):
+    hhmm: str  # "0900" — двоеточие зарезервировано как разделитель CallbackData
+
+    @property
+    def time_str(self):
+        return f"{self.hhmm[:2]}:{self.hhmm[2:]}"
+
+    @classmethod
+    def from_time(cls, time_str):
+        return cls(hhmm=time_str.replace(":", ""))
+
+
+class PetChoiceCallback(CallbackData, prefix="pet"):
+    pet_id: int
+
+
+class PetDeleteCallback(CallbackData, prefix="pet_del"):
+    pet_id: int
+
+
+class CancelAppointmentCallback(CallbackData, prefix="appt_cancel"):
+    appointment_id: int
+
+
+class SeriesPlanCallback(CallbackData, prefix="series"):
+    every_days: int
+    count: int
+
+
+class WaitlistJoinCallback(CallbackData, prefix="wl_join"):
+    any_doctor: int  # 1 — подойдёт любой врач услуги
+
+
+class WaitlistTakeCallback(CallbackData, prefix="wl_take"):
+    waitlist_id: int
+
+
+class WaitlistDeclineCallback(CallbackData, prefix="wl_decline"):
+    waitlist_id: int
+
+
+# === Индекс обработчиков по префиксу ===
+class _Route:
+    __slots__ = ("handler", "key", "states")
+
+    def __init__(self, handler, key, states):
+        self.handler = CallableObject(handler)
+        self.key = key
+        self.states = {s.state for s in states}
+
+
+class CallbackRoutes(BaseMiddleware):
+    """
+    Outer-middleware для callback_query: разбирает callback_data один раз
+    и вызывает обработчик по словарю {префикс: [маршруты]}.
+    Если маршрут не найден — апдейт идёт по обычной цепочке фильтров роутеров.
+    """
+
+    def __init__(self):
+        self._index = defaultdict(list)
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, router: Router, key, *states):
+        """
+        Декоратор: регистрирует обработчик и в роутере (запасной путь), и в индексе.
+        key — класс CallbackData или статическая строка callback_data.
+        """
+        def decorator(handler):
+            if isinstance(key, str):
+                router.callback_query(*states, F.data == key)(handler)
+                prefix = key
+            else:
+                router.callback_query(*states, key.filter())(handler)
+                prefix = key.__prefix__
+            self._index[prefix].append(_Route(handler, key, states))
+            return handler
+        return decorator
+
+    async def _match(self, event: CallbackQuery, data: Dict[str, Any]):
+        routes = self._index.get(event.data.split(":", 1)[0])
+        if not routes:
+            return None, None
+
+        current_state = None
+        if any(r.states for r in routes):
+            state = data.get("state")
+            current_state = await state.get_state() if state else None
+
+        for route in routes:
+            if route.states and current_state not in route.states:
+                continue
+            if isinstance(route.key, str):
+                if event.data == route.key:
+                    return route, None
+                continue
+            try:
+                return route, route.key.unpack(event.data)
+            except (TypeError, ValueError):
+                continue
+        return None, None
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not event.data:
+            return await handler(event, data)
+
+        route, callback_data = await self._match(event, data)
+        if route is None:
+            self.misses += 1
+            return await handler(event, data)
+
+        self.hits += 1
+        kwargs = dict(data)
+        if callback_data is not None:
+            kwargs["callback_data"] = callback_data
+        return await route.handler.call(event, **kwargs)
+
+
+callback_routes = CallbackRoutes()
@@ -0,0 +1,72 @@
+# handlers/chat_lock.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class KeyedLock:
+    """
+    Набор asyncio.Lock по ключу. Замок удаляется, как только его никто не держит
+    и не ждёт, поэтому память растёт только с числом одновременно активных чатов.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, users]
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_entry(key, entry, locked=False)
+            raise
+
+    def release(self, key):
+        self._release_entry(key, self._locks[key], locked=True)
+
+    def _release_entry(self, key, entry, locked):
+        if locked:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+class ChatLockMiddleware(BaseMiddleware):
+    """
+    Обрабатывает апдейты одного чата строго по очереди (двойное нажатие не выполнится
+    параллельно), разные чаты — по-прежнему параллельно.
+    """
+
+    def __init__(self, locks: KeyedLock = None):
+        self.locks = locks or KeyedLock()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else None)
+        if key is None:
+            return await handler(event, data)
+
+        await self.locks.acquire(key)
+        try:
+            # raw_state вычислен до ожидания очереди, а предыдущий апдейт чата мог его сменить
+            state = data.get("state")
+            if state is not None:
+                data["raw_state"] = await state.get_state()
+            return await handler(event, data)
+        finally:
+            self.locks.release(key)
@@ -0,0 +1,52 @@
+# handlers/clinic.py
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from db.db_utils import CLINICS, MAIN_CLINIC, is_sharded, use_clinic, get_user_by_telegram_id
+
+
+class ClinicMiddleware(BaseMiddleware):
+    """
+    Выполняет апдейт в контексте филиала пользователя: запросы db_utils из обработчиков
+    уходят в БД этого филиала. Пока филиал не выбран — основной. Выбор филиала
+    кэшируется по telegram_id (LRU), чтобы не читать ядро на каждый апдейт.
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self._clinics = OrderedDict()  # telegram_id -> clinic_id
+
+    def remember(self, telegram_id, clinic_id):
+        self._clinics[telegram_id] = clinic_id
+        self._clinics.move_to_end(telegram_id)
+        if len(self._clinics) > self.max_users:
+            self._clinics.popitem(last=False)
+
+    def _clinic_of(self, telegram_id):
+        clinic_id = self._clinics.get(telegram_id)
+        if clinic_id is not None:
+            self._clinics.move_to_end(telegram_id)
+            return clinic_id
+        user = get_user_by_telegram_id(telegram_id)
+        if user and user.clinic_id in CLINICS:
+            self.remember(telegram_id, user.clinic_id)
+            return user.clinic_id
+        return MAIN_CLINIC
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if not is_sharded() or user is None:
+            return await handler(event, data)
+        with use_clinic(self._clinic_of(user.id)):
+            return await handler(event, data)
+
+
+clinic_middleware = ClinicMiddleware()
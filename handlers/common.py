@@ -2,6 +2,10 @@ from aiogram import Router, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 
+from handlers.callbacks import callback_routes
+from handlers.screen import show_screen
+from handlers.webhook_reply import answer_callback
+
 router = Router()
 
 # Главное меню через inline-кнопки
@@ -24,8 +28,9 @@ async def start_message(message: Message, state: FSMContext):
     )
 
 
-@router.callback_query(F.data == "back_to_menu")
+@callback_routes.register(router, "back_to_menu")
 async def back_to_menu(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     data = await state.get_data()
     welcome_id = data.get("welcome_message_id")
     sent_messages = data.get("sent_messages", [])
@@ -42,10 +47,7 @@ async def back_to_menu(callback: CallbackQuery, state: FSMContext):
     await state.update_data(sent_messages=[welcome_id])
 
     # Отправляем новое главное меню
-    try:
-        sent_menu = await callback.message.edit_text("🏠 Главное меню:", reply_markup=main_menu_inline())
-    except:
-        sent_menu = await callback.message.answer("🏠 Главное меню:", reply_markup=main_menu_inline())
+    sent_menu = await show_screen(callback, "🏠 Главное меню:", reply_markup=main_menu_inline())
 
     # Добавляем ID нового меню в список сообщений
     data = await state.get_data()
@@ -53,8 +55,6 @@ async def back_to_menu(callback: CallbackQuery, state: FSMContext):
     messages.append(sent_menu.message_id)
     await state.update_data(sent_messages=messages)
 
-    await callback.answer()
-
 async def add_message_to_state(message, state):
     data = await state.get_data()
     messages = data.get("sent_messages", [])
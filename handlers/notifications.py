@@ -1,14 +1,15 @@
-import asyncio
-import logging
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 from aiogram import Router
 from aiogram.types import Message
-from db.db_utils import connect
+from db.db_utils import clinic_ids, use_clinic, connect
+from services.write_queue import write_queue
 
 router = Router()
 
 # === Получение предстоящих приёмов ===
-def get_upcoming_appointments():
+def get_upcoming_appointments(from_ts, to_ts):
+    """Запланированные приёмы, начинающиеся в [from_ts, to_ts] (unix-время)."""
     with connect() as conn:
         cur = conn.cursor()
         cur.execute("""
@@ -20,6 +21,7 @@ def get_upcoming_appointments():
                 s.name AS service_name,
                 sch.date,
                 sch.time,
+                a.start_ts,
                 a.notified_24h,
                 a.notified_2h
             FROM appointments a
@@ -28,14 +30,21 @@ def get_upcoming_appointments():
             JOIN doctors d ON a.doctor_id = d.id
             JOIN services s ON a.service_id = s.id
             JOIN schedule sch ON a.schedule_id = sch.id
-            WHERE a.status = 'scheduled'
-        """)
+            WHERE a.status = 'scheduled' AND a.start_ts BETWEEN ? AND ?
+        """, (from_ts, to_ts))
         return cur.fetchall()
 
 # === Проверка и отправка уведомлений ===
 async def check_and_send_notifications(bot):
-    now = datetime.now()
-    upcoming = get_upcoming_appointments()
+    for clinic_id in clinic_ids():
+        with use_clinic(clinic_id):
+            await _send_clinic_notifications(bot)
+
+
+async def _send_clinic_notifications(bot):
+    now = int(time.time())
+    # дальше окна напоминания за сутки приёмы не интересны
+    upcoming = get_upcoming_appointments(now, now + int(timedelta(hours=24, minutes=10).total_seconds()))
 
     for appt in upcoming:
         (
@@ -46,16 +55,12 @@ async def check_and_send_notifications(bot):
             service_name,
             appt_date,
             appt_time,
+            start_ts,
             notified_24h,
             notified_2h
         ) = appt
 
-        try:
-            appt_datetime = datetime.strptime(f"{appt_date} {appt_time}", "%Y-%m-%d %H:%M")
-        except Exception:
-            continue
-
-        time_until = appt_datetime - now
+        time_until = timedelta(seconds=start_ts - now)
 
         # === За 24 часа ===
         if timedelta(hours=23, minutes=50) < time_until < timedelta(hours=24, minutes=10) and not notified_24h:
@@ -68,7 +73,7 @@ async def check_and_send_notifications(bot):
                 f"🧾 Услуга: {service_name}\n"
                 f"🕓 Время: {appt_time} ({appt_date})"
             )
-            mark_notified(appointment_id, "24h")
+            await write_queue.mark_notified(appointment_id, "24h")
 
         # === За 2 часа ===
         elif timedelta(hours=1, minutes=50) < time_until < timedelta(hours=2, minutes=10) and not notified_2h:
@@ -81,24 +86,7 @@ async def check_and_send_notifications(bot):
                 f"🧾 Услуга: {service_name}\n"
                 f"🕓 Время: {appt_time} ({appt_date})"
             )
-            mark_notified(appointment_id, "2h")
-
-# === Пометка об отправке ===
-def mark_notified(appointment_id: int, kind: str):
-    with connect() as conn:
-        cur = conn.cursor()
-        if kind == "24h":
-            cur.execute("UPDATE appointments SET notified_24h = 1 WHERE id = ?", (appointment_id,))
-        elif kind == "2h":
-            cur.execute("UPDATE appointments SET notified_2h = 1 WHERE id = ?", (appointment_id,))
-        conn.commit()
-
-# === Фоновая задача ===
-async def notifications_scheduler(bot):
-    logging.info("🔔 Система уведомлений запущена...")
-    while True:
-        await check_and_send_notifications(bot)
-        await asyncio.sleep(300)  # каждые 5 минут
+            await write_queue.mark_notified(appointment_id, "2h")
 
 # === Ручная проверка (для теста) ===
 @router.message(lambda msg: msg.text == "/check_notifications")
@@ -5,8 +5,12 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter
 
-from db.db_utils import get_user_by_telegram_id, get_user_pets, add_pet, connect
+from db.db_utils import get_user_by_telegram_id, get_user_pets, remove_pet
 from handlers.common import main_menu_inline
+from handlers.screen import show_screen, rendered_screens
+from handlers.webhook_reply import answer_callback
+from handlers.callbacks import callback_routes, PetDeleteCallback
+from services.write_queue import write_queue
 
 router = Router()
 
@@ -22,79 +26,69 @@ class PetState(StatesGroup):
 def pets_keyboard(pets):
     kb = []
     for pet in pets:
-        pet_id, name, species, age = pet
-        kb.append([InlineKeyboardButton(text=f"❌ Удалить {name}", callback_data=f"delete_pet_{pet_id}")])
+        kb.append([InlineKeyboardButton(text=f"❌ Удалить {pet.name}", callback_data=PetDeleteCallback(pet_id=pet.id).pack())])
     kb.append([InlineKeyboardButton(text="➕ Добавить питомца", callback_data="add_pet")])
     kb.append([InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")])
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
+def _render_pets(user_id):
+    pets = get_user_pets(user_id)
+    text = None
+    if pets:
+        text = "🐾 Ваши питомцы:\n\n"
+        for p in pets:
+            text += f"• {p.name} ({p.species or 'вид не указан'}, {p.age or 'возраст не указан'})\n"
+    return text, pets_keyboard(pets)
+
+
+def pets_screen(user_id):
+    """(текст списка или None, если питомцев нет; клавиатура) «Моих питомцев» — из кэша."""
+    return rendered_screens.get_or_render(user_id, "pets", lambda: _render_pets(user_id))
+
+
 # === Просмотр питомцев ===
-@router.callback_query(F.data == "my_pets")
+@callback_routes.register(router, "my_pets")
 async def show_my_pets(callback: CallbackQuery):
+    await answer_callback(callback)
     user = get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.message.answer("❗ Вы не зарегистрированы. Введите /start.")
-        await callback.answer()
         return
 
-    pets = get_user_pets(user[0])
-    if not pets:
-        text = "🐾 У вас пока нет питомцев."
-    else:
-        text = "🐾 Ваши питомцы:\n\n"
-        for p in pets:
-            text += f"• {p[1]} ({p[2] or 'вид не указан'}, {p[3] or 'возраст не указан'})\n"
-
-    kb = pets_keyboard(pets)
-    try:
-        await callback.message.edit_text(text, reply_markup=kb)
-    except Exception:
-        await callback.message.answer(text, reply_markup=kb)
-    await callback.answer()
+    text, kb = pets_screen(user.id)
+    await show_screen(callback, text or "🐾 У вас пока нет питомцев.", reply_markup=kb)
 
 
 # === Удаление питомца ===
-@router.callback_query(F.data.startswith("delete_pet_"))
-async def delete_pet(callback: CallbackQuery):
-    pet_id = int(callback.data.split("_")[-1])
+@callback_routes.register(router, PetDeleteCallback)
+async def delete_pet(callback: CallbackQuery, callback_data: PetDeleteCallback):
+    pet_id = callback_data.pet_id
     user = get_user_by_telegram_id(callback.from_user.id)
     if not user:
-        await callback.answer("Пользователь не найден.")
+        await answer_callback(callback, "Пользователь не найден.")
         return
 
-    with connect() as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM pets WHERE id=? AND user_id=?", (pet_id, user[0]))
-        conn.commit()
-
-    pets = get_user_pets(user[0])
-    if not pets:
-        text = "🐾 У вас больше нет питомцев."
-    else:
-        text = "🐾 Ваши питомцы:\n\n"
-        for p in pets:
-            text += f"• {p[1]} ({p[2] or 'вид не указан'}, {p[3] or 'возраст не указан'})\n"
+    remove_pet(pet_id, user.id)
+    await answer_callback(callback, "✅ Питомец удалён.")
+    # экран показываем сразу, не дожидаясь события от шины
+    rendered_screens.invalidate(user.id, "pets", "appointments")
 
-    kb = pets_keyboard(pets)
-    try:
-        await callback.message.edit_text(text, reply_markup=kb)
-    except Exception:
-        await callback.message.answer(text, reply_markup=kb)
-    await callback.answer("✅ Питомец удалён.")
+    text, kb = pets_screen(user.id)
+    await show_screen(callback, text or "🐾 У вас больше нет питомцев.", reply_markup=kb)
 
 
 # === Добавление питомца ===
-@router.callback_query(F.data == "add_pet")
+@callback_routes.register(router, "add_pet")
 async def add_pet_start(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     await state.set_state(PetState.waiting_name)
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🏠 Отмена", callback_data="cancel_pet_add")]
     ])
 
-    await callback.message.edit_text("🐶 Как зовут вашего питомца?\n\n(введите имя в сообщении)", reply_markup=kb)
-    await callback.answer()
+    await show_screen(callback, "🐶 Как зовут вашего питомца?\n\n(введите имя в сообщении)", reply_markup=kb)
 
 
 @router.message(StateFilter(PetState.waiting_name))
@@ -127,6 +121,7 @@ async def pet_name_entered(message: Message, state: FSMContext):
 # === Выбор вида ===
 @router.callback_query(StateFilter(PetState.waiting_species), F.data.startswith("species_"))
 async def pet_species_selected(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     species = callback.data.split("_", 1)[1]
     await state.update_data(pet_species=species)
     await state.set_state(PetState.waiting_age)
@@ -140,13 +135,13 @@ async def pet_species_selected(callback: CallbackQuery, state: FSMContext):
          InlineKeyboardButton(text="🏠 Отмена", callback_data="cancel_pet_add")]
     ])
 
-    await callback.message.edit_text(f"Выбран вид: {species}\n🕐 Укажите возраст питомца:", reply_markup=kb)
-    await callback.answer()
+    await show_screen(callback, f"Выбран вид: {species}\n🕐 Укажите возраст питомца:", reply_markup=kb)
 
 
 # === Выбор возраста ===
 @router.callback_query(StateFilter(PetState.waiting_age), F.data.startswith("age_"))
 async def pet_age_selected(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     age = callback.data.split("_", 1)[1]
 
     data = await state.get_data()
@@ -159,32 +154,29 @@ async def pet_age_selected(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         return
 
-    add_pet(user_id=user[0], name=pet_name, species=pet_species, age=age)
+    await write_queue.add_pet(user_id=user.id, name=pet_name, species=pet_species, age=age)
+    # экран показываем сразу, не дожидаясь события от шины
+    rendered_screens.invalidate(user.id, "pets")
     await state.clear()
 
-    pets = get_user_pets(user[0])
-    text = "🐾 Ваши питомцы:\n\n"
-    for p in pets:
-        text += f"• {p[1]} ({p[2] or 'вид не указан'}, {p[3] or 'возраст не указан'})\n"
-
-    kb = pets_keyboard(pets)
-    await callback.message.edit_text(f"✅ Питомец {pet_name} ({pet_species}, {age}) добавлен!", reply_markup=kb)
-    await callback.answer()
+    _, kb = pets_screen(user.id)
+    await show_screen(callback, f"✅ Питомец {pet_name} ({pet_species}, {age}) добавлен!", reply_markup=kb)
 
 
 # === Кнопка "Назад" и "Отмена" ===
-@router.callback_query(F.data == "back_to_name")
+@callback_routes.register(router, "back_to_name")
 async def back_to_name(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     await state.set_state(PetState.waiting_name)
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🏠 Отмена", callback_data="cancel_pet_add")]
     ])
-    await callback.message.edit_text("🐶 Как зовут вашего питомца? (введите имя)", reply_markup=kb)
-    await callback.answer()
+    await show_screen(callback, "🐶 Как зовут вашего питомца? (введите имя)", reply_markup=kb)
 
 
-@router.callback_query(F.data == "back_to_species")
+@callback_routes.register(router, "back_to_species")
 async def back_to_species(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback)
     await state.set_state(PetState.waiting_species)
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🐱 Кошка", callback_data="species_Кошка"),
@@ -199,12 +191,11 @@ async def back_to_species(callback: CallbackQuery, state: FSMContext):
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_name"),
          InlineKeyboardButton(text="🏠 Отмена", callback_data="cancel_pet_add")]
     ])
-    await callback.message.edit_text("🐾 Выберите вид питомца:", reply_markup=kb)
-    await callback.answer()
+    await show_screen(callback, "🐾 Выберите вид питомца:", reply_markup=kb)
 
 
-@router.callback_query(F.data == "cancel_pet_add")
+@callback_routes.register(router, "cancel_pet_add")
 async def cancel_pet_add(callback: CallbackQuery, state: FSMContext):
+    await answer_callback(callback, "Действие отменено.")
     await state.clear()
-    await callback.message.edit_text("❌ Добавление питомца отменено.", reply_markup=main_menu_inline)
-    await callback.answer("Действие отменено.")
+    await show_screen(callback, "❌ Добавление питомца отменено.", reply_markup=main_menu_inline())
@@ -0,0 +1,190 @@
+# handlers/recorder.py
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+# Методы API, вызванные за время обработки текущего апдейта
+_calls: ContextVar[Optional[list]] = ContextVar("recorded_calls", default=None)
+
+# Личные данные: имена заменяются, идентификаторы и телефоны — псевдонимами, вложения и vCard отбрасываются
+_ID_OWNERS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat", "via_bot"}
+_NAME_KEYS = {"first_name", "last_name", "title"}
+_DROPPED_KEYS = {
+    "username", "bio", "location", "venue", "photo", "document", "voice", "video", "audio",
+    "animation", "sticker", "video_note", "reply_markup", "reply_to_message", "vcard"
+}
+_LETTERS = re.compile(r"[^\W\d_]")
+_DIGITS = re.compile(r"\d")
+
+
+def _open(path, mode):
+    return gzip.open(path, mode + "t", encoding="utf-8") if str(path).endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+def read_log(path):
+    """
+    Записи журнала по порядку: {"t": время прихода, "ms": обработка, "calls": [...], "update": {...}}.
+    Журнал, не закрытый при остановке (оборванный хвост gzip, недописанная строка), читается до обрыва.
+    """
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    logging.warning(f"Журнал {path}: недописанная последняя строка пропущена")
+                    return
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            logging.warning(f"Журнал {path} оборван (не был закрыт) — прочитан до обрыва")
+
+
+class Anonymizer:
+    """
+    Псевдонимы по ключу `salt` (HMAC): один и тот же пользователь в журнале — всегда один id
+    и телефон, но восстановить настоящие по журналу нельзя. С тем же ключом replay
+    переводит в псевдонимы копию БД, и записанные пользователи находятся в ней.
+    Текст сообщений маскируется (буквы -> x, цифры -> 1), кроме команд: номер телефона,
+    набранный текстом, в журнал не попадает. Длина, знаки и «цифровость» остаются,
+    чтобы проверки формата (возраст питомца) вели себя как в проде.
+    """
+
+    def __init__(self, salt=""):
+        self.salt = (salt or secrets.token_hex(16)).encode()
+
+    def _digest(self, value):
+        return hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+
+    def user_id(self, value):
+        if not value:
+            return value
+        pseudo = int.from_bytes(self._digest(abs(value))[:5], "big") + 1
+        return pseudo if value > 0 else -pseudo
+
+    def phone(self, value):
+        if not value:
+            return value
+        return "+7" + str(int.from_bytes(self._digest(value.lstrip("+"))[:8], "big"))[-10:].zfill(10)
+
+    def text(self, value):
+        if value.startswith("/"):
+            return value
+        return _DIGITS.sub("1", _LETTERS.sub("x", value))
+
+    def scrub(self, obj, owner=None):
+        if isinstance(obj, list):
+            return [self.scrub(item, owner) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+        result = {}
+        for key, value in obj.items():
+            if key in _DROPPED_KEYS:
+                continue
+            if key == "id" and owner in _ID_OWNERS or key == "user_id":
+                result[key] = self.user_id(value)
+            elif key == "chat_instance":
+                result[key] = self._digest(value).hex()[:16]
+            elif key == "phone_number":
+                result[key] = self.phone(value)
+            elif key in _NAME_KEYS:
+                result[key] = key
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = self.text(value)
+            else:
+                result[key] = self.scrub(value, key)
+        return result
+
+    def update(self, update: Update):
+        return self.scrub(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+
+@contextmanager
+def track_calls():
+    """Список, в который попадут имена методов API, вызванных внутри блока (и его задач)."""
+    calls = []
+    token = _calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _calls.reset(token)
+
+
+class CallsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: дописывает имя каждого метода API в список track_calls()."""
+
+    async def __call__(self, make_request, bot, method):
+        calls = _calls.get()
+        if calls is not None:
+            calls.append(type(method).__name__)
+        return await make_request(bot, method)
+
+
+class UpdateRecorder(BaseMiddleware):
+    """
+    Outer-middleware для dp.update: дописывает каждый апдейт (в псевдонимах) в журнал
+    JSON Lines — время прихода, длительность обработки и вызванные методы API.
+    Путь с .gz — журнал сжимается. Журнал только дописывается; сбрасывается на диск
+    каждые `flush_every` апдейтов и при close(). Для проигрывания — benchmarks.replay.
+    """
+
+    def __init__(self, path, salt="", flush_every=50):
+        self.anonymizer = Anonymizer(salt)
+        self.flush_every = flush_every
+        self.calls_middleware = CallsMiddleware()
+        self._file = _open(path, "a")
+        self._pending = 0
+        self.stats = {"recorded": 0, "errors": 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        arrived = time.time()
+        started = time.perf_counter()
+        result = None
+        with track_calls() as calls:
+            try:
+                result = await handler(event, data)
+                return result
+            except Exception:
+                self.stats["errors"] += 1
+                calls.append("!error")
+                raise
+            finally:
+                # метод, отданный телом ответа на вебхук, тоже ответ на апдейт
+                if isinstance(result, TelegramMethod):
+                    calls.append(type(result).__name__)
+                self._write({
+                    "t": round(arrived, 3),
+                    "ms": round((time.perf_counter() - started) * 1000, 2),
+                    "calls": calls,
+                    "update": self.anonymizer.update(event),
+                })
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.stats["recorded"] += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        self._file.close()
+
+    def log_stats(self):
+        logging.info(f"🎙 Запись апдейтов: {self.stats}")
@@ -3,8 +3,9 @@ from aiogram import Router, F, types
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from db.db_utils import get_user_by_telegram_id, add_user, add_pet
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from db.db_utils import get_user_by_telegram_id
+from services.write_queue import write_queue
 from handlers.common import main_menu_inline
 
 router = Router()
@@ -46,7 +47,7 @@ async def start_command(message: types.Message, state: FSMContext):
     if user:
         # Пользователь уже зарегистрирован
         sent_menu = await message.answer(
-            f"👋 С возвращением, {user[3] or message.from_user.full_name}! "
+            f"👋 С возвращением, {user.full_name or message.from_user.full_name}! "
             "Выберите действие ниже, чтобы начать пользоваться ботом 🏥",
             reply_markup=main_menu_inline()
         )
@@ -78,7 +79,7 @@ async def process_phone(message: types.Message, state: FSMContext):
     phone = message.contact.phone_number
     full_name = message.from_user.full_name
 
-    add_user(telegram_id=message.from_user.id, phone=phone, full_name=full_name)
+    await write_queue.add_user(telegram_id=message.from_user.id, phone=phone, full_name=full_name)
 
     await state.update_data(phone=phone, full_name=full_name)
     await state.set_state(RegistrationState.waiting_pet_name)
@@ -132,8 +133,8 @@ async def pet_age(message: types.Message, state: FSMContext):
         await state.clear()
         return
 
-    add_pet(
-        user_id=user[0],
+    await write_queue.add_pet(
+        user_id=user.id,
         name=data.get("pet_name"),
         species=data.get("pet_species"),
         age=age
@@ -0,0 +1,154 @@
+# handlers/screen.py
+import logging
+from collections import OrderedDict
+from typing import Optional, Union
+
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+from handlers.webhook_reply import send_or_defer
+
+
+def _content_hash(text, reply_markup):
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+    return hash((text, markup))
+
+
+def _editable(message) -> bool:
+    """Можно ли редактировать сообщение: оно доступно, текстовое и отправлено ботом."""
+    if not isinstance(message, Message) or message.text is None:
+        return False
+    return message.from_user is None or message.from_user.is_bot
+
+
+class ScreenTracker:
+    """
+    Помнит для каждого чата «живой экран» — последнее сообщение бота с меню —
+    и хэш его содержимого. Ограничен по числу чатов (LRU).
+    """
+
+    def __init__(self, max_chats=10000):
+        self.max_chats = max_chats
+        self._screens = OrderedDict()  # chat_id -> (message_id, content_hash)
+        self.stats = {"edits": 0, "sends": 0, "skipped": 0, "sent_up_front": 0, "failed_edits": 0}
+
+    @property
+    def saved_calls(self):
+        """Сколько запросов к API сэкономлено: пропущенные no-op и заранее отклонённые правки."""
+        return self.stats["skipped"] + self.stats["sent_up_front"]
+
+    def get(self, chat_id):
+        return self._screens.get(chat_id)
+
+    def remember(self, chat_id, message_id, content_hash):
+        self._screens[chat_id] = (message_id, content_hash)
+        self._screens.move_to_end(chat_id)
+        if len(self._screens) > self.max_chats:
+            self._screens.popitem(last=False)
+
+    def forget(self, chat_id):
+        self._screens.pop(chat_id, None)
+
+    def log_stats(self):
+        logging.info(f"🖼 Живые экраны: {self.stats}, сэкономлено запросов к API {self.saved_calls}")
+
+
+screens = ScreenTracker()
+
+
+class RenderCache:
+    """
+    Готовые экраны пользователя («Мои записи», «Мои питомцы»): результат отрисовки
+    хранится, пока его не сбросит запись, отмена, добавление или удаление питомца.
+    Запись помечается тегом (например, датой): при другом теге она считается устаревшей.
+    Ограничен по числу экранов (LRU).
+    """
+
+    def __init__(self, max_entries=20000, name="Кэш экранов"):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()  # (user_id, screen) -> (tag, rendered)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    @property
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def get_or_render(self, user_id, screen, render, tag=None):
+        """Экран из кэша или render(); render() вызывается только при промахе."""
+        key = (user_id, screen)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == tag:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        self.stats["misses"] += 1
+        rendered = render()
+        self._entries[key] = (tag, rendered)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        return rendered
+
+    def invalidate(self, user_id, *screens):
+        for screen in screens:
+            if self._entries.pop((user_id, screen), None) is not None:
+                self.stats["invalidations"] += 1
+
+    def clear(self):
+        """Сброс всего кэша — когда пропущены события об изменениях."""
+        self.stats["invalidations"] += len(self._entries)
+        self._entries.clear()
+
+    def log_stats(self):
+        logging.info(f"🗂 {self.name}: {self.stats}, попаданий {self.hit_rate:.0%}")
+
+
+rendered_screens = RenderCache()
+
+
+async def show_screen(
+    event: Union[CallbackQuery, Message],
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    **kwargs
+):
+    """
+    Показывает экран: редактирует сообщение с кнопкой, если это возможно,
+    иначе отправляет новое. Правка с тем же содержимым не отправляется вовсе.
+    Возвращает сообщение, которое стало живым экраном.
+    """
+    if isinstance(event, CallbackQuery):
+        message = event.message
+        chat_id = message.chat.id if message else event.from_user.id
+    else:
+        message, chat_id = None, event.chat.id
+    content_hash = _content_hash(text, reply_markup)
+
+    if message is not None and _editable(message):
+        if screens.get(chat_id) == (message.message_id, content_hash):
+            screens.stats["skipped"] += 1
+            return message
+        try:
+            # телом ответа на вебхук правка уходит, только если на нажатие ещё не ответили;
+            # тогда её результат неизвестен
+            edited = await send_or_defer(message.edit_text(text, reply_markup=reply_markup, **kwargs))
+            screens.stats["edits"] += 1
+            if edited is None:
+                # правку могут отклонить уже после ответа — содержимое экрана не запоминаем
+                screens.forget(chat_id)
+                return message
+            screens.remember(chat_id, message.message_id, content_hash)
+            return edited if isinstance(edited, Message) else message
+        except Exception as e:
+            screens.stats["failed_edits"] += 1
+            logging.debug(f"Не удалось отредактировать сообщение {message.message_id}: {e}")
+    elif message is not None:
+        screens.stats["sent_up_front"] += 1
+
+    sent = await event.bot.send_message(chat_id, text, reply_markup=reply_markup, **kwargs)
+    screens.stats["sends"] += 1
+    screens.remember(chat_id, sent.message_id, content_hash)
+    return sent
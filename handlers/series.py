@@ -0,0 +1,130 @@
+# handlers/series.py
+from datetime import date, timedelta
+
+from aiogram import Router
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.fsm.context import FSMContext
+
+from db.db_utils import (
+    get_user_by_telegram_id,
+    get_user_pets,
+    get_doctors,
+    find_series_slots,
+    book_series
+)
+from db.rows import Slot
+from handlers.booking import BookingStates, build_list_kb, nav_footer
+from handlers.screen import show_screen
+from handlers.webhook_reply import answer_callback
+from handlers.callbacks import callback_routes, PetChoiceCallback, SeriesPlanCallback
+from services.holds import slot_holds
+
+router = Router()
+
+# (каждые N дней, визитов) — типовые курсы: вакцинация, повторные осмотры
+SERIES_PRESETS = [
+    (7, 2, "Каждую неделю × 2"),
+    (7, 3, "Каждую неделю × 3"),
+    (14, 3, "Каждые 2 недели × 3"),
+    (21, 3, "Каждые 3 недели × 3"),
+    (28, 4, "Каждые 4 недели × 4"),
+]
+
+
+# === Выбор схемы курса ===
+@callback_routes.register(router, "series_start", BookingStates.pet)
+async def series_start(callback: CallbackQuery):
+    await answer_callback(callback)
+    items = [(title, SeriesPlanCallback(every_days=every, count=count).pack()) for every, count, title in SERIES_PRESETS]
+    await show_screen(
+        callback,
+        "🔁 Курс визитов: первый визит — в выбранное время, остальные подберём автоматически.\n"
+        "Выберите схему:",
+        reply_markup=build_list_kb(items, footer_rows=nav_footer("back_to_time"))
+    )
+
+
+# === Подбор слотов на весь курс ===
+@callback_routes.register(router, SeriesPlanCallback, BookingStates.pet)
+async def series_plan(callback: CallbackQuery, callback_data: SeriesPlanCallback, state: FSMContext):
+    await answer_callback(callback)
+    data = await state.get_data()
+    doctor_id, date_iso, schedule_id = data.get("doctor_id"), data.get("date"), data.get("schedule_id")
+    service_id = data.get("service_id")
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not (doctor_id and date_iso and schedule_id and service_id and user):
+        await callback.message.answer("❌ Ошибка данных. Пожалуйста, начните запись заново.")
+        await state.clear()
+        return
+
+    # первый визит — уже удержанный слот, остальные ищем у того же врача, затем у любого
+    first_time = data.get("time")
+    rest_start = date.fromisoformat(date_iso) + timedelta(days=callback_data.every_days)
+    search = dict(
+        service_id=service_id,
+        start_date=rest_start,
+        interval_days=callback_data.every_days,
+        count=callback_data.count - 1,
+        preferred_time=first_time,
+        window_days=min(2, callback_data.every_days - 1)
+    )
+    rest = find_series_slots(doctor_id=doctor_id, **search) or find_series_slots(doctor_id=None, **search)
+    if not rest:
+        await show_screen(
+            callback,
+            "⚠️ Не удалось подобрать все визиты курса. Выберите другую схему или запишитесь на один визит.",
+            reply_markup=build_list_kb([], footer_rows=nav_footer("back_to_time"))
+        )
+        return
+
+    plan = [Slot(doctor_id, date_iso, first_time)] + rest
+    await state.update_data(series_plan=plan)
+
+    doctor_names = {d.id: d.full_name for d in get_doctors()}
+    lines = [
+        f"{n}. 📅 {visit_date} в {visit_time} — {doctor_names.get(visit_doctor, '')}"
+        for n, (visit_doctor, visit_date, visit_time) in enumerate(plan, 1)
+    ]
+    pets = get_user_pets(user.id)
+    items = [(p.name, PetChoiceCallback(pet_id=p.id).pack()) for p in pets]
+    await show_screen(
+        callback,
+        "🔁 <b>Курс визитов:</b>\n\n" + "\n".join(lines) + "\n\n🐶 Выберите питомца — запишем на все визиты сразу:",
+        reply_markup=build_list_kb(items, footer_rows=nav_footer("back_to_time")),
+        parse_mode="HTML"
+    )
+    await state.set_state(BookingStates.series)
+
+
+# === Бронирование курса целиком ===
+@callback_routes.register(router, PetChoiceCallback, BookingStates.series)
+async def series_choose_pet(callback: CallbackQuery, callback_data: PetChoiceCallback, state: FSMContext):
+    await answer_callback(callback)
+    data = await state.get_data()
+    plan = data.get("series_plan")
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not (plan and user and data.get("service_id")):
+        await callback.message.answer("❌ Ошибка данных. Пожалуйста, начните запись заново.")
+        await state.clear()
+        return
+
+    try:
+        appointment_ids = book_series(user.id, callback_data.pet_id, data["service_id"], plan)
+    except ValueError as e:
+        await callback.message.answer(f"⚠️ Не удалось записать курс: {e}. Ни один визит не забронирован.")
+        await state.clear()
+        return
+    slot_holds.converted()
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📋 Мои записи", callback_data="my_appointments")],
+        [InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")]
+    ])
+    numbers = ", ".join(f"#{a}" for a in appointment_ids)
+    await show_screen(
+        callback,
+        f"✅ <b>Курс из {len(appointment_ids)} визитов записан!</b>\n\n<i>Номера записей: {numbers}</i>",
+        reply_markup=kb,
+        parse_mode="HTML"
+    )
+    await state.clear()
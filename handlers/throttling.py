@@ -0,0 +1,105 @@
+# handlers/throttling.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from handlers.webhook_reply import answer_callback
+
+THROTTLED_TEXT = "⏳ Слишком часто. Подождите секунду."
+
+
+def parse_prefix_rates(spec):
+    """"simple_cal=1/3,book_visit=0.5/2" -> {"simple_cal": (1.0, 3), "book_visit": (0.5, 2)}"""
+    rates = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            prefix, rate = part.split("=", 1)
+            per_second, burst = rate.split("/", 1)
+            rates[prefix.strip()] = (float(per_second), int(burst))
+    return rates
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "generation")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+        self.generation = 0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Token bucket на каждого telegram_id (и отдельный — для префиксов с собственным лимитом).
+    Лишние нажатия отбрасываются с коротким ответом, а для префиксов из `coalesce`
+    выполняется только последнее нажатие после паузы. Число корзин ограничено (LRU).
+    """
+
+    def __init__(self, rate=2.0, burst=5, prefix_rates=None, coalesce=(), max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.prefix_rates = prefix_rates or {}
+        self.coalesce = set(coalesce)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self.stats = {"passed": 0, "dropped": 0, "coalesced": 0}
+
+    def _bucket(self, key, burst, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _take(self, bucket, rate, burst, now):
+        """Пытается взять токен; возвращает 0 или время ожидания до следующего токена."""
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0
+        return (1 - bucket.tokens) / rate
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        prefix = (event.data or "").split(":", 1)[0]
+        rate, burst = self.prefix_rates.get(prefix, (self.rate, self.burst))
+        key = (event.from_user.id, prefix if prefix in self.prefix_rates else None)
+
+        now = time.monotonic()
+        bucket = self._bucket(key, burst, now)
+        wait = self._take(bucket, rate, burst, now)
+        if not wait:
+            self.stats["passed"] += 1
+            return await handler(event, data)
+
+        if prefix not in self.coalesce:
+            self.stats["dropped"] += 1
+            await answer_callback(event, THROTTLED_TEXT)
+            return None
+
+        # склейка: ждём токен, выполняется только последнее нажатие
+        bucket.generation += 1
+        generation = bucket.generation
+        await asyncio.sleep(wait)
+        if bucket.generation != generation:
+            self.stats["coalesced"] += 1
+            await answer_callback(event)
+            return None
+        now = time.monotonic()
+        # токен за время сна мог забрать другой запрос того же ключа — в долг не уходим
+        bucket.tokens = max(0.0, min(burst, bucket.tokens + (now - bucket.updated) * rate) - 1)
+        bucket.updated = now
+        self.stats["passed"] += 1
+        return await handler(event, data)
@@ -0,0 +1,145 @@
+# handlers/waitlist.py
+from datetime import datetime
+
+from aiogram import Router
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.fsm.context import FSMContext
+
+from config import WAITLIST_OFFER_MINUTES
+from db.db_utils import (
+    get_user_by_telegram_id,
+    get_user_pets,
+    add_to_waitlist,
+    take_waitlist_offer,
+    decline_waitlist_offer,
+    CLINIC_TZ
+)
+from handlers.booking import BookingStates, build_list_kb, nav_footer
+from handlers.common import main_menu_inline
+from handlers.screen import show_screen
+from handlers.webhook_reply import answer_callback
+from handlers.callbacks import (
+    callback_routes,
+    PetChoiceCallback,
+    WaitlistJoinCallback,
+    WaitlistTakeCallback,
+    WaitlistDeclineCallback
+)
+from services.waitlist import waitlist_matcher
+
+router = Router()
+
+
+# === Предложение освободившегося слота ===
+async def send_offer(bot, offer):
+    waitlist_id, telegram_id, pet_name, doctor_name, service_name, date_iso, time_str, expires_ts = offer
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Записаться", callback_data=WaitlistTakeCallback(waitlist_id=waitlist_id).pack())],
+        [InlineKeyboardButton(text="✖️ Не нужно", callback_data=WaitlistDeclineCallback(waitlist_id=waitlist_id).pack())]
+    ])
+    await bot.send_message(
+        telegram_id,
+        f"🔔 <b>Освободилось время!</b>\n\n"
+        f"🐾 Питомец: {pet_name}\n"
+        f"👩‍⚕️ Врач: {doctor_name}\n"
+        f"🧾 Услуга: {service_name}\n"
+        f"📅 {date_iso} в {time_str}\n\n"
+        f"<i>Предложение действует до {datetime.fromtimestamp(expires_ts, CLINIC_TZ):%H:%M}.</i>",
+        reply_markup=kb,
+        parse_mode="HTML"
+    )
+
+
+# === Встать в лист ожидания ===
+async def _join_waitlist(callback: CallbackQuery, state: FSMContext, user_id, pet_id):
+    data = await state.get_data()
+    service_id = data.get("service_id")
+    if not service_id:
+        await callback.message.answer("❌ Сначала выберите услугу.")
+        return
+
+    add_to_waitlist(user_id, pet_id, service_id, data.get("waitlist_doctor_id"))
+    await show_screen(
+        callback,
+        "🔔 Вы в листе ожидания.\n"
+        f"Как только освободится подходящее время, мы пришлём предложение — на ответ будет {WAITLIST_OFFER_MINUTES} мин.",
+        reply_markup=main_menu_inline()
+    )
+    await state.clear()
+
+
+@callback_routes.register(router, WaitlistJoinCallback, BookingStates.doctor)
+async def join_waitlist(callback: CallbackQuery, callback_data: WaitlistJoinCallback, state: FSMContext):
+    await answer_callback(callback)
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.message.answer("❗ Пользователь не найден. Введите /start.")
+        return
+
+    data = await state.get_data()
+    await state.update_data(waitlist_doctor_id=None if callback_data.any_doctor else data.get("doctor_id"))
+
+    pets = get_user_pets(user.id)
+    if not pets:
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="➕ Добавить питомца", callback_data="add_pet")],
+            [InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")]
+        ])
+        await show_screen(callback, "🐾 Сначала добавьте питомца.", reply_markup=kb)
+        return
+    if len(pets) == 1:
+        await _join_waitlist(callback, state, user.id, pets[0].id)
+        return
+
+    items = [(p.name, PetChoiceCallback(pet_id=p.id).pack()) for p in pets]
+    await show_screen(callback, "🐶 Для какого питомца ждём время?", reply_markup=build_list_kb(items, nav_footer()))
+    await state.set_state(BookingStates.waitlist)
+
+
+@callback_routes.register(router, PetChoiceCallback, BookingStates.waitlist)
+async def choose_waitlist_pet(callback: CallbackQuery, callback_data: PetChoiceCallback, state: FSMContext):
+    await answer_callback(callback)
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.message.answer("❗ Пользователь не найден. Введите /start.")
+        return
+    await _join_waitlist(callback, state, user.id, callback_data.pet_id)
+
+
+# === Ответ на предложение ===
+@callback_routes.register(router, WaitlistTakeCallback)
+async def take_offer(callback: CallbackQuery, callback_data: WaitlistTakeCallback):
+    user = get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден.")
+        return
+
+    try:
+        appointment_id = take_waitlist_offer(callback_data.waitlist_id, user.id)
+    except ValueError as e:
+        await answer_callback(callback, f"⚠️ {e}", show_alert=True)
+        await show_screen(callback, "⌛ Это предложение больше не действует.", reply_markup=main_menu_inline())
+        return
+
+    waitlist_matcher.accepted()
+    await answer_callback(callback, "✅ Вы записаны!")
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📋 Мои записи", callback_data="my_appointments")],
+        [InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu")]
+    ])
+    await show_screen(
+        callback,
+        f"✅ <b>Запись создана!</b>\n\n<i>Номер записи: #{appointment_id}</i>",
+        reply_markup=kb,
+        parse_mode="HTML"
+    )
+
+
+@callback_routes.register(router, WaitlistDeclineCallback)
+async def decline_offer(callback: CallbackQuery, callback_data: WaitlistDeclineCallback):
+    await answer_callback(callback)
+    user = get_user_by_telegram_id(callback.from_user.id)
+    slot = decline_waitlist_offer(callback_data.waitlist_id, user.id) if user else None
+    if slot:
+        waitlist_matcher.declined(slot)
+    await show_screen(callback, "👌 Предложение отклонено.", reply_markup=main_menu_inline())
@@ -0,0 +1,70 @@
+# handlers/webhook_reply.py
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Update
+
+# Первый вызов API за апдейт можно вернуть телом ответа на вебхук вместо отдельного HTTP-запроса
+_reply_slot: ContextVar[Optional[list]] = ContextVar("webhook_reply_slot", default=None)
+
+stats = {"deferred": 0, "sent": 0}
+
+
+class WebhookReplyMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.update (только в режиме вебхука): открывает «слот ответа»
+    на время обработки апдейта и возвращает отложенный метод как результат,
+    который SimpleRequestHandler отдаёт Telegram в теле ответа.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        slot = []
+        token = _reply_slot.set(slot)
+        try:
+            result = await handler(event, data)
+        finally:
+            _reply_slot.reset(token)
+
+        if not slot:
+            return result
+        if isinstance(result, TelegramMethod):
+            # обработчик сам вернул метод — отложенный отправляем обычным запросом
+            await data["bot"](slot[0])
+            return result
+        return slot[0]
+
+
+async def send_or_defer(method: TelegramMethod):
+    """
+    Отправляет метод API. Если идёт обработка вебхука и слот ответа свободен —
+    откладывает его в ответ на вебхук и возвращает None (результат вызова неизвестен).
+    """
+    slot = _reply_slot.get()
+    if slot is not None and not slot:
+        slot.append(method)
+        stats["deferred"] += 1
+        return None
+    stats["sent"] += 1
+    return await method
+
+
+async def answer_callback(callback: CallbackQuery, text: Optional[str] = None, show_alert: Optional[bool] = None):
+    """
+    Ответ на нажатие кнопки; в режиме вебхука уходит телом ответа, если слот свободен.
+    Обработчики отвечают на нажатие первыми, поэтому слот обычно занимает именно
+    answerCallbackQuery, а правка экрана после него уходит обычным запросом.
+    """
+    await send_or_defer(callback.answer(text, show_alert=show_alert))
+
+
+def log_stats():
+    """Сколько вызовов API ушло телом ответа на вебхук, а сколько — отдельными запросами."""
+    logging.info(f"↩️ Ответы на вебхук: {stats}")
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+# Шину импортирует db_utils, поэтому настройка читается здесь, а не из config (там обязателен BOT_TOKEN)
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))  # очередь на подписчика; при переполнении событие теряется
+
+
+# === События изменения данных (публикуются db_utils после COMMIT) ===
+# id записей и врачей уникальны только внутри филиала, поэтому события записей несут clinic_id
+@dataclass(frozen=True)
+class AppointmentBooked:
+    appointment_id: int
+    user_id: int
+    pet_id: int
+    doctor_id: int
+    date: str
+    time: str
+    clinic_id: str
+
+
+@dataclass(frozen=True)
+class AppointmentCancelled:
+    appointment_id: int
+    user_id: int
+    doctor_id: int
+    date: str
+    time: str
+    clinic_id: str
+
+
+@dataclass(frozen=True)
+class PetAdded:
+    pet_id: int
+    user_id: int
+
+
+@dataclass(frozen=True)
+class PetDeleted:
+    pet_id: int
+    user_id: int
+
+
+class _Subscriber:
+    def __init__(self, name, handler, event_types, queue_size, on_overflow):
+        self.name = name
+        self.handler = handler
+        self.event_types = event_types
+        self.on_overflow = on_overflow
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = {"delivered": 0, "dropped": 0, "errors": 0, "max_depth": 0, "max_lag": 0.0}
+
+
+class EventBus:
+    """
+    Шина событий внутри процесса. publish() не ждёт подписчиков: событие кладётся
+    в ограниченную очередь каждого подходящего подписчика, обработка — в его
+    собственной задаче. Если подписчик не успевает и очередь полна, событие
+    отбрасывается и вызывается его on_overflow (например, полный сброс кэша).
+    publish() можно вызывать из любого потока: раздача всегда идёт в цикле событий.
+    """
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscribers = []
+        self._loop = None
+        self.stats = {"published": 0, "unobserved": 0}
+
+    def subscribe(self, name, handler, *event_types, queue_size=None, on_overflow=None):
+        """handler(event) — обычная функция или корутина; event_types — классы событий."""
+        self._subscribers.append(_Subscriber(name, handler, event_types, queue_size or self.queue_size, on_overflow))
+
+    def publish(self, event):
+        if self._loop is None:
+            # шина не запущена (скрипты, обслуживание из консоли) — некому доставлять
+            self.stats["unobserved"] += 1
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(event, time.monotonic())
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, event, time.monotonic())
+
+    def _dispatch(self, event, published_at):
+        self.stats["published"] += 1
+        for sub in self._subscribers:
+            if not isinstance(event, sub.event_types):
+                continue
+            try:
+                sub.queue.put_nowait((event, published_at))
+            except asyncio.QueueFull:
+                sub.stats["dropped"] += 1
+                if sub.on_overflow:
+                    sub.on_overflow()
+                continue
+            sub.stats["max_depth"] = max(sub.stats["max_depth"], sub.queue.qsize())
+
+    async def _consume(self, sub):
+        while True:
+            event, published_at = await sub.queue.get()
+            sub.stats["max_lag"] = max(sub.stats["max_lag"], time.monotonic() - published_at)
+            try:
+                result = sub.handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+                sub.stats["delivered"] += 1
+            except Exception:
+                sub.stats["errors"] += 1
+                logging.exception(f"Ошибка подписчика {sub.name} на {type(event).__name__}")
+
+    async def run(self):
+        """Фоновая задача: по задаче-обработчику на подписчика."""
+        logging.info(f"📣 Шина событий запущена, подписчиков: {len(self._subscribers)}")
+        self._loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(self._consume(sub) for sub in self._subscribers))
+        finally:
+            self._loop = None
+
+    def log_stats(self):
+        logging.info(f"📣 Шина событий: {self.stats}")
+        for sub in self._subscribers:
+            logging.info(f"📣   {sub.name}: {sub.stats}, в очереди {sub.queue.qsize()}")
+
+
+bus = EventBus(queue_size=EVENT_QUEUE_SIZE)
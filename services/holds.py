@@ -0,0 +1,89 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from config import SLOT_HOLD_SECONDS
+from db.db_utils import clinic_ids, current_clinic, use_clinic, hold_slot, release_hold, get_active_holds, expire_holds
+
+
+class SlotHolds:
+    """
+    Удержание выбранного слота, пока пользователь проходит мастер записи.
+    Сроки удержаний лежат в куче: фоновая задача спит до ближайшего истечения
+    и снимает только истёкшие удержания, без периодического просмотра таблицы.
+    """
+
+    def __init__(self, ttl_seconds=600):
+        self.ttl_seconds = ttl_seconds
+        self._heap = []  # (held_until, clinic_id, schedule_id)
+        self._wakeup = asyncio.Event()
+        self.stats = {"placed": 0, "converted": 0, "released": 0, "expired": 0}
+
+    @property
+    def conversion_rate(self):
+        """Доля удержаний, закончившихся записью."""
+        return self.stats["converted"] / self.stats["placed"] if self.stats["placed"] else 0.0
+
+    def _push(self, held_until, clinic_id, schedule_id):
+        heapq.heappush(self._heap, (held_until, clinic_id, schedule_id))
+        if self._heap[0] == (held_until, clinic_id, schedule_id):
+            self._wakeup.set()
+
+    def hold(self, doctor_id, date_iso, time_str, user_id):
+        """Удерживает слот за пользователем; бросает ValueError, если слот занят или удержан другим."""
+        schedule_id, held_until = hold_slot(doctor_id, date_iso, time_str, user_id, self.ttl_seconds)
+        self.stats["placed"] += 1
+        self._push(held_until, current_clinic(), schedule_id)
+        return schedule_id
+
+    def release(self, schedule_id, user_id):
+        """Пользователь ушёл со слота сам (например, вернулся к выбору времени)."""
+        if release_hold(schedule_id, user_id):
+            self.stats["released"] += 1
+
+    def converted(self):
+        """Удержание закончилось записью (сама бронь снимает удержание в той же транзакции)."""
+        self.stats["converted"] += 1
+
+    def load(self):
+        """Подхватывает удержания, оставшиеся в БД после перезапуска."""
+        for clinic_id in clinic_ids():
+            with use_clinic(clinic_id):
+                for held_until, schedule_id in get_active_holds():
+                    self._push(held_until, clinic_id, schedule_id)
+
+    async def run(self, on_expired=None):
+        """Фоновая задача. on_expired(doctor_id, date, time, clinic_id) — куда отдать освободившийся слот."""
+        logging.info("⏳ Истечение удержаний слотов запущено...")
+        while True:
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            now = time.time()
+            due = {}
+            while self._heap and self._heap[0][0] <= now:
+                held_until, clinic_id, schedule_id = heapq.heappop(self._heap)
+                due.setdefault(clinic_id, []).append((held_until, schedule_id))
+
+            for clinic_id, holds in due.items():
+                try:
+                    with use_clinic(clinic_id):
+                        freed = await asyncio.to_thread(expire_holds, holds)
+                except Exception:
+                    logging.exception("Ошибка снятия удержаний слотов")
+                    continue
+                self.stats["expired"] += len(freed)
+                if on_expired:
+                    for slot in freed:
+                        on_expired(*slot, clinic_id)
+
+    def log_stats(self):
+        logging.info(f"⏳ Удержания слотов: {self.stats}, конверсия в запись {self.conversion_rate:.0%}")
+
+
+slot_holds = SlotHolds(ttl_seconds=SLOT_HOLD_SECONDS)
@@ -0,0 +1,120 @@
+import logging
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import (
+    BOT_API_BASE_URL,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_DNS_CACHE_SECONDS,
+    HTTP_TIMEOUT,
+    HTTP_METHOD_TIMEOUTS
+)
+
+
+def parse_method_timeouts(spec):
+    """"sendMessage=10,deleteMessage=5" -> {"sendMessage": 10.0, "deleteMessage": 5.0}"""
+    timeouts = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            method, seconds = part.split("=", 1)
+            timeouts[method.strip()] = float(seconds)
+    return timeouts
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    Сессия Bot API с настраиваемым пулом соединений, keep-alive, DNS-кэшем
+    и таймаутами по методам. Считает запросы в полёте и переиспользование соединений.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0, keepalive_timeout=15.0,
+                 dns_cache_ttl=3600, method_timeouts=None, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=dns_cache_ttl > 0,
+            ttl_dns_cache=dns_cache_ttl if dns_cache_ttl > 0 else None,
+        )
+        self.method_timeouts = method_timeouts or {}
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+        }
+
+    @property
+    def reuse_rate(self):
+        total = self.stats["new_connections"] + self.stats["reused_connections"]
+        return self.stats["reused_connections"] / total if total else 0.0
+
+    def _trace_config(self):
+        trace = TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.stats["new_connections"] += 1
+
+        async def on_reuse(session, ctx, params):
+            self.stats["reused_connections"] += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot, method, timeout=None):
+        if timeout is None:
+            timeout = self.method_timeouts.get(method.__api_method__)
+
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            return await super().make_request(bot, method, timeout)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+
+    def log_stats(self):
+        logging.info(f"🌐 HTTP: {self.stats}, переиспользование соединений {self.reuse_rate:.0%}")
+
+
+def build_session():
+    """Сессия для Bot из настроек config.py. BOT_API_BASE_URL — например, локальный фейковый Bot API."""
+    kwargs = {}
+    if BOT_API_BASE_URL:
+        kwargs["api"] = TelegramAPIServer.from_base(BOT_API_BASE_URL)
+    return TunedAiohttpSession(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        dns_cache_ttl=HTTP_DNS_CACHE_SECONDS,
+        method_timeouts=parse_method_timeouts(HTTP_METHOD_TIMEOUTS),
+        timeout=HTTP_TIMEOUT,
+        **kwargs
+    )
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+
+from config import ARCHIVE_KEEP_DAYS, ARCHIVE_BATCH_SIZE
+from db.db_utils import (
+    clinic_ids,
+    use_clinic,
+    cleanup_old_schedule,
+    compact_database,
+    reconcile_booked_slots,
+    check_free_slot_counts
+)
+
+
+def run_maintenance():
+    """Сверка занятых слотов и счётчиков, архивация прошедших данных и сжатие БД каждого филиала. Выполняется в отдельном потоке."""
+    moved_appointments = moved_slots = 0
+    for clinic_id in clinic_ids():
+        with use_clinic(clinic_id):
+            appointments, slots = _maintain_clinic(clinic_id)
+        moved_appointments += appointments
+        moved_slots += slots
+    return moved_appointments, moved_slots
+
+
+def _maintain_clinic(clinic_id):
+    freed = reconcile_booked_slots()
+    if freed:
+        logging.info(f"🔧 [{clinic_id}] Освобождено слотов без действующих записей: {freed}")
+    mismatches = check_free_slot_counts(fix=True)
+    if mismatches:
+        logging.warning(f"🔧 [{clinic_id}] Исправлены счётчики свободных слотов ({len(mismatches)}): {mismatches[:10]}")
+    moved_appointments, moved_slots = cleanup_old_schedule(
+        keep_days=ARCHIVE_KEEP_DAYS,
+        batch_size=ARCHIVE_BATCH_SIZE
+    )
+    compact_database()
+    logging.info(f"🧹 [{clinic_id}] Архивировано записей: {moved_appointments}, слотов: {moved_slots}")
+    return moved_appointments, moved_slots
+
+
+# === Задание планировщика ===
+async def maintenance_job():
+    await asyncio.to_thread(run_maintenance)
@@ -1,15 +1,241 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import time
 from datetime import datetime
-import asyncio
 
-async def send_reminders(bot):
-    now = datetime.now().strftime("%H:%M:%S")
-    await bot.send_message(
-        chat_id=123456789,  # 🔸 временно можно подставить свой Telegram ID
-        text=f"🔔 Тестовое напоминание — {now}"
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from config import JOB_MISFIRE_GRACE_SECONDS, JOB_LOCK_LEASE_SECONDS
+from db import db_utils
+from db.db_utils import acquire_job_lock, release_job_lock
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SQLiteJobStore(BaseJobStore):
+    """
+    Хранилище заданий APScheduler в таблице SQLite через sqlite3 (без SQLAlchemy).
+    Время следующего запуска переживает перезапуск бота.
+    """
+
+    def __init__(self, path, tablename="apscheduler_jobs", pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path
+        self.tablename = tablename
+        self.pickle_protocol = pickle_protocol
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        with self._connect() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.tablename} (
+                    id TEXT PRIMARY KEY,
+                    next_run_time REAL,
+                    job_state BLOB NOT NULL
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tablename}_next ON {self.tablename}(next_run_time)")
+            conn.commit()
+
+    def lookup_job(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT job_state FROM {self.tablename} WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT next_run_time FROM {self.tablename} WHERE next_run_time IS NOT NULL "
+                f"ORDER BY next_run_time LIMIT 1"
+            ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT INTO {self.tablename} (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time), self._dump(job))
+                )
+                conn.commit()
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self._connect() as conn:
+            cur = conn.execute(
+                f"UPDATE {self.tablename} SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (datetime_to_utc_timestamp(job.next_run_time), self._dump(job), job.id)
+            )
+            conn.commit()
+        if cur.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._connect() as conn:
+            cur = conn.execute(f"DELETE FROM {self.tablename} WHERE id = ?", (job_id,))
+            conn.commit()
+        if cur.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.tablename}")
+            conn.commit()
+
+    def _dump(self, job):
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        state = pickle.loads(job_state)
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where="", params=()):
+        jobs = []
+        failed_ids = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, job_state FROM {self.tablename} {where} ORDER BY next_run_time", params
+            ).fetchall()
+            for job_id, job_state in rows:
+                try:
+                    jobs.append(self._reconstitute_job(job_state))
+                except Exception:
+                    self._logger.exception(f'Не удалось восстановить задание "{job_id}" — удаляем')
+                    failed_ids.append((job_id,))
+            if failed_ids:
+                conn.executemany(f"DELETE FROM {self.tablename} WHERE id = ?", failed_ids)
+                conn.commit()
+        return jobs
+
+
+# === Задания ===
+# В хранилище лежит только имя задания; сама корутина (с ботом в замыкании) — в этом реестре
+_jobs = {}  # name -> (coroutine function, время ежедневного запуска или None, параметры интервала)
+stats = {}  # name -> метрики запусков
+
+
+def register_job(name, func, daily_at=None, **interval):
+    """
+    Регистрирует периодическое задание: register_job("reminders", coro_fn, minutes=5)
+    или ежедневное в заданное время клиники: register_job("digest", coro_fn, daily_at="08:00").
+    """
+    _jobs[name] = (func, daily_at, interval)
+    stats[name] = {
+        "runs": 0,
+        "failures": 0,
+        "skipped_locked": 0,
+        "skipped_running": 0,
+        "missed": 0,
+        "last_duration": 0.0,
+        "max_duration": 0.0,
+        "total_duration": 0.0,
+    }
+
+
+async def run_job(name):
+    """Точка входа всех заданий: блокировка между процессами, замер длительности, учёт итога."""
+    if name not in _jobs:
+        logging.warning(f"Задание {name} не зарегистрировано — пропуск")
+        return
+    job_stats = stats[name]
+    if not acquire_job_lock(name, WORKER_ID, JOB_LOCK_LEASE_SECONDS):
+        job_stats["skipped_locked"] += 1
+        return
+
+    func = _jobs[name][0]
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        await func()
+    except Exception:
+        status = "error"
+        job_stats["failures"] += 1
+        logging.exception(f"Ошибка задания {name}")
+    finally:
+        duration = time.perf_counter() - start
+        release_job_lock(name, WORKER_ID, status, duration)
+        job_stats["runs"] += 1
+        job_stats["last_duration"] = duration
+        job_stats["max_duration"] = max(job_stats["max_duration"], duration)
+        job_stats["total_duration"] += duration
+
+
+def _on_skipped(event):
+    if event.job_id in stats:
+        key = "missed" if event.code == EVENT_JOB_MISSED else "skipped_running"
+        stats[event.job_id][key] += 1
+
+
+def setup_scheduler():
+    """
+    Запускает AsyncIOScheduler с хранилищем заданий в БД. Пропущенные за время простоя
+    запуски склеиваются в один (coalesce), а опоздавшие больше чем на
+    JOB_MISFIRE_GRACE_SECONDS — пропускаются. Сохранённое расписание задания
+    не сбрасывается при перезапуске, если его интервал не менялся.
+    """
+    scheduler = AsyncIOScheduler(
+        jobstores={"default": SQLiteJobStore(db_utils.DB_PATH)},
+        job_defaults={"coalesce": True, "misfire_grace_time": JOB_MISFIRE_GRACE_SECONDS, "max_instances": 1},
     )
+    scheduler.add_listener(_on_skipped, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    scheduler.start(paused=True)
+
+    for name, (_, daily_at, interval) in _jobs.items():
+        if daily_at:
+            hour, minute = daily_at.split(":")
+            trigger = CronTrigger(hour=int(hour), minute=int(minute), timezone=db_utils.CLINIC_TZ)
+            # ежедневное задание ждёт своего времени, интервальное — запускается сразу
+            first_run = {}
+        else:
+            trigger = IntervalTrigger(**interval)
+            first_run = {"next_run_time": datetime.now(scheduler.timezone)}
+        existing = scheduler.get_job(name)
+        if existing is not None and str(existing.trigger) == str(trigger):
+            continue
+        scheduler.add_job(
+            run_job, trigger, args=(name,), id=name, name=name,
+            replace_existing=True, **first_run
+        )
+    for job in scheduler.get_jobs():
+        if job.id not in _jobs:
+            job.remove()
+
+    scheduler.resume()
+    return scheduler
+
 
-def setup_scheduler(bot):
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_reminders, "interval", minutes=30, args=(bot,))
-    scheduler.start()
+def log_stats():
+    for name, job_stats in stats.items():
+        runs = job_stats["runs"]
+        avg = job_stats["total_duration"] / runs if runs else 0.0
+        logging.info(
+            f"⏱ Задание {name}: запусков {runs}, ошибок {job_stats['failures']}, "
+            f"пропущено {job_stats['missed']}, занято другим процессом {job_stats['skipped_locked']}, "
+            f"среднее {avg:.2f} с, максимум {job_stats['max_duration']:.2f} с"
+        )
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from config import BROADCAST_RATE
+
+
+class RateLimitedSender:
+    """
+    Рассылка с общим ограничением частоты: не больше `rate` сообщений в секунду
+    на всех получателей (Bot API пропускает около 30 в секунду, дальше — 429).
+    Сообщения уходят параллельно, но каждое ждёт своей очереди по времени. На
+    TelegramRetryAfter пауза ставится всей рассылке, сообщение повторяется.
+    Заблокировавшие бота пропускаются.
+    """
+
+    def __init__(self, rate=25.0, max_retries=3):
+        self.interval = 1 / rate
+        self.max_retries = max_retries
+        self._next_at = 0.0
+        self.stats = {"sent": 0, "retried": 0, "blocked": 0, "failed": 0}
+
+    async def _wait_turn(self):
+        now = asyncio.get_running_loop().time()
+        at = max(now, self._next_at)
+        self._next_at = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    async def send(self, bot, chat_id, text, **kwargs):
+        """Отправляет одно сообщение в общем темпе; True — доставлено."""
+        for _ in range(self.max_retries + 1):
+            await self._wait_turn()
+            try:
+                await bot.send_message(chat_id, text, **kwargs)
+                self.stats["sent"] += 1
+                return True
+            except TelegramRetryAfter as e:
+                self.stats["retried"] += 1
+                self._next_at = max(self._next_at, asyncio.get_running_loop().time() + e.retry_after)
+            except TelegramForbiddenError:
+                self.stats["blocked"] += 1
+                return False
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.warning(f"Не удалось отправить сообщение {chat_id}: {e}")
+                return False
+        self.stats["failed"] += 1
+        return False
+
+    async def send_many(self, bot, messages, **kwargs):
+        """messages — [(chat_id, text)]. Возвращает число доставленных."""
+        delivered = await asyncio.gather(*(self.send(bot, chat_id, text, **kwargs) for chat_id, text in messages))
+        return sum(delivered)
+
+    def log_stats(self):
+        logging.info(f"📨 Рассылки: {self.stats}")
+
+
+broadcast_sender = RateLimitedSender(rate=BROADCAST_RATE)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+from config import WAITLIST_OFFER_MINUTES, WAITLIST_SWEEP_SECONDS, WAITLIST_BATCH_DELAY
+from db.db_utils import clinic_ids, current_clinic, use_clinic, match_waitlist, find_waitlist_slots, expire_waitlist_offers
+
+
+class WaitlistMatcher:
+    """
+    Раздаёт освободившиеся слоты листу ожидания. Отмены сообщают о слотах сразу
+    (slot_freed), они копятся `batch_delay` секунд и сопоставляются одной транзакцией.
+    Раз в `sweep_seconds` — просрочка предложений и поиск новых слотов из шаблонов.
+    Слоты сопоставляются с листом ожидания своего филиала, транзакция — на филиал.
+    """
+
+    def __init__(self, offer_minutes=15, sweep_seconds=60, batch_delay=1.0):
+        self.offer_minutes = offer_minutes
+        self.sweep_seconds = sweep_seconds
+        self.batch_delay = batch_delay
+        self._pending = set()
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            "batches": 0,
+            "max_batch": 0,
+            "offers": 0,
+            "send_errors": 0,
+            "accepted": 0,
+            "declined": 0,
+            "expired": 0,
+        }
+
+    def slot_freed(self, doctor_id, date_iso, time_str, clinic_id=None):
+        self._pending.add((clinic_id or current_clinic(), doctor_id, date_iso, time_str))
+        self._wakeup.set()
+
+    def accepted(self):
+        """Пользователь записался по предложению."""
+        self.stats["accepted"] += 1
+
+    def declined(self, slot):
+        """Пользователь отказался от предложения: слот сразу уходит следующему в очереди."""
+        self.stats["declined"] += 1
+        self.slot_freed(*slot)
+
+    def _sweep(self, slots):
+        for clinic_id in clinic_ids():
+            with use_clinic(clinic_id):
+                expired = expire_waitlist_offers()
+                self.stats["expired"] += len(expired)
+                slots.setdefault(clinic_id, []).extend(expired + find_waitlist_slots())
+
+    def _match(self, slots):
+        offers = []
+        for clinic_id, clinic_slots in slots.items():
+            if clinic_slots:
+                with use_clinic(clinic_id):
+                    offers += match_waitlist(clinic_slots, self.offer_minutes)
+        return offers
+
+    async def run(self, bot, send_offer):
+        """Фоновая задача. send_offer(bot, offer) — отправка одного предложения пользователю."""
+        logging.info("🔔 Лист ожидания запущен...")
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0, next_sweep - loop.time()))
+                await asyncio.sleep(self.batch_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            pending, self._pending = self._pending, set()
+            slots = {}
+            for clinic_id, *slot in pending:
+                slots.setdefault(clinic_id, []).append(tuple(slot))
+
+            try:
+                if loop.time() >= next_sweep:
+                    next_sweep = loop.time() + self.sweep_seconds
+                    await asyncio.to_thread(self._sweep, slots)
+                total = sum(map(len, slots.values()))
+                if not total:
+                    continue
+                self.stats["batches"] += 1
+                self.stats["max_batch"] = max(self.stats["max_batch"], total)
+                offers = await asyncio.to_thread(self._match, slots)
+            except Exception:
+                logging.exception("Ошибка сопоставления листа ожидания")
+                continue
+
+            for offer in offers:
+                try:
+                    await send_offer(bot, offer)
+                    self.stats["offers"] += 1
+                except Exception as e:
+                    # предложение истечёт само и слот уйдёт следующему
+                    self.stats["send_errors"] += 1
+                    logging.warning(f"Не удалось отправить предложение из листа ожидания #{offer[0]}: {e}")
+
+
+waitlist_matcher = WaitlistMatcher(
+    offer_minutes=WAITLIST_OFFER_MINUTES,
+    sweep_seconds=WAITLIST_SWEEP_SECONDS,
+    batch_delay=WAITLIST_BATCH_DELAY
+)
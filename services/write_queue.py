@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from itertools import groupby
+
+from config import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY_MS
+from db.db_utils import (
+    MAIN_CLINIC, current_clinic, use_clinic, run_write_batch, _add_user, _add_pet, _book_slot, _mark_notified
+)
+
+
+class WriteQueue:
+    """
+    Групповая фиксация записей: обработчики кладут операции в очередь, единственная
+    фоновая задача собирает их в пачку (до `max_batch` операций или `max_delay` секунд
+    с первой) и фиксирует одним COMMIT. Результат каждой операции — через её future.
+    Пока задача не запущена, операции выполняются сразу, каждая своей транзакцией.
+    Операция запоминает филиал вызывающего; пачка фиксируется отдельно в БД каждого филиала.
+    """
+
+    def __init__(self, max_batch=50, max_delay=0.005):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue()
+        self._running = False
+        self.stats = {"ops": 0, "batches": 0, "max_batch": 0, "failed_ops": 0, "failed_batches": 0}
+
+    async def submit(self, fn, *args, clinic_id=None):
+        """
+        Ставит fn(cur, *args) в очередь и ждёт результата; ошибка операции пробрасывается вызывающему.
+        clinic_id — БД, в которой выполнить операцию (по умолчанию — текущий филиал).
+        """
+        clinic_id = clinic_id or current_clinic()
+        if not self._running:
+            with use_clinic(clinic_id):
+                (result, error), = run_write_batch([(fn, args)])
+            if error:
+                raise error
+            return result
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((clinic_id, fn, args, future))
+        return await future
+
+    # Пользователи и питомцы — в ядре, т.е. в основной БД
+    async def add_user(self, telegram_id, phone=None, full_name=None):
+        return await self.submit(_add_user, telegram_id, phone, full_name, clinic_id=MAIN_CLINIC)
+
+    async def add_pet(self, user_id, name, species=None, age=None):
+        return await self.submit(_add_pet, user_id, name, species, age, clinic_id=MAIN_CLINIC)
+
+    async def book_slot(self, schedule_id, user_id, pet_id, service_id):
+        return await self.submit(_book_slot, schedule_id, user_id, pet_id, service_id)
+
+    async def mark_notified(self, appointment_id, kind):
+        return await self.submit(_mark_notified, appointment_id, kind)
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        """Фоновая задача — единственный писатель."""
+        logging.info("✍️ Очередь записи в БД запущена...")
+        self._running = True
+        try:
+            while True:
+                batch = await self._collect()
+                batch.sort(key=lambda op: op[0])
+                for clinic_id, ops in groupby(batch, key=lambda op: op[0]):
+                    await self._commit(clinic_id, list(ops))
+        finally:
+            self._running = False
+
+    async def _commit(self, clinic_id, batch):
+        """Одна пачка операций одного филиала — одна транзакция в его БД."""
+        self.stats["batches"] += 1
+        self.stats["ops"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        try:
+            with use_clinic(clinic_id):
+                results = await asyncio.to_thread(run_write_batch, [(fn, args) for _, fn, args, _ in batch])
+        except Exception as e:
+            # не удалось даже открыть или зафиксировать транзакцию — падает вся пачка
+            self.stats["failed_batches"] += 1
+            logging.exception("Ошибка пачки записей в БД")
+            results = [(None, e)] * len(batch)
+
+        for (_, _, _, future), (result, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error:
+                self.stats["failed_ops"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def log_stats(self):
+        batches = self.stats["batches"]
+        avg = self.stats["ops"] / batches if batches else 0.0
+        logging.info(f"✍️ Очередь записи: {self.stats}, в среднем {avg:.1f} операций на COMMIT")
+
+
+write_queue = WriteQueue(max_batch=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY_MS / 1000)
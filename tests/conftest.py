@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+# config.py требует токен; сеть в тестах не используется
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from db import db_init, db_utils  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Чистая БД с тестовыми данными во временном каталоге."""
+    path = tmp_path / "vet_clinic.db"
+    monkeypatch.setattr(db_init, "DB_PATH", path)
+    monkeypatch.setattr(db_utils, "DB_PATH", path)
+    monkeypatch.setattr(db_utils, "_replica", None)
+    db_init.init_db()
+    return path
+
+
+@pytest.fixture(params=["rows", "bitmask"])
+def storage(request, db, monkeypatch):
+    """БД из фикстуры db в каждом режиме хранения занятости."""
+    monkeypatch.setattr(db_utils, "SCHEDULE_STORAGE", request.param)
+    db_utils.migrate_schedule_to_bitmask()
+    return request.param
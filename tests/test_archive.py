@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from db import db_utils
+from tests.test_holds import _free_slot
+
+
+def _book(day, time_str, doctor_id=1):
+    user = db_utils.get_user_by_telegram_id(100000001)
+    pet = db_utils.get_user_pets(user.id)[0]
+    return db_utils.book_slot(db_utils.ensure_slot(doctor_id, day, time_str), user.id, pet.id, 1)
+
+
+def _rows(sql, *params):
+    with db_utils.connect() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def test_past_data_moves_to_archive_in_batches(storage, monkeypatch):
+    today = db_utils.clinic_today()
+    past_days = [d.isoformat() for d in (today - timedelta(days=i) for i in range(3, 20)) if d.weekday() < 5][:3]
+    past = [_book(day, time_str) for day in past_days for time_str in ("10:00", "11:00")]
+    cancelled = _book(*_free_slot())
+    db_utils.cancel_appointment(cancelled)
+
+    batches = []
+    archive_batch = db_utils._archive_batch
+
+    def counted_batch(*args):
+        batches.append(archive_batch(*args))
+        return batches[-1]
+
+    monkeypatch.setattr(db_utils, "_archive_batch", counted_batch)
+    assert db_utils.archive_past_data(keep_days=1, batch_size=4, pause=0) == (7, 6)
+
+    # записи: 4 + 3 (последняя неполная пачка — конец), слоты: 4 + 2
+    assert batches == [4, 3, 4, 2]
+    assert _rows("SELECT id FROM appointments") == []
+    assert sorted(_rows("SELECT id, status FROM appointments_archive")) == \
+        sorted([(a, "scheduled") for a in past] + [(cancelled, "cancelled")])
+    assert sorted(_rows("SELECT date, time, is_booked FROM schedule_archive")) == \
+        sorted((day, time_str, 1) for day in past_days for time_str in ("10:00", "11:00"))
+    # слот отменённой будущей записи — не прошедший, он остаётся в рабочей таблице
+    assert _rows("SELECT COUNT(*) FROM schedule") == [(1,)]
+    assert _rows("SELECT COUNT(*) FROM schedule_days WHERE date < ?", today.isoformat()) == [(0,)]
+    mask = db_utils._slot_bit("10:00") | db_utils._slot_bit("11:00")
+    assert _rows("SELECT date, booked_mask FROM schedule_days_archive ORDER BY date") == \
+        ([(day, mask) for day in sorted(past_days)] if storage == "bitmask" else [])
+
+    db_utils.compact_database()
+    assert _rows("PRAGMA freelist_count") == [(0,)]
@@ -0,0 +1,126 @@
+import pytest
+
+from db import db_utils
+from tests.test_holds import _free_slot
+
+
+def _client(telegram_id):
+    user = db_utils.get_user_by_telegram_id(telegram_id)
+    return user.id, db_utils.get_user_pets(user.id)[0].id
+
+
+def _book(telegram_id, day, time_str, doctor_id=1, service_id=1):
+    user_id, pet_id = _client(telegram_id)
+    schedule_id = db_utils.ensure_slot(doctor_id, day, time_str)
+    return db_utils.book_slot(schedule_id, user_id, pet_id, service_id)
+
+
+def _occupancy(day, time_str, doctor_id=1):
+    """(is_booked строки schedule, бит в маске дня, счётчик свободных слотов дня)"""
+    with db_utils.connect() as conn:
+        row = conn.execute(
+            "SELECT is_booked FROM schedule WHERE doctor_id=? AND date=? AND time=?", (doctor_id, day, time_str)
+        ).fetchone()
+        mask = conn.execute(
+            "SELECT booked_mask FROM schedule_days WHERE doctor_id=? AND date=?", (doctor_id, day)
+        ).fetchone()
+        free = conn.execute(
+            "SELECT free FROM free_slot_counts WHERE doctor_id=? AND date=?", (doctor_id, day)
+        ).fetchone()
+    return (
+        bool(row and row[0]),
+        bool(mask and mask[0] & db_utils._slot_bit(time_str)),
+        free[0] if free else None,
+    )
+
+
+def test_cancelled_slot_can_be_booked_again(storage):
+    day, time_str = _free_slot()
+    _, _, free = _occupancy(day, time_str)
+    appointment_id = _book(100000001, day, time_str)
+    assert _occupancy(day, time_str) == (True, storage == "bitmask", free - 1)
+
+    user_id, _ = _client(100000001)
+    freed = db_utils.cancel_appointment(appointment_id, user_id=user_id)
+
+    assert freed[2:] == (day, time_str)
+    assert _occupancy(day, time_str) == (False, False, free)
+    assert time_str in db_utils.get_available_slots_for_doctor_on_date(1, day)
+    assert db_utils.cancel_appointment(appointment_id) is None
+    # освобождённое время получает другой клиент
+    _book(100000002, day, time_str)
+    assert _occupancy(day, time_str) == (True, storage == "bitmask", free - 1)
+    assert db_utils.check_free_slot_counts(fix=False) == []
+
+
+def test_reconciler_frees_slot_left_booked_by_old_cancellation(storage):
+    day, time_str = _free_slot()
+    _, _, free = _occupancy(day, time_str)
+    appointment_id = _book(100000001, day, time_str)
+    # отмена старым кодом: статус сменился, а слот, бит и счётчик остались занятыми
+    with db_utils.connect() as conn:
+        conn.execute("UPDATE appointments SET status='cancelled' WHERE id=?", (appointment_id,))
+        conn.commit()
+    assert time_str not in db_utils.get_available_slots_for_doctor_on_date(1, day)
+
+    assert db_utils.reconcile_booked_slots() == 1
+
+    assert _occupancy(day, time_str) == (False, False, free)
+    assert time_str in db_utils.get_available_slots_for_doctor_on_date(1, day)
+    assert db_utils.reconcile_booked_slots() == 0
+    assert db_utils.check_free_slot_counts(fix=False) == []
+
+
+def test_deleting_pet_cancels_its_future_appointments(storage, monkeypatch):
+    published = []
+    monkeypatch.setattr(db_utils.bus, "publish", published.append)
+    day, time_str = _free_slot()
+    _, _, free = _occupancy(day, time_str)
+    appointment_id = _book(100000001, day, time_str)
+    user_id, pet_id = _client(100000001)
+
+    assert db_utils.remove_pet(pet_id, user_id)
+
+    assert _occupancy(day, time_str) == (False, False, free)
+    assert time_str in db_utils.get_available_slots_for_doctor_on_date(1, day)
+    with db_utils.connect() as conn:
+        status = conn.execute("SELECT status FROM appointments WHERE id=?", (appointment_id,)).fetchone()[0]
+    assert status == "cancelled"
+    assert [type(e).__name__ for e in published] == ["AppointmentBooked", "AppointmentCancelled", "PetDeleted"]
+    assert published[1].appointment_id == appointment_id
+    assert db_utils.check_free_slot_counts(fix=False) == []
+
+
+def test_deleting_someone_elses_pet_changes_nothing(db):
+    day, time_str = _free_slot()
+    appointment_id = _book(100000001, day, time_str)
+    _, pet_id = _client(100000001)
+    other_user_id, _ = _client(100000002)
+
+    assert not db_utils.remove_pet(pet_id, other_user_id)
+
+    user_id, _ = _client(100000001)
+    assert [a.id for a in db_utils.get_user_appointments(user_id)] == [appointment_id]
+
+
+def test_series_with_taken_visit_leaves_no_trace(storage, monkeypatch):
+    published = []
+    monkeypatch.setattr(db_utils.bus, "publish", published.append)
+    day, _ = _free_slot()
+    slots = db_utils.find_series_slots(1, day, interval_days=7, count=3, doctor_id=1)
+    # третий визит курса уже занял другой клиент
+    _book(100000002, slots[2].date, slots[2].time)
+    before = [_occupancy(slot.date, slot.time) for slot in slots]
+    published.clear()
+
+    user_id, pet_id = _client(100000001)
+    with pytest.raises(ValueError):
+        db_utils.book_series(user_id, pet_id, 1, slots)
+
+    assert [_occupancy(slot.date, slot.time) for slot in slots] == before
+    assert db_utils.get_user_appointments(user_id) == []
+    with db_utils.connect() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM schedule WHERE date IN (?, ?)", (slots[0].date, slots[1].date))
+        assert rows.fetchone()[0] == 0
+    assert published == []
+    assert db_utils.check_free_slot_counts(fix=False) == []
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import timedelta
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from benchmarks.fake_bot import FakeSession, callback_update
+from db import db_utils
+from handlers import booking
+from handlers.booking import BookingStates
+from handlers.callbacks import PetChoiceCallback, callback_routes
+from handlers.chat_lock import ChatLockMiddleware
+
+TELEGRAM_ID = 100000001  # пользователь из тестовых данных
+
+
+def _dispatcher(seen_states):
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(booking.router)
+    chat_lock = ChatLockMiddleware()
+    dp.callback_query.outer_middleware(chat_lock)
+
+    async def spy(handler, event, data):
+        # состояние, с которым апдейт пойдёт в обработчики (после ожидания очереди чата)
+        seen_states.append(data["raw_state"])
+        return await handler(event, data)
+
+    dp.callback_query.outer_middleware(spy)
+    dp.callback_query.outer_middleware(callback_routes)
+    return dp
+
+
+def _hold_slot(user_id):
+    today = db_utils.clinic_today()
+    for offset in range(1, 15):
+        day = (today + timedelta(days=offset)).isoformat()
+        slots = db_utils.get_available_slots_for_doctor_on_date(1, day)
+        if slots:
+            schedule_id, _ = db_utils.hold_slot(1, day, slots[0], user_id)
+            return schedule_id, day
+    raise AssertionError("нет свободных слотов")
+
+
+def test_double_tap_on_pet_books_once(db):
+    user = db_utils.get_user_by_telegram_id(TELEGRAM_ID)
+    pet = db_utils.get_user_pets(user.id)[0]
+    schedule_id, day = _hold_slot(user.id)
+    seen_states = []
+    dp = _dispatcher(seen_states)
+    bot = Bot("42:TEST", session=FakeSession(latency=0.01))
+
+    async def double_tap():
+        state = dp.fsm.get_context(bot, chat_id=TELEGRAM_ID, user_id=TELEGRAM_ID)
+        await state.set_state(BookingStates.pet)
+        await state.update_data(schedule_id=schedule_id, service_id=1, doctor_id=1, date=day)
+        data = PetChoiceCallback(pet_id=pet.id).pack()
+        await asyncio.gather(
+            dp.feed_update(bot, callback_update(TELEGRAM_ID, data)),
+            dp.feed_update(bot, callback_update(TELEGRAM_ID, data)),
+        )
+        return await state.get_state()
+
+    assert asyncio.run(double_tap()) is None
+
+    with db_utils.connect() as conn:
+        booked = conn.execute("SELECT COUNT(*) FROM appointments WHERE schedule_id=?", (schedule_id,)).fetchone()[0]
+    assert booked == 1
+    # второе нажатие ждало первое и увидело уже сброшенное состояние мастера
+    assert seen_states == [BookingStates.pet.state, None]
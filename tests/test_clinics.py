@@ -0,0 +1,52 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from db import db_init, db_utils
+from tests.test_holds import _free_slot
+
+
+@pytest.fixture
+def clinics(db, monkeypatch):
+    monkeypatch.setattr(db_utils, "CLINICS", {"main": "Центральный", "north": "Северный"})
+    db_init.init_db()
+    return db
+
+
+def _count(path, sql, *params):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def test_use_clinic_routes_writes_to_shard(clinics):
+    north = db_utils.shard_path("north")
+    user = db_utils.get_user_by_telegram_id(100000001)
+    pet = db_utils.get_user_pets(user.id)[0]
+
+    with db_utils.use_clinic("north"):
+        db_utils.add_doctor("Доктор Северова", "Терапевт")
+        day, time_str = _free_slot()
+        db_utils.book_slot(db_utils.ensure_slot(1, day, time_str), user.id, pet.id, 1)
+        # пользователи и питомцы по-прежнему читаются из ядра
+        assert db_utils.get_user_by_telegram_id(100000001) == user
+
+    assert north != clinics
+    assert _count(north, "SELECT COUNT(*) FROM doctors WHERE full_name='Доктор Северова'") == 1
+    assert _count(clinics, "SELECT COUNT(*) FROM doctors WHERE full_name='Доктор Северова'") == 0
+    assert _count(north, "SELECT COUNT(*) FROM appointments") == 1
+    assert _count(clinics, "SELECT COUNT(*) FROM appointments") == 0
+    assert db_utils.get_user_appointments(user.id) == []
+    with db_utils.use_clinic("north"):
+        assert [a.date for a in db_utils.get_user_appointments(user.id)] == [day]
+
+
+def test_test_data_is_seeded_once(clinics):
+    db_init.init_db()
+
+    for path in (clinics, db_utils.shard_path("north")):
+        assert _count(path, "SELECT COUNT(*) FROM doctors") == 3
+        assert _count(path, "SELECT COUNT(*) FROM services") == 12
+    assert _count(clinics, "SELECT COUNT(*) FROM users") == 5
+    assert _count(clinics, "SELECT COUNT(*) FROM pets") == 5
+    assert _count(db_utils.shard_path("north"), "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('users', 'pets')") == 0
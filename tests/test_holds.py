@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+import pytest
+
+from db import db_init, db_utils
+
+
+def _free_slot(doctor_id=1):
+    today = db_utils.clinic_today()
+    for offset in range(1, 15):
+        day = (today + timedelta(days=offset)).isoformat()
+        slots = db_utils.get_available_slots_for_doctor_on_date(doctor_id, day)
+        if slots:
+            return day, slots[0]
+    raise AssertionError("нет свободных слотов")
+
+
+def test_active_hold_survives_init_db(db):
+    day, time_str = _free_slot()
+    schedule_id, held_until = db_utils.hold_slot(1, day, time_str, user_id=1)
+
+    db_init.init_db()
+
+    assert db_utils.get_active_holds() == [(held_until, schedule_id)]
+    assert time_str not in db_utils.get_available_slots_for_doctor_on_date(1, day)
+    # второй клиент это время получить не может
+    with pytest.raises(ValueError):
+        db_utils.hold_slot(1, day, time_str, user_id=2)
+
+
+def test_expired_hold_is_cleaned_up_by_init_db(db):
+    day, time_str = _free_slot()
+    schedule_id, _ = db_utils.hold_slot(1, day, time_str, user_id=1, ttl_seconds=-1)
+
+    db_init.init_db()
+
+    assert db_utils.get_active_holds() == []
+    assert time_str in db_utils.get_available_slots_for_doctor_on_date(1, day)
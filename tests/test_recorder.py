@@ -0,0 +1,37 @@
+import shutil
+
+from handlers.recorder import Anonymizer, UpdateRecorder, read_log
+
+
+def test_read_log_tolerates_unclosed_gzip(tmp_path):
+    path = tmp_path / "updates.jsonl.gz"
+    recorder = UpdateRecorder(path, salt="test", flush_every=1)
+    for n in range(3):
+        recorder._write({"t": n, "ms": 1.0, "calls": [], "update": {"update_id": n}})
+    # копия файла без маркера конца gzip — как после остановки без close()
+    truncated = tmp_path / "truncated.jsonl.gz"
+    shutil.copy(path, truncated)
+    recorder.close()
+
+    assert [r["update"]["update_id"] for r in read_log(truncated)] == [0, 1, 2]
+    assert [r["update"]["update_id"] for r in read_log(path)] == [0, 1, 2]
+
+
+def test_read_log_skips_partial_last_line(tmp_path):
+    path = tmp_path / "updates.jsonl"
+    path.write_text('{"t":0,"ms":1,"calls":[],"update":{"update_id":1}}\n{"t":1,"ms"', encoding="utf-8")
+
+    assert [r["update"]["update_id"] for r in read_log(path)] == [1]
+
+
+def test_anonymizer_masks_phone_typed_as_text():
+    anonymizer = Anonymizer(salt="test")
+    scrubbed = anonymizer.scrub({
+        "text": "мой номер +7 916 123-45-67",
+        "contact": {"phone_number": "+79161234567", "vcard": "BEGIN:VCARD\nTEL:+79161234567\nEND:VCARD"},
+    })
+
+    assert scrubbed["text"] == "xxx xxxxx +1 111 111-11-11"
+    assert anonymizer.text("/start 42") == "/start 42"
+    assert scrubbed["contact"] == {"phone_number": anonymizer.phone("+79161234567")}
+    assert "1234567" not in str(scrubbed)
@@ -0,0 +1,73 @@
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+from db import db_utils
+
+
+@pytest.fixture
+def replica(db, monkeypatch):
+    # фоновое снятие снимка тесты запускают сами
+    monkeypatch.setattr(db_utils, "REPLICA_REFRESH_DELAY", 60)
+    db_utils.load_read_replica()
+    yield db
+    db_utils.close_read_replica()
+
+
+def _same_as_file(path):
+    db_utils._refresh_snapshot()
+    with closing(sqlite3.connect(path)) as disk, \
+            closing(sqlite3.connect(db_utils._replica_uri, uri=True)) as replica:
+        return list(disk.iterdump()) == list(replica.iterdump())
+
+
+def test_replica_matches_file_after_writes(replica):
+    user = db_utils.get_user_by_telegram_id(100000001)
+    pet = db_utils.get_user_pets(user.id)[0]
+    # CURRENT_TIMESTAMP по умолчанию: повтор SQL в реплике дал бы другое время
+    db_utils.add_to_waitlist(user.id, pet.id, service_id=1)
+
+    def failing(cur):
+        cur.execute("INSERT INTO doctors (full_name) VALUES ('Откатится')")
+        raise ValueError("отказ")
+
+    results = db_utils.run_write_batch([(failing, ()), (db_utils._add_user, (700000001, None, "Новый"))])
+
+    assert isinstance(results[0][1], ValueError)
+    assert db_utils.get_user_by_telegram_id(700000001).full_name == "Новый"
+    assert _same_as_file(replica)
+
+
+def test_nested_reads_share_the_snapshot(replica):
+    with db_utils.read_connect(core=True) as outer:
+        # вложенное чтение в том же потоке не ждёт внешнее
+        assert db_utils.get_services()
+        db_utils.add_user(700000002)
+        assert outer.execute("SELECT COUNT(*) FROM users WHERE telegram_id=700000002").fetchone() == (0,)
+    assert db_utils.get_user_by_telegram_id(700000002) is not None
+
+
+def test_write_makes_only_its_tables_stale(replica, monkeypatch):
+    stats = dict(db_utils.replica_stats)
+    db_utils.add_user(700000003)
+
+    # копия не снимается на пути чтения: изменённые users читаются из файла, services — из снимка
+    assert db_utils.get_user_by_telegram_id(700000003) is not None
+    assert db_utils.get_services()
+    assert db_utils.replica_stats["snapshots"] == stats["snapshots"]
+    assert db_utils.replica_stats["file_reads"] == stats["file_reads"] + 1
+    assert db_utils.replica_stats["reads"] == stats["reads"] + 1
+
+    monkeypatch.setattr(db_utils, "REPLICA_REFRESH_DELAY", 0.01)
+    db_utils.close_read_replica()
+    db_utils.load_read_replica()
+    db_utils.add_user(700000004)
+    deadline = time.monotonic() + 5
+    while db_utils._stale(("users",)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # фоновый поток снял новый снимок — чтение users вернулось в реплику
+    reads = db_utils.replica_stats["reads"]
+    assert db_utils.get_user_by_telegram_id(700000004) is not None
+    assert db_utils.replica_stats["reads"] == reads + 1
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import pytest
+
+from db import db_init, db_utils
+from tests.test_holds import _free_slot
+
+
+@pytest.mark.parametrize("start_time, end_time, slot_minutes", [
+    ("10:15", "12:00", 60),
+    ("10:00", "12:45", 30),
+    ("10:00", "12:00", 45),
+])
+def test_off_grid_working_hours_are_rejected(db, start_time, end_time, slot_minutes):
+    with pytest.raises(ValueError, match="не кратн"):
+        db_utils.set_working_hours(1, 5, start_time, end_time, slot_minutes)
+    with pytest.raises(ValueError, match="не кратн"):
+        db_utils.add_schedule_exception("2030-01-05", "2030-01-05", 1, "extra", start_time, end_time, slot_minutes)
+
+
+def test_slot_bits_do_not_collide():
+    assert db_utils._slot_bit("10:00") != db_utils._slot_bit("10:30")
+    with pytest.raises(ValueError):
+        db_utils._slot_bit("10:15")
+
+
+def test_free_counts_follow_every_change(storage):
+    user = db_utils.get_user_by_telegram_id(100000001)
+    pet_id = db_utils.get_user_pets(user.id)[0].id
+    day, time_str = _free_slot()
+    next_day = (db_utils.clinic_today() + timedelta(days=20)).isoformat()
+
+    kept = db_utils.book_slot(db_utils.ensure_slot(1, day, time_str), user.id, pet_id, 1)
+    cancelled = db_utils.book_slot(db_utils.ensure_slot(2, day, time_str), user.id, pet_id, 1)
+    db_utils.cancel_appointment(cancelled)
+    schedule_id, _ = db_utils.hold_slot(3, day, time_str, user.id)
+    db_utils.release_hold(schedule_id, user.id)
+    db_utils.hold_slot(3, day, time_str, user.id, ttl_seconds=-1)
+    db_utils.expire_holds(db_utils.get_active_holds())
+    db_utils.add_schedule_exception(day, day, 1, "off", "12:00", "14:00")
+    db_utils.add_schedule_exception(next_day, next_day, 2, "extra", "19:00", "21:00")
+    db_utils.add_schedule_exception(next_day, next_day, None, "off")
+    db_utils.set_working_hours(3, 5, "10:00", "12:00")
+    db_utils.cancel_appointment(kept)
+
+    assert db_utils.check_free_slot_counts(fix=False) == []
+
+
+def test_startup_fills_only_missing_counts(db):
+    assert db_utils.refresh_free_slot_counts(missing_only=True) == 0
+    day, _ = _free_slot()
+    with db_utils.connect() as conn:
+        conn.execute("DELETE FROM free_slot_counts WHERE doctor_id=1 AND date=?", (day,))
+        conn.commit()
+
+    assert db_utils.refresh_free_slot_counts(missing_only=True) == 1
+    db_init.init_db()
+    assert db_utils.check_free_slot_counts(fix=False) == []
@@ -0,0 +1,71 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.types import CallbackQuery
+
+from benchmarks.fake_bot import FakeSession
+from handlers import webhook_reply
+from handlers.calendar import SimpleCalendar, SimpleCalendarCallback
+from handlers.screen import screens, show_screen
+
+CHAT_ID = 200000001
+
+
+def _callback(bot):
+    return CallbackQuery.model_validate({
+        "id": "1",
+        "from": {"id": CHAT_ID, "is_bot": False, "first_name": "test"},
+        "chat_instance": "test",
+        "data": "menu",
+        "message": {
+            "message_id": 7,
+            "date": 1,
+            "chat": {"id": CHAT_ID, "type": "private"},
+            "from": {"id": 42, "is_bot": True, "first_name": "bot"},
+            "text": "…",
+        },
+    }, context={"bot": bot})
+
+
+def test_deferred_edit_is_not_remembered():
+    session = FakeSession()
+    callback = _callback(Bot("42:TEST", session=session))
+
+    async def show_twice():
+        # первая правка уходит телом ответа на вебхук, вторая — отдельным запросом
+        token = webhook_reply._reply_slot.set([])
+        try:
+            await show_screen(callback, "Меню")
+        finally:
+            webhook_reply._reply_slot.reset(token)
+        await show_screen(callback, "Меню")
+
+    asyncio.run(show_twice())
+
+    # повтор того же экрана не пропущен: об отложенной правке ничего не известно
+    assert [type(m).__name__ for m in session.calls] == ["EditMessageText"]
+    assert screens.get(CHAT_ID)[0] == 7
+
+
+def test_calendar_cancel_answers_and_edits_once():
+    session = FakeSession()
+    callback = _callback(Bot("42:TEST", session=session))
+    screens.forget(CHAT_ID)
+
+    async def cancel():
+        slot = []
+        token = webhook_reply._reply_slot.set(slot)
+        try:
+            result = await SimpleCalendar.process_selection(
+                callback, SimpleCalendarCallback(action="ignore", date_iso="cancel")
+            )
+        finally:
+            webhook_reply._reply_slot.reset(token)
+        return result, slot
+
+    result, slot = asyncio.run(cancel())
+
+    assert result == (True, None)
+    # ответ на нажатие — телом ответа на вебхук, правка экрана — обычным запросом
+    assert [type(m).__name__ for m in slot] == ["AnswerCallbackQuery"]
+    assert [type(m).__name__ for m in session.calls] == ["EditMessageText"]
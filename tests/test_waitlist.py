@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from db import db_utils
+from db.rows import Slot
+from tests.test_holds import _free_slot
+
+TELEGRAM_ID = 100000001  # пользователь из тестовых данных
+OTHER_TELEGRAM_ID = 100000002
+
+
+def _offer(offer_minutes):
+    user = db_utils.get_user_by_telegram_id(TELEGRAM_ID)
+    pet = db_utils.get_user_pets(user.id)[0]
+    day, time_str = _free_slot()
+    waitlist_id = db_utils.add_to_waitlist(user.id, pet.id, service_id=1, doctor_id=1)
+    [offer] = db_utils.match_waitlist([(1, day, time_str)], offer_minutes=offer_minutes)
+    assert offer[0] == waitlist_id
+    return user, offer
+
+
+def test_offer_expiry_is_unix_time(db):
+    _, offer = _offer(offer_minutes=15)
+
+    assert abs(offer[-1] - (time.time() + 15 * 60)) < 5
+    assert db_utils.expire_waitlist_offers() == []
+
+
+def test_expired_offer_returns_to_queue(db):
+    user, offer = _offer(offer_minutes=-1)
+    waitlist_id, *_, day, time_str, _ = offer
+
+    with pytest.raises(ValueError, match="истекло"):
+        db_utils.take_waitlist_offer(waitlist_id, user.id)
+    assert db_utils.expire_waitlist_offers() == [Slot(1, day, time_str)]
+    assert db_utils.get_active_holds() == []
+    # заявка снова ждёт и получает тот же слот
+    assert db_utils.match_waitlist([(1, day, time_str)])[0][0] == waitlist_id
+
+
+def test_offered_slot_is_held_for_the_offer(db):
+    user, offer = _offer(offer_minutes=15)
+    waitlist_id, *_, day, time_str, expires_ts = offer
+    other = db_utils.get_user_by_telegram_id(OTHER_TELEGRAM_ID)
+
+    # пока предложение действует, слот не достаётся никому другому
+    assert time_str not in db_utils.get_available_slots_for_doctor_on_date(1, day)
+    with pytest.raises(ValueError, match="другой клиент"):
+        db_utils.hold_slot(1, day, time_str, other.id)
+    [(held_until, schedule_id)] = db_utils.get_active_holds()
+    assert held_until == expires_ts
+    with pytest.raises(ValueError, match="занят"):
+        db_utils.book_slot(schedule_id, other.id, db_utils.get_user_pets(other.id)[0].id, 1)
+
+    assert db_utils.take_waitlist_offer(waitlist_id, user.id)
+    assert db_utils.get_active_holds() == []
+
+
+def test_declined_offer_releases_the_hold(db):
+    user, offer = _offer(offer_minutes=15)
+    waitlist_id, *_, day, time_str, _ = offer
+
+    assert db_utils.decline_waitlist_offer(waitlist_id, user.id) == Slot(1, day, time_str)
+    assert db_utils.get_active_holds() == []
+    assert time_str in db_utils.get_available_slots_for_doctor_on_date(1, day)
@@ -0,0 +1,42 @@
+import asyncio
+
+from db import db_utils
+from services.write_queue import WriteQueue
+
+
+def _pet_then_fail(cur, user_id):
+    db_utils._add_pet(cur, user_id, "Откатится")
+    raise ValueError("отказ")
+
+
+def test_failed_op_rolls_back_only_itself(db, monkeypatch):
+    published = []
+    monkeypatch.setattr(db_utils.bus, "publish", published.append)
+    user_id = db_utils.get_user_by_telegram_id(100000001).id
+
+    async def batch():
+        queue = WriteQueue(max_batch=10, max_delay=0.05)
+        worker = asyncio.create_task(queue.run())
+        await asyncio.sleep(0)
+        try:
+            results = await asyncio.gather(
+                queue.add_user(700000001, None, "Первый"),
+                queue.submit(_pet_then_fail, user_id),
+                queue.add_pet(user_id, "Третий"),
+                return_exceptions=True,
+            )
+        finally:
+            worker.cancel()
+        return queue, results
+
+    queue, (new_user_id, error, pet_id) = asyncio.run(batch())
+
+    assert queue.stats["batches"] == 1 and queue.stats["failed_ops"] == 1
+    assert isinstance(error, ValueError)
+    assert db_utils.get_user_by_telegram_id(700000001).id == new_user_id
+    # питомец из откатившейся операции не сохранился, следующий за ней — сохранился
+    pets = db_utils.get_user_pets(user_id)
+    assert [(p.id, p.name) for p in pets[1:]] == [(pet_id, "Третий")]
+    # событие откатившейся операции не публикуется
+    assert [type(e).__name__ for e in published] == ["PetAdded"]
+    assert published[0].pet_id == pet_id